@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, Response, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
@@ -19,7 +19,16 @@ import tempfile
 logger = logging.getLogger(__name__)
 
 from ..models.database import init_db, get_db
-from ..core.task_engine import TaskEngine, Task, TaskType, get_task_engine
+from ..core.task_engine import TaskEngine, Task, TaskType, TaskStatus, get_task_engine
+from ..core.stage_pools import get_stage_pools, get_pipeline_depth
+from ..core.library_index import get_library_index
+from ..core.tree_stats import get_tree_stats_service
+from ..core.dlsite_client import get_dlsite_client
+from ..core.linkage_store import get_linkage_store
+from ..core.memory_cache import get_cache_stats as get_memory_cache_stats, clear_all_caches
+from ..core.event_bus import get_event_bus
+from ..core import log_reader
+from ..core.log_reader import LogFilter
 from ..core.watcher import get_watcher
 from ..core.password_cleanup import get_cleanup_service
 from ..core.processed_archive_cleanup import get_processed_archive_cleanup_service
@@ -51,6 +60,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Task-Revision", "X-Next-Cursor"],
 )
 
 # 启动事件
@@ -60,9 +70,18 @@ async def startup_event():
     # 初始化数据库
     init_db()
 
+    # 事件推送：任务状态和进度变化发布到事件总线
+    get_event_bus().bind_loop(asyncio.get_running_loop())
+
     # 启动任务引擎
     engine = get_task_engine()
+    engine.add_progress_callback(_publish_task_event)
     engine.start()
+    global _task_event_sweeper
+    _task_event_sweeper = asyncio.create_task(_sweep_task_events())
+
+    # 加载库存索引，后台扫描库存目录并监视变化
+    get_library_index().start()
 
     # 如果配置了自动启动监视器，则启动
     config = get_config()
@@ -90,6 +109,8 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭时执行"""
     # 停止任务引擎
+    if _task_event_sweeper:
+        _task_event_sweeper.cancel()
     engine = get_task_engine()
     engine.stop()
 
@@ -97,6 +118,12 @@ async def shutdown_event():
     watcher = get_watcher()
     watcher.stop()
 
+    # 停止库存目录监视
+    get_library_index().stop()
+
+    # 关闭 DLsite 共享连接
+    await get_dlsite_client().close()
+
     # 停止密码库智能清理服务
     cleanup_service = get_cleanup_service()
     await cleanup_service.stop()
@@ -105,6 +132,28 @@ async def shutdown_event():
     archive_cleanup_service = get_processed_archive_cleanup_service()
     await archive_cleanup_service.stop()
 
+def _publish_task_event(task: Task):
+    """任务状态或进度变化时推送（同一任务按事件总线的间隔节流）"""
+    get_event_bus().publish('task', _task_response(task).model_dump(), key=f"task:{task.id}")
+
+_task_event_sweeper: Optional[asyncio.Task] = None
+
+async def _sweep_task_events():
+    """兜底推送：直接修改任务字段（未经过任务状态方法）的变化，按版本号每秒补发一次，无订阅者时不检查"""
+    engine = get_task_engine()
+    bus = get_event_bus()
+    last_revision = engine.sync_revision()
+    while True:
+        await asyncio.sleep(1)
+        if not bus.subscribers:
+            continue
+        try:
+            for task in engine.get_changed_tasks(last_revision):
+                _publish_task_event(task)
+            last_revision = engine.revision
+        except Exception as e:
+            logger.error(f"任务事件推送失败: {e}")
+
 # Pydantic模型
 class TaskCreate(BaseModel):
     source_path: str
@@ -234,10 +283,7 @@ async def _scan_and_create_tasks():
         input_path,
         auto_classify=config.watcher.auto_classify,
         is_processed=lambda path: (
-            path in watcher.pending_files or
-            path in watcher._processed_files or
-            any(t.source_path == path and t.status.value in ["pending", "processing"]
-                for t in get_task_engine().get_all_tasks())
+            watcher._is_file_processed(path) or get_task_engine().has_active_task(path)
         ),
         mark_processed=watcher._mark_file_processed
     )
@@ -250,43 +296,7 @@ async def _scan_and_create_tasks():
         "task_ids": created_task_ids
     }
 
-@app.get("/api/tasks", response_model=List[TaskResponse])
-async def get_tasks(status: Optional[str] = None):
-    """获取任务列表"""
-    engine = get_task_engine()
-    
-    if status == "pending":
-        tasks = engine.get_pending_tasks()
-    elif status == "processing":
-        tasks = engine.get_processing_tasks()
-    elif status == "completed":
-        tasks = engine.get_completed_tasks()
-    else:
-        tasks = engine.get_all_tasks()
-    
-    return [
-        TaskResponse(
-            id=task.id,
-            type=task.type.value,
-            status=task.status.value,
-            source_path=task.source_path,
-            output_path=task.output_path,
-            progress=task.progress,
-            current_step=task.current_step,
-            error_message=task.error_message
-        )
-        for task in tasks
-    ]
-
-@app.get("/api/tasks/{task_id}", response_model=TaskResponse)
-async def get_task(task_id: str):
-    """获取单个任务"""
-    engine = get_task_engine()
-    task = engine.get_task(task_id)
-    
-    if not task:
-        raise HTTPException(status_code=404, detail="任务未找到")
-    
+def _task_response(task: Task) -> TaskResponse:
     return TaskResponse(
         id=task.id,
         type=task.type.value,
@@ -299,6 +309,73 @@ async def get_task(task_id: str):
         rjcode=task.rjcode
     )
 
+def _parse_task_cursor(cursor: str):
+    """分页游标格式: <created_at ISO 时间>_<任务ID>"""
+    try:
+        created_at, task_id = cursor.split('_', 1)
+        return datetime.fromisoformat(created_at), task_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的分页游标: {cursor}")
+
+@app.get("/api/tasks", response_model=List[TaskResponse])
+async def get_tasks(
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    rjcode: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    since: Optional[int] = None
+):
+    """获取任务列表（按创建时间倒序）
+
+    - status: 按状态过滤，completed 包含失败的任务
+    - rjcode: 按 RJ 号过滤
+    - cursor / limit: 分页，下一页游标在响应头 X-Next-Cursor 中；不传 limit 时返回全部匹配的任务
+    - since: 只返回版本号之后有变化的任务（内存中的任务），当前版本号在响应头 X-Task-Revision 中
+    - 支持 If-None-Match，任务没有变化时返回 304
+    """
+    engine = get_task_engine()
+    revision = engine.sync_revision()
+    etag = f'W/"tasks-{revision}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Task-Revision': str(revision)}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if status == "completed":
+        statuses = [TaskStatus.COMPLETED.value, TaskStatus.FAILED.value]
+    elif status:
+        statuses = [status]
+    else:
+        statuses = None
+
+    if since is not None:
+        tasks = [
+            t for t in engine.get_changed_tasks(since)
+            if (not statuses or t.status.value in statuses)
+            and (not rjcode or (t.rjcode or '').upper() == rjcode.upper())
+        ]
+    else:
+        page_cursor = _parse_task_cursor(cursor) if cursor else None
+        tasks, has_more = await engine.query_tasks_async(statuses, rjcode, page_cursor, limit)
+        if has_more and tasks:
+            last = tasks[-1]
+            response.headers['X-Next-Cursor'] = f"{last.created_at.isoformat()}_{last.id}"
+
+    return [_task_response(task) for task in tasks]
+
+@app.get("/api/tasks/{task_id}", response_model=TaskResponse)
+async def get_task(task_id: str):
+    """获取单个任务（包括已移出内存的历史任务）"""
+    engine = get_task_engine()
+    task = engine.load_task(task_id)
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    
+    return _task_response(task)
+
 @app.post("/api/tasks/{task_id}/pause")
 async def pause_task(task_id: str):
     """暂停任务"""
@@ -432,6 +509,7 @@ async def update_configuration(request: Request):
         else:
             logger.info("[ASMR] 未接收到 ASMR 同步配置")
 
+        previous_library_path = get_config().storage.library_path
         result = save_config(config_data)
         logger.info(f"配置已保存，分类规则数: {len(config_data.get('classification', []))}")
 
@@ -440,6 +518,16 @@ async def update_configuration(request: Request):
         current_config = get_config()
         logger.info(f"当前配置中的分类规则: {[r.dict() for r in current_config.classification]}")
 
+        # 如果处理配置变更，调整任务引擎并发数和各阶段并发上限
+        if 'processing' in config_data:
+            get_task_engine().set_max_concurrent(get_pipeline_depth(current_config.processing))
+            get_stage_pools().apply_config()
+
+        # 如果库存路径变更，重新扫描库存索引
+        if current_config.storage.library_path != previous_library_path:
+            logger.info("库存路径已变更，重建库存索引...")
+            get_library_index().restart()
+
         # 如果密码清理配置变更，重启清理服务
         if 'password_cleanup' in config_data:
             logger.info("密码清理配置已变更，重启清理服务...")
@@ -476,13 +564,85 @@ async def stop_watcher():
 @app.get("/api/watcher/status")
 async def get_watcher_status():
     """获取监视器状态"""
-    watcher = get_watcher()
+    return get_watcher().get_status()
+
+@app.get("/api/events")
+async def stream_events(request: Request, since: Optional[int] = None):
+    """服务端事件推送（SSE）
+
+    事件类型: task（任务状态/进度）、conflict（问题作品变化）、watcher（监视器状态）、
+    reset（断线太久，缺失的事件已不在缓冲区中，需要重新拉取完整状态）。
+    每个事件的 id 为 "<启动标识>-<序号>"，重连时通过 since 参数（序号）或 Last-Event-ID 请求头从断点继续；
+    后端重启过（启动标识不同）时先发送 reset。
+    """
+    bus = get_event_bus()
+    last_event_id = request.headers.get('last-event-id')
+    if since is None and last_event_id:
+        since = bus.parse_event_id(last_event_id)
+
+    async def generate_events():
+        # 首条消息告知当前序号，客户端据此判断之后的事件是否连续
+        start = bus.seq if since is None or since < 0 else since
+        yield f"retry: 3000\nid: {bus.event_id(start)}\nevent: hello\ndata: {{}}\n\n"
+        async for event in bus.subscribe(since):
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            yield f"id: {bus.event_id(event['seq'])}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.get("/api/engine/status")
+async def get_engine_status():
+    """获取任务引擎状态（队列深度、工作协程利用率、DLsite 请求统计、事件推送统计）"""
+    engine = get_task_engine()
+    return {**engine.get_stats(), 'dlsite': get_dlsite_client().get_stats(), 'events': get_event_bus().get_stats()}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """获取进程内缓存（命中/未命中/淘汰计数）和作品关联图的统计"""
     return {
-        "is_running": watcher.is_running,
-        "watch_path": get_config().storage.input_path,
-        "pending_files": list(watcher.pending_files)
+        "caches": get_memory_cache_stats(),
+        "linkage": get_linkage_store().get_stats()
     }
 
+@app.post("/api/cache/clear")
+async def clear_caches():
+    """清空所有进程内缓存（不影响持久化的关联图）"""
+    clear_all_caches()
+    return {"message": "缓存已清空"}
+
+@app.get("/api/library/index")
+async def get_library_index_status():
+    """获取库存索引状态"""
+    return get_library_index().get_status()
+
+@app.post("/api/library/index/rebuild")
+async def rebuild_library_index():
+    """重新扫描库存目录，重建库存索引"""
+    try:
+        result = await asyncio.to_thread(get_library_index().rebuild)
+        return {"message": f"库存索引已重建，共 {result['total']} 个作品", **result}
+    except Exception as e:
+        logger.error(f"重建库存索引失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"重建库存索引失败: {str(e)}")
+
+@app.post("/api/library/index/verify")
+async def verify_library_index():
+    """校验库存索引与磁盘是否一致（不修改索引）"""
+    try:
+        return await asyncio.to_thread(get_library_index().verify)
+    except Exception as e:
+        logger.error(f"校验库存索引失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"校验库存索引失败: {str(e)}")
+
 @app.post("/api/scan")
 async def scan_input_directory():
     """手动扫描输入目录"""
@@ -835,25 +995,56 @@ async def import_passwords_from_text(request: Request):
     finally:
         db.close()
 
+def _log_filter(level: Optional[str], rjcode: Optional[str]) -> Optional[LogFilter]:
+    if not level and not rjcode:
+        return None
+    return LogFilter(level.split(',') if level else None, rjcode)
+
 @app.get("/api/logs")
-async def get_logs(lines: int = 100):
-    """获取日志文件内容"""
-    import os
-    log_dir = os.environ.get('DATA_PATH', './data')
-    log_file = os.path.join(log_dir, 'app.log')
-    
-    if not os.path.exists(log_file):
-        return {"logs": []}
-    
+async def get_logs(lines: int = Query(100, ge=0, le=20000), level: Optional[str] = None, rjcode: Optional[str] = None):
+    """获取最后 N 行日志
+
+    level: 逗号分隔的日志级别（如 INFO,WARNING,ERROR）；rjcode: 只返回包含该 RJ 号的日志。
+    返回的 offset 用于 /api/logs/stream 从此处继续。
+    """
     try:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            all_lines = f.readlines()
-            # 返回最后N行
-            recent_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
-            return {"logs": [line.strip() for line in recent_lines if line.strip()]}
+        logs, offset = await asyncio.to_thread(log_reader.tail, log_reader.get_log_file(), lines, _log_filter(level, rjcode))
+        return {"logs": logs, "offset": offset}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取日志失败: {str(e)}")
 
+@app.get("/api/logs/stream")
+async def stream_logs(request: Request, offset: Optional[int] = None, level: Optional[str] = None, rjcode: Optional[str] = None):
+    """跟踪日志（SSE），推送 offset 之后新写入的行
+
+    每条消息 data 为 {"lines": [...]}，id 为读取后的文件位置，重连时通过 Last-Event-ID 继续。
+    不指定 offset 时从当前文件末尾开始。
+    """
+    log_file = log_reader.get_log_file()
+    # 断线重连时 EventSource 仍使用原来的 URL，以 Last-Event-ID 为准
+    last_event_id = request.headers.get('last-event-id')
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    if offset is None:
+        offset = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+
+    async def generate_lines():
+        yield f"retry: 3000\nid: {offset}\nevent: hello\ndata: {{}}\n\n"
+        async for lines, position in log_reader.follow(log_file, offset, _log_filter(level, rjcode)):
+            if not lines:
+                yield ": ping\n\n"
+                continue
+            yield f"id: {position}\ndata: {json.dumps({'lines': lines}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate_lines(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @app.get("/api/conflicts")
 async def get_conflicts():
     """获取问题作品列表"""
@@ -903,7 +1094,7 @@ async def resolve_conflict(conflict_id: str, action: dict):
         
         # 检查new_path是否是压缩包（预检阶段的冲突）
         from ..core.watcher import ArchiveHandler
-        temp_handler = ArchiveHandler(lambda x: None, lambda: set(), lambda: False, lambda x: None)
+        temp_handler = ArchiveHandler(lambda x: None, lambda x: False, lambda: False, lambda x: None)
         is_archive = temp_handler._is_archive(conflict.new_path)
         
         if action_type == "KEEP_NEW":
@@ -958,7 +1149,7 @@ async def resolve_conflict(conflict_id: str, action: dict):
                                 auto_classify=True,
                                 skip_archive=skip_archive_bool
                             )
-                            engine.tasks[task.id] = task
+                            engine.register_task(task)
                             logger.info(f"创建新任务处理: {task.id}")
                 else:
                     # 没有正在处理的同RJ任务时，使用原有的逻辑
@@ -995,7 +1186,7 @@ async def resolve_conflict(conflict_id: str, action: dict):
                                     auto_classify=True,
                                     skip_archive=skip_archive_bool
                                 )
-                                engine.tasks[task.id] = task
+                                engine.register_task(task)
                                 logger.info(f"创建新任务处理: {task.id}")
                         else:
                             # 创建新任务
@@ -1005,7 +1196,7 @@ async def resolve_conflict(conflict_id: str, action: dict):
                                 auto_classify=True,
                                 skip_archive=skip_archive_bool
                             )
-                            engine.tasks[task.id] = task
+                            engine.register_task(task)
                             logger.info(f"创建新任务处理: {task.id}")
                 
                 extract_service = ExtractService()
@@ -1199,6 +1390,7 @@ async def resolve_conflict(conflict_id: str, action: dict):
             )
         
         db.commit()
+        get_event_bus().publish('conflict', {'action': 'resolved', 'id': conflict_id})
         return {"message": "处理成功"}
         
     except Exception as e:
@@ -1729,11 +1921,7 @@ async def delete_library_file(request: Request):
             import shutil
             if os.path.isdir(file_path):
                 # 计算文件夹大小
-                total_size = 0
-                for dirpath, dirnames, filenames in os.walk(file_path):
-                    for f in filenames:
-                        fp = os.path.join(dirpath, f)
-                        total_size += os.path.getsize(fp)
+                total_size = get_tree_stats_service().get_folder_size(file_path)
                 return {
                     "need_confirm": True,
                     "type": "folder",
@@ -2068,6 +2256,17 @@ async def get_existing_folders():
         logger.error(f"获取已存在文件夹列表失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取失败: {str(e)}")
 
+async def _prefetch_dlsite_products(rjcodes: List[str]):
+    """按批量请求大小分批预取作品数据，请求速率由 DLsite 客户端的令牌桶控制"""
+    from ..core.dlsite_service import get_dlsite_service
+    dlsite_service = get_dlsite_service()
+    chunk = max(1, get_config().metadata.batch_size)
+    try:
+        for start in range(0, len(rjcodes), chunk):
+            await dlsite_service.prefetch(rjcodes[start:start + chunk])
+    except Exception as e:
+        logger.warning(f"预取作品数据失败: {e}")
+
 @app.post("/api/existing-folders/scan")
 async def scan_existing_folders(check_duplicates: bool = True, force_refresh: bool = False):
     """扫描已存在文件夹目录，先快速列出所有文件夹，再后台查重
@@ -2130,7 +2329,7 @@ async def scan_existing_folders(check_duplicates: bool = True, force_refresh: bo
                     "progress": f"{index + 1}/{len(items)}"
                 }) + "\n"
             
-            # 第二步：后台逐个查重（如果有RJ号且需要检查）
+            # 第二步：后台并发查重（如果有RJ号且需要检查）
             if check_duplicates:
                 conflict_count = 0
                 
@@ -2139,31 +2338,54 @@ async def scan_existing_folders(check_duplicates: bool = True, force_refresh: bo
                     "message": f"开始查重检查，共 {len(folders)} 个文件夹"
                 }) + "\n"
                 
-                # 获取数据库会话
-                from ..models.database import get_db
+                from ..models.database import get_db, ExistingFolderCache
+                from ..core.duplicate_service import get_duplicate_service
+                duplicate_service = get_duplicate_service()
+                batch = duplicate_service.batch_check(
+                    check_linked_works=True,
+                    cue_languages=['CHI_HANS', 'CHI_HANT', 'ENG']
+                )
                 db = next(get_db())
+                prefetch_task = None
+                tasks = []
+                
+                async def check_folder(index: int, folder_info: dict):
+                    """查重并统计文件夹大小，返回 (index, folder_info, duplicate_info, stats, error)"""
+                    try:
+                        check_result = await batch.check(folder_info["rjcode"])
+                        duplicate_info = None
+                        if check_result.is_duplicate:
+                            duplicate_info = {
+                                "is_duplicate": True,
+                                "conflict_type": check_result.conflict_type,
+                                "direct_duplicate": check_result.direct_duplicate,
+                                "linked_works_found": check_result.linked_works_found,
+                                "related_rjcodes": check_result.related_rjcodes,
+                                "analysis_info": check_result.analysis_info
+                            }
+                            # 获取推荐的解决选项
+                            duplicate_info["resolution_options"] = await duplicate_service.get_conflict_resolution_options(check_result)
+                        
+                        # 计算文件夹大小（在线程池中一次遍历，未变化的子目录复用缓存）
+                        stats = await asyncio.to_thread(get_tree_stats_service().get_stats, folder_info["path"])
+                        return index, folder_info, duplicate_info, stats, None
+                    except Exception as e:
+                        return index, folder_info, None, None, e
                 
                 try:
+                    caches = {}
+                    try:
+                        caches = {cache.folder_path: cache for cache in db.query(ExistingFolderCache).all()}
+                    except Exception as e:
+                        logger.warning(f"查询缓存失败: {e}")
+                    
+                    to_check = []
                     for index, folder_info in enumerate(folders):
-                        item_path = folder_info["path"]
-                        item = folder_info["name"]
-                        rjcode = folder_info["rjcode"]
-                        
-                        if not rjcode:
+                        if not folder_info["rjcode"]:
                             continue
                         
-                        # 检查缓存
-                        cache = None
-                        if not force_refresh:
-                            try:
-                                from ..models.database import ExistingFolderCache
-                                cache = db.query(ExistingFolderCache).filter(
-                                    ExistingFolderCache.folder_path == item_path
-                                ).first()
-                            except Exception as e:
-                                logger.warning(f"查询缓存失败: {e}")
-                        
                         # 如果有缓存且不需要刷新，直接使用缓存
+                        cache = caches.get(folder_info["path"])
                         if cache and not force_refresh and not cache.needs_refresh:
                             folder_info["duplicate_info"] = cache.duplicate_info
                             folder_info["file_count"] = cache.file_count
@@ -2172,7 +2394,6 @@ async def scan_existing_folders(check_duplicates: bool = True, force_refresh: bo
                             if cache.duplicate_info:
                                 conflict_count += 1
                             
-                            # 发送更新
                             yield json.dumps({
                                 "type": "folder_update",
                                 "index": index,
@@ -2180,98 +2401,76 @@ async def scan_existing_folders(check_duplicates: bool = True, force_refresh: bo
                                 "from_cache": True
                             }) + "\n"
                             continue
+                        to_check.append((index, folder_info))
+                    
+                    # 后台分批预取需要查询的作品数据，查重时合并到预取请求或直接命中缓存
+                    pending_rjcodes = list(dict.fromkeys(f["rjcode"] for _, f in to_check))
+                    if pending_rjcodes:
+                        prefetch_task = asyncio.create_task(_prefetch_dlsite_products(pending_rjcodes))
+                    
+                    # 并发查重，按完成顺序发送结果
+                    tasks = [asyncio.create_task(check_folder(index, folder_info)) for index, folder_info in to_check]
+                    for next_done in asyncio.as_completed(tasks):
+                        index, folder_info, duplicate_info, stats, error = await next_done
+                        item_path = folder_info["path"]
+                        rjcode = folder_info["rjcode"]
                         
-                        # 没有缓存，执行API查询
-                        try:
-                            from ..core.duplicate_service import get_duplicate_service
-                            duplicate_service = get_duplicate_service()
-                            
-                            # 添加延时避免429
-                            if index > 0 and index % 5 == 0:
-                                await asyncio.sleep(1)
-                            
-                            check_result = await duplicate_service.check_duplicate_enhanced(
-                                rjcode, 
-                                check_linked_works=True,
-                                cue_languages=['CHI_HANS', 'CHI_HANT', 'ENG']
-                            )
-                            
-                            if check_result.is_duplicate:
-                                folder_info["duplicate_info"] = {
-                                    "is_duplicate": True,
-                                    "conflict_type": check_result.conflict_type,
-                                    "direct_duplicate": check_result.direct_duplicate,
-                                    "linked_works_found": check_result.linked_works_found,
-                                    "related_rjcodes": check_result.related_rjcodes,
-                                    "analysis_info": check_result.analysis_info
-                                }
-                                
-                                # 获取推荐的解决选项
-                                resolution_options = await duplicate_service.get_conflict_resolution_options(check_result)
-                                folder_info["duplicate_info"]["resolution_options"] = resolution_options
-                                conflict_count += 1
-                            
-                            folder_info["status"] = "checked"
-                            
-                            # 计算文件夹大小
-                            folder_size = 0
-                            file_count = 0
-                            try:
-                                for root, dirs, files in os.walk(item_path):
-                                    file_count += len(files)
-                                    for file in files:
-                                        file_path = os.path.join(root, file)
-                                        if os.path.isfile(file_path):
-                                            folder_size += os.path.getsize(file_path)
-                            except:
-                                pass
-                            
-                            folder_info["file_count"] = file_count
-                            folder_info["folder_size"] = folder_size
-                            
-                            # 保存到缓存
-                            try:
-                                from ..models.database import ExistingFolderCache
-                                if cache:
-                                    cache.duplicate_info = folder_info.get("duplicate_info")
-                                    cache.file_count = file_count
-                                    cache.folder_size = folder_size
-                                    cache.updated_at = datetime.utcnow()
-                                    cache.needs_refresh = False
-                                else:
-                                    cache = ExistingFolderCache(
-                                        folder_path=item_path,
-                                        folder_name=item,
-                                        rjcode=rjcode,
-                                        duplicate_info=folder_info.get("duplicate_info"),
-                                        file_count=file_count,
-                                        folder_size=folder_size
-                                    )
-                                    db.add(cache)
-                                db.commit()
-                            except Exception as e:
-                                logger.warning(f"保存缓存失败: {e}")
-                                db.rollback()
-                            
-                            # 发送更新
-                            yield json.dumps({
-                                "type": "folder_update",
-                                "index": index,
-                                "folder": folder_info,
-                                "from_cache": False
-                            }) + "\n"
-                            
-                        except Exception as e:
-                            logger.warning(f"查重检查失败 {rjcode}: {e}")
+                        if error is not None:
+                            logger.warning(f"查重检查失败 {rjcode}: {error}")
                             folder_info["status"] = "error"
                             yield json.dumps({
                                 "type": "folder_update",
                                 "index": index,
                                 "folder": folder_info,
-                                "error": str(e)
+                                "error": str(error)
                             }) + "\n"
+                            continue
+                        
+                        if duplicate_info:
+                            folder_info["duplicate_info"] = duplicate_info
+                            conflict_count += 1
+                        folder_info["status"] = "checked"
+                        folder_info["file_count"] = stats.file_count
+                        folder_info["folder_size"] = stats.size
+                        
+                        # 保存到缓存
+                        try:
+                            cache = caches.get(item_path)
+                            if cache:
+                                cache.duplicate_info = duplicate_info
+                                cache.file_count = stats.file_count
+                                cache.folder_size = stats.size
+                                cache.updated_at = datetime.utcnow()
+                                # 文件夹仍在变化（如复制中）时统计结果不可靠，下次扫描重新统计
+                                cache.needs_refresh = not stats.settled
+                            else:
+                                db.add(ExistingFolderCache(
+                                    folder_path=item_path,
+                                    folder_name=folder_info["name"],
+                                    rjcode=rjcode,
+                                    duplicate_info=duplicate_info,
+                                    file_count=stats.file_count,
+                                    folder_size=stats.size,
+                                    needs_refresh=not stats.settled
+                                ))
+                            db.commit()
+                        except Exception as e:
+                            logger.warning(f"保存缓存失败: {e}")
+                            db.rollback()
+                        
+                        yield json.dumps({
+                            "type": "folder_update",
+                            "index": index,
+                            "folder": folder_info,
+                            "from_cache": False
+                        }) + "\n"
                 
                 finally:
+                    for task in tasks:
+                        task.cancel()
+                    batch.cancel()
+                    if prefetch_task is not None:
+                        prefetch_task.cancel()
                     db.close()
                 
                 # 发送完成消息
@@ -2366,29 +2565,24 @@ async def check_existing_folders_duplicates(request: Request):
         
         from ..core.duplicate_service import get_duplicate_service
         duplicate_service = get_duplicate_service()
+        batch = duplicate_service.batch_check(check_linked_works=check_linked, cue_languages=cue_languages)
         
-        results = []
-        for folder_path in folder_paths:
+        async def check_folder(folder_path: str) -> dict:
             # 提取RJ号
             folder_name = os.path.basename(folder_path)
             rj_match = re.search(r'[RVB]J(\d{6}|\d{8})(?!\d)', folder_name, re.IGNORECASE)
             rjcode = rj_match.group(0).upper() if rj_match else None
             
             if not rjcode:
-                results.append({
+                return {
                     "folder_path": folder_path,
                     "folder_name": folder_name,
                     "rjcode": None,
                     "error": "无法提取RJ号"
-                })
-                continue
+                }
             
             try:
-                check_result = await duplicate_service.check_duplicate_enhanced(
-                    rjcode,
-                    check_linked_works=check_linked,
-                    cue_languages=cue_languages
-                )
+                check_result = await batch.check(rjcode)
                 
                 result = {
                     "folder_path": folder_path,
@@ -2410,16 +2604,22 @@ async def check_existing_folders_duplicates(request: Request):
                     resolution_options = await duplicate_service.get_conflict_resolution_options(check_result)
                     result["resolution_options"] = resolution_options
                 
-                results.append(result)
+                return result
                 
             except Exception as e:
                 logger.error(f"查重检查失败 {rjcode}: {e}")
-                results.append({
+                return {
                     "folder_path": folder_path,
                     "folder_name": folder_name,
                     "rjcode": rjcode,
                     "error": str(e)
-                })
+                }
+        
+        # 并发检查（同一 RJ 号、同一关联分量只查询一次），结果保持请求顺序
+        try:
+            results = await asyncio.gather(*(check_folder(path) for path in folder_paths))
+        finally:
+            batch.cancel()
         
         # 统计
         duplicate_count = sum(1 for r in results if r.get("is_duplicate"))
@@ -2606,6 +2806,7 @@ async def process_existing_folder_with_resolution(request: Request):
                         conflict.status = resolution
                         db.commit()
                         logger.info(f"更新冲突记录状态: {rjcode} -> {resolution}")
+                        get_event_bus().publish('conflict', {'action': 'resolved', 'id': conflict.id})
                 
                 # 创建处理任务
                 engine = get_task_engine()
@@ -3143,7 +3344,7 @@ async def asmr_sync_scan(request: ASMRSyncScanRequest):
 @app.post("/api/asmr-sync/preview")
 async def asmr_sync_preview(request: Request):
     """预览下载任务（获取文件列表、预估下载量、搜索最佳版本）"""
-    from ..core.asmr_download_service import get_asmr_download_service
+    from ..core.asmr_download_service import get_asmr_download_service, PROBE_CONCURRENCY
 
     try:
         data = await request.json()
@@ -3154,30 +3355,35 @@ async def asmr_sync_preview(request: Request):
 
         asmr_service = get_asmr_download_service()
 
-        # 获取所有关联版本
+        # 获取所有关联版本，同时探测各版本是否可用（最多 PROBE_CONCURRENCY 个并发）
         linked_works = await asmr_service.get_linked_works_from_dlsite(rjcode)
-        available_versions = []
+        semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
 
-        for work in linked_works:
-            work_info = await asmr_service.fetch_work_info(work.workno)
-            tracks = await asmr_service.fetch_track_list(work.workno) if work_info else None
+        async def probe(work):
+            async with semaphore:
+                work_info = await asmr_service.fetch_work_info(work.workno)
+                tracks = await asmr_service.fetch_track_list(work.workno) if work_info else None
+            return work_info, tracks
 
-            available_versions.append({
+        probes = await asyncio.gather(*(probe(work) for work in linked_works))
+        available_versions = [
+            {
                 "rjcode": work.workno,
                 "lang": work.lang,
                 "priority": work.priority,
                 "available": work_info is not None and tracks is not None and len(tracks) > 0,
                 "title": work_info.get('title', '') if work_info else '',
                 "file_count": len(tracks) if tracks else 0
-            })
-
-            # 添加延迟避免请求过快
-            await asyncio.sleep(0.3)
+            }
+            for work, (work_info, tracks) in zip(linked_works, probes)
+        ]
 
-        # 找到最佳可用版本
-        actual_rjcode, work_info = await asmr_service.find_best_available_work(rjcode)
+        # 找到最佳可用版本（关联版本已按优先级排序）
+        best = next(
+            (i for i, version in enumerate(available_versions) if version["available"]), None
+        )
 
-        if not work_info:
+        if best is None:
             return {
                 "success": False,
                 "rjcode": rjcode,
@@ -3188,15 +3394,8 @@ async def asmr_sync_preview(request: Request):
                 ]
             }
 
-        # 获取文件列表
-        tracks = await asmr_service.fetch_track_list(actual_rjcode)
-        if tracks is None:
-            return {
-                "success": False,
-                "rjcode": rjcode,
-                "actual_rjcode": actual_rjcode,
-                "error": "无法获取文件列表"
-            }
+        actual_rjcode = linked_works[best].workno
+        work_info, tracks = probes[best]
 
         # 扁平化文件列表
         all_files = asmr_service._flatten_tracks(tracks)
@@ -3484,7 +3683,7 @@ async def asmr_sync_delete_waiting_retry_task(task_id: str):
         if task_id in engine.tasks:
             task = engine.tasks[task_id]
             rjcode = task.rjcode
-            del engine.tasks[task_id]
+            engine.remove_task(task_id)
             logger.info(f"[等待重试] 从内存中删除任务: {task_id}")
 
             # 从数据库中删除
@@ -12,6 +12,7 @@ class StorageConfig(BaseModel):
     processed_archives_path: str = "/processed"
     existing_folders_path: str = "/existing"  # 已存在文件夹目录（非软件解压的文件夹）
     asmr_subtitle_path: str = ""  # ASMR同步字幕文件夹路径
+    library_index_depth: int = 4  # 库存索引扫描的最大目录深度（分类规则产生的层级 + 作品文件夹）
 
 class ClassificationRule(BaseModel):
     """分类规则"""
@@ -25,11 +26,16 @@ class ClassificationRule(BaseModel):
 
 class ProcessingConfig(BaseModel):
     """处理配置"""
-    max_workers: int = 4
+    max_workers: int = 4  # 同时在流水线中处理的任务数，实际不少于下面各阶段并发数之和（默认 2 + 8 + 1 = 11）
+    extract_concurrency: int = 2  # 同时进行的解压数（7z，CPU/磁盘密集）
+    metadata_concurrency: int = 8  # 同时进行的元数据获取数（网络）
+    move_concurrency_per_volume: int = 1  # 每个目标卷同时进行的跨设备移动数
     retry_count: int = 3
     file_stable_checks: int = 3
     file_stable_interval: int = 2
     max_wait_time: int = 3600
+    task_retention_minutes: int = 60  # 已结束的任务在内存中保留的时间（分钟），之后只保存在数据库中
+    task_history_size: int = 500  # 内存中最多保留的已结束任务数
 
 class WatcherConfig(BaseModel):
     """监视器配置"""
@@ -47,6 +53,8 @@ class ExtractConfig(BaseModel):
     password_list: list = []
     extract_nested_archives: bool = True  # 是否解压嵌套压缩包
     max_nested_depth: int = 5  # 最大嵌套深度
+    password_probe_concurrency: int = 4  # 并行探测密码的 7z 进程数
+    builtin_zip: bool = True  # 普通 ZIP 使用内置 zipfile 处理（AES 加密、分卷等仍使用 7z）
 
 class FilterRule(BaseModel):
     """过滤规则"""
@@ -67,7 +75,14 @@ class MetadataConfig(BaseModel):
     locale: str = "zh_cn"
     connect_timeout: int = 10
     read_timeout: int = 10
-    sleep_interval: int = 3
+    sleep_interval: float = 3  # DLsite 请求的平均间隔（秒），令牌桶限速
+    rate_limit_burst: int = 4  # 令牌桶容量，空闲后允许连续发出的请求数
+    batch_window: float = 0.05  # 合并批量请求的等待窗口（秒）
+    batch_size: int = 20  # 单次批量请求最多包含的作品数，1 表示不合并
+    duplicate_check_concurrency: int = 8  # 批量查重（已有文件夹扫描）同时查询的作品数
+    linkage_ttl_hours: int = 72  # 作品关联图（WorkLinkage）每条边的有效期（小时）
+    memory_cache_size: int = 2000  # 进程内作品数据 / 日语元数据缓存的最大条目数
+    negative_cache_ttl: int = 600  # 作品不存在（404）结果的缓存时间（秒）
     http_proxy: Optional[str] = None
     cache_enabled: bool = True
     fetch_cover: bool = True
@@ -139,12 +154,17 @@ class KikoeruServerConfig(BaseModel):
     token_expires: int = 0 # Token 过期时间戳
     timeout: int = 10      # 请求超时(秒)
     cache_ttl: int = 300   # 缓存时间(秒)
+    cache_max_entries: int = 2000  # 缓存最大条目数
 
 class ASMRSyncConfig(BaseModel):
     """ASMR 同步下载配置"""
     enabled: bool = True
     api_base_url: str = "https://api.asmr-200.com/api"
-    max_concurrent_downloads: int = 3
+    max_concurrent_downloads: int = 3  # 每个作品同时下载的文件数
+    max_total_downloads: int = 6  # 所有作品合计同时使用的下载连接数（分段下载的每个连接各占一个），不超过 connections_per_host
+    connections_per_host: int = 6  # 共享 HTTP 会话对每个主机的最大连接数
+    segment_threshold_mb: int = 64  # 超过该大小（MB）的文件分段并发下载
+    segment_connections: int = 4  # 分段下载时每个文件最多同时使用的连接数（不超过 connections_per_host），1 表示不分段
     http_proxy: Optional[str] = None
     retry_interval_hours: float = 1.0# 重试间隔（小时）
     max_retry_count: int = 10  # 最大重试次数
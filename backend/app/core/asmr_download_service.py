@@ -5,15 +5,32 @@ ASMR.one 下载服务
 """
 import os
 import re
+import json
 import aiohttp
 import asyncio
 import logging
-from typing import Optional, List, Dict, Callable, Tuple
+import time
+from collections import deque
+from typing import Optional, List, Dict, Callable, Set, Tuple
 from pathlib import Path
-from datetime import datetime
+
+from ..config.settings import get_config
+from .dlsite_service import get_dlsite_service
+from .stage_pools import StageLimiter
+from .download_sink import BufferedFileSink, ProgressThrottle, CHUNK_SIZE
+from .asmr_manifest import ManifestEntry, SyncManifest, get_asmr_manifest_store, rules_fingerprint
+from .tree_stats import get_tree_stats_service
 
 logger = logging.getLogger(__name__)
 
+# 分段下载时每段的大小（已完成的段记录在清单中，续传以段为单位）
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+# 搜索版本时同时探测的候选数
+PROBE_CONCURRENCY = 4
+# 搜索版本时取得的文件列表缓存时间（秒），供随后的下载使用
+TRACK_CACHE_TTL = 600
+
 # 语言优先级定义（数字越小优先级越高）
 LANGUAGE_PRIORITY = {
     'CHI_HANS': 1,  # 简体中文
@@ -49,23 +66,47 @@ class ASMRDownloadService:
         "https://api.asmr-100.com/api",
     ]
 
-    # DLsite API
-    DLSITE_API = "https://www.dlsite.com/maniax/api/=/product.json"
-
     def __init__(self, config=None):
         self.config = config
         self._session: Optional[aiohttp.ClientSession] = None
         self._current_api_index = 0
-        self._cache: Dict = {}
-        self._cache_ttl = 300  # 5分钟缓存
+        # 所有作品合计同时使用的下载连接数
+        self._transfer_limiter: Optional[StageLimiter] = None
+        # RJ号 -> (缓存时间, 文件列表)
+        self._track_cache: Dict[str, Tuple[float, List[Dict]]] = {}
+        # 每个作品上次同步的文件清单
+        self.manifest_store = get_asmr_manifest_store()
+
+    @property
+    def sync_config(self):
+        return (self.config or get_config()).asmr_sync
 
     async def _get_session(self) -> aiohttp.ClientSession:
-        """获取或创建 HTTP 会话"""
+        """获取或创建 HTTP 会话（所有作品共享，每个主机的连接数有上限，避免单个文件服务器占满连接）"""
         if self._session is None or self._session.closed:
+            cfg = self.sync_config
             timeout = aiohttp.ClientTimeout(total=30, connect=10)
-            self._session = aiohttp.ClientSession(timeout=timeout)
+            connector = aiohttp.TCPConnector(
+                limit=max(1, cfg.max_total_downloads) + 4,
+                limit_per_host=max(1, cfg.connections_per_host)
+            )
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
         return self._session
 
+    def _get_transfer_limiter(self) -> StageLimiter:
+        """全局传输名额（按当前配置更新上限）
+
+        文件都在同一个文件服务器上，名额不超过 connections_per_host：
+        多出的名额只会在连接池中排队，排队时间计入请求超时。
+        """
+        cfg = self.sync_config
+        limit = min(cfg.max_total_downloads, max(1, cfg.connections_per_host))
+        if self._transfer_limiter is None:
+            self._transfer_limiter = StageLimiter(limit)
+        elif self._transfer_limiter.limit != max(1, limit):
+            self._transfer_limiter.set_limit(limit)
+        return self._transfer_limiter
+
     async def close(self):
         """关闭 HTTP 会话"""
         if self._session and not self._session.closed:
@@ -75,8 +116,14 @@ class ASMRDownloadService:
         """获取当前 API 基础 URL"""
         return self.API_BASE_URLS[self._current_api_index]
 
-    async def _switch_api(self):
-        """切换到下一个 API 服务器"""
+    async def _switch_api(self, failed_index: Optional[int] = None):
+        """切换到下一个 API 服务器
+
+        failed_index 为失败的请求所用的服务器序号；并发请求同时失败时，
+        只有第一个切换生效，其余请求发现服务器已切换后直接用新的服务器重试。
+        """
+        if failed_index is not None and failed_index != self._current_api_index:
+            return
         self._current_api_index = (self._current_api_index + 1) % len(self.API_BASE_URLS)
         logger.info(f"切换 API 服务器到: {self._get_api_base()}")
 
@@ -96,104 +143,29 @@ class ASMRDownloadService:
         else:
             rjcode_num = rjcode
 
-        # 检查缓存
-        cache_key = f"linked_{rjcode_num}"
-        if cache_key in self._cache:
-            cached = self._cache[cache_key]
-            if (datetime.now() - cached['timestamp']).total_seconds() < self._cache_ttl:
-                return cached['data']
-
-        session = await self._get_session()
+        rjcode = f"RJ{rjcode_num}".upper()
         works = []
 
         try:
-            # 获取作品信息
-            url = f"{self.DLSITE_API}?workno=RJ{rjcode_num}"
-            logger.info(f"[DLsite] 获取关联作品: {url}")
-
-            async with session.get(url) as response:
-                if response.status != 200:
-                    logger.warning(f"[DLsite] 获取作品信息失败: HTTP {response.status}")
-                    works.append(LinkedWorkInfo(f"RJ{rjcode_num}", 'JPN', 'original'))
-                    return works
-
-                data = await response.json()
-                if not data or not isinstance(data, list) or len(data) == 0:
-                    works.append(LinkedWorkInfo(f"RJ{rjcode_num}", 'JPN', 'original'))
-                    return works
-
-                product = data[0]
-
-                # 获取翻译信息
-                trans_info = product.get('translation_info', {})
-                is_original = trans_info.get('is_original', True)
-                is_parent = trans_info.get('is_parent', False)
-                is_child = trans_info.get('is_child', False)
-                original_workno = trans_info.get('original_workno')
-                parent_workno = trans_info.get('parent_workno')
-                current_lang = trans_info.get('lang', 'JPN')
-
-                # 添加原作品
-                if is_original:
-                    works.append(LinkedWorkInfo(f"RJ{rjcode_num}", 'JPN', 'original'))
-                elif original_workno:
-                    works.append(LinkedWorkInfo(original_workno, 'JPN', 'original'))
-                    if parent_workno and parent_workno != original_workno:
-                        works.append(LinkedWorkInfo(parent_workno, current_lang, 'parent'))
-                    works.append(LinkedWorkInfo(f"RJ{rjcode_num}", current_lang, 'child'))
-                elif is_parent:
-                    if original_workno:
-                        works.append(LinkedWorkInfo(original_workno, 'JPN', 'original'))
-                    works.append(LinkedWorkInfo(f"RJ{rjcode_num}", current_lang, 'parent'))
-                else:
-                    works.append(LinkedWorkInfo(f"RJ{rjcode_num}", current_lang, 'original'))
-
-                # 获取语言版本
-                language_editions = product.get('language_editions', [])
-                if isinstance(language_editions, dict):
-                    language_editions = list(language_editions.values())
-
-                for edition in language_editions:
-                    workno = edition.get('workno')
-                    lang = edition.get('lang', 'JPN')
-                    if workno and workno not in [w.workno for w in works]:
-                        works.append(LinkedWorkInfo(workno, lang, 'translation'))
-
-                # 对于子版本，也需要从父版本或原版获取语言版本
-                if is_child and original_workno:
-                    try:
-                        parent_url = f"{self.DLSITE_API}?workno={original_workno}"
-                        async with session.get(parent_url) as parent_response:
-                            if parent_response.status == 200:
-                                parent_data = await parent_response.json()
-                                if parent_data and isinstance(parent_data, list) and len(parent_data) > 0:
-                                    parent_product = parent_data[0]
-                                    parent_editions = parent_product.get('language_editions', [])
-                                    if isinstance(parent_editions, dict):
-                                        parent_editions = list(parent_editions.values())
-
-                                    for edition in parent_editions:
-                                        workno = edition.get('workno')
-                                        lang = edition.get('lang', 'JPN')
-                                        if workno and workno not in [w.workno for w in works]:
-                                            works.append(LinkedWorkInfo(workno, lang, 'translation'))
-                    except Exception as e:
-                        logger.warning(f"[DLsite] 获取父版本语言版本失败: {e}")
-
+            # 从关联图读取（与查重共用，持久化并按边过期）
+            linked = await get_dlsite_service().get_full_linkage(rjcode, cue_languages=[])
+            me = linked.get(rjcode)
+            for workno, work in linked.items():
+                work_type = work.work_type
+                # 当前作品所属的语言版本父级保留 parent，其余语言版本视为 translation
+                if work_type == 'parent' and workno != rjcode and not (
+                        me and me.work_type == 'child' and work.lang == me.lang):
+                    work_type = 'translation'
+                works.append(LinkedWorkInfo(workno, work.lang, work_type))
         except Exception as e:
             logger.error(f"[DLsite] 获取关联作品失败: {e}")
-            if not works:
-                works.append(LinkedWorkInfo(f"RJ{rjcode_num}", 'JPN', 'original'))
+
+        if not works:
+            works.append(LinkedWorkInfo(rjcode, 'JPN', 'original'))
 
         # 按语言优先级排序
         works.sort(key=lambda w: w.priority)
 
-        # 缓存结果
-        self._cache[cache_key] = {
-            'data': works,
-            'timestamp': datetime.now()
-        }
-
         logger.info(f"[DLsite] 找到 {len(works)} 个关联版本: {[(w.workno, w.lang) for w in works]}")
         return works
 
@@ -217,7 +189,8 @@ class ASMRDownloadService:
 
         # 尝试所有 API 服务器
         for attempt in range(len(self.API_BASE_URLS)):
-            api_base = self._get_api_base()
+            api_index = self._current_api_index
+            api_base = self.API_BASE_URLS[api_index]
             url = f"{api_base}/workInfo/{rjcode_num}"
 
             try:
@@ -232,48 +205,85 @@ class ASMRDownloadService:
                         return None
                     else:
                         logger.warning(f"[ASMR] 获取作品信息失败: HTTP {response.status}")
-                        await self._switch_api()
+                        await self._switch_api(api_index)
             except aiohttp.ClientError as e:
                 logger.error(f"[ASMR] 请求作品信息失败: {e}")
-                await self._switch_api()
+                await self._switch_api(api_index)
 
         logger.error(f"[ASMR] 所有 API 服务器都无法访问: {rjcode}")
         return None
 
-    async def find_best_available_work(self, rjcode: str) -> Tuple[Optional[str], Optional[Dict]]:
+    async def find_best_available_work(
+        self, rjcode: str, better_than: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[Dict]]:
         """
         查找最佳可用版本
 
-        按简中 > 繁中 > 日文优先级搜索，返回第一个在 asmr.one 上可用的版本
+        按简中 > 繁中 > 日文优先级选择第一个在 asmr.one 上可用的版本。
+        所有候选同时用作品信息请求探测是否存在，按优先级依次等待结果，
+        确定版本后取消其余探测；只为选中的版本获取文件列表，并缓存供 download_work 使用。
 
         Args:
             rjcode: 原始 RJ号
+            better_than: 已同步的版本；指定时只搜索优先级更高的版本
+                （该版本已是最高优先级或不在关联版本中时不发送探测请求）
 
         Returns:
             (可用RJ号, 作品信息) 或 (None, None)
         """
         # 获取所有关联版本
         linked_works = await self.get_linked_works_from_dlsite(rjcode)
+        if better_than:
+            pinned = next((w for w in linked_works if w.workno == better_than.upper()), None)
+            linked_works = [w for w in linked_works if pinned and w.priority < pinned.priority]
+            if not linked_works:
+                return None, None
 
         logger.info(f"[搜索] 开始按优先级搜索可用版本，共 {len(linked_works)} 个候选")
 
+        semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+        async def probe(workno: str) -> Optional[Dict]:
+            async with semaphore:
+                return await self.fetch_work_info(workno)
+
+        probes: Dict[str, asyncio.Task] = {}
         for work in linked_works:
-            logger.info(f"[搜索] 尝试: {work.workno} (语言: {work.lang}, 优先级: {work.priority})")
+            if work.workno not in probes:
+                probes[work.workno] = asyncio.create_task(probe(work.workno))
+
+        try:
+            for work in linked_works:
+                work_info = await probes[work.workno]
+                if not work_info:
+                    continue
+                logger.info(f"[搜索] 候选可用: {work.workno} (语言: {work.lang}, 优先级: {work.priority})")
 
-            work_info = await self.fetch_work_info(work.workno)
-            if work_info:
                 # 检查是否有文件
                 tracks = await self.fetch_track_list(work.workno)
                 if tracks:
+                    self._track_cache[work.workno] = (time.monotonic(), tracks)
                     logger.info(f"[搜索] 找到可用版本: {work.workno} ({work.lang})")
                     return work.workno, work_info
+        finally:
+            for task in probes.values():
+                task.cancel()
 
-            # 添加延迟避免请求过快
-            await asyncio.sleep(0.5)
-
-        logger.warning(f"[搜索] 未找到任何可用版本: {rjcode}")
+        if not better_than:
+            logger.warning(f"[搜索] 未找到任何可用版本: {rjcode}")
         return None, None
 
+    async def get_track_list(self, rjcode: str) -> Optional[List[Dict]]:
+        """获取文件列表，优先使用搜索版本时缓存的结果"""
+        now = time.monotonic()
+        for code, (cached_at, _) in list(self._track_cache.items()):
+            if now - cached_at > TRACK_CACHE_TTL:
+                del self._track_cache[code]
+        cached = self._track_cache.pop(rjcode, None)
+        if cached:
+            return cached[1]
+        return await self.fetch_track_list(rjcode)
+
     async def fetch_track_list(self, rjcode: str) -> Optional[List[Dict]]:
         """
         获取作品的音轨/文件列表
@@ -293,7 +303,8 @@ class ASMRDownloadService:
         session = await self._get_session()
 
         for attempt in range(len(self.API_BASE_URLS)):
-            api_base = self._get_api_base()
+            api_index = self._current_api_index
+            api_base = self.API_BASE_URLS[api_index]
             url = f"{api_base}/tracks/{rjcode_num}"
 
             try:
@@ -323,10 +334,10 @@ class ASMRDownloadService:
                         return []
                     else:
                         logger.warning(f"[ASMR] 获取文件列表失败: HTTP {response.status}")
-                        await self._switch_api()
+                        await self._switch_api(api_index)
             except aiohttp.ClientError as e:
                 logger.error(f"[ASMR] 请求文件列表失败: {e}")
-                await self._switch_api()
+                await self._switch_api(api_index)
 
         logger.error(f"[ASMR] 所有 API 服务器都无法获取文件列表: {rjcode}")
         return None
@@ -386,21 +397,31 @@ class ASMRDownloadService:
         dest_path: str,
         progress_callback: Optional[Callable[[int, int], None]] = None,
         max_retries: int = 10,
-        timeout: int = 60
+        timeout: int = 60,
+        size_hint: int = 0
     ) -> bool:
         """
         下载单个文件（支持断点续传和重试）
 
+        已知大小（size_hint，来自文件列表）超过 segment_threshold_mb 的文件分段并发下载，
+        服务器不支持 Range 时改为单连接下载。调用方应已占用一个传输名额，分段下载的其余连接各自再占用一个。数据合并成大块后由写入线程写入磁盘，进度回调按时间节流。
+
         Args:
             url: 下载 URL
             dest_path: 目标路径
             progress_callback: 进度回调函数 (downloaded_bytes, total_bytes)
             max_retries: 最大重试次数（默认10次）
-            timeout: 单次请求超时时间（秒，默认60秒）
+            timeout: 读取超时时间（秒，默认60秒，两次收到数据之间的最长间隔）
+            size_hint: 文件大小（未知时为 0）
 
         Returns:
             是否成功
         """
+        if self._should_segment(dest_path, size_hint):
+            segmented = await self._download_segmented(url, dest_path, size_hint, progress_callback, max_retries, timeout)
+            if segmented is not None:
+                return segmented
+
         session = await self._get_session()
 
         for attempt in range(max_retries):
@@ -419,7 +440,8 @@ class ASMRDownloadService:
                     # 文件已存在，检查大小是否完整
                     existing_size = os.path.getsize(dest_path)
                     # 先获取远程文件大小
-                    async with session.head(url, timeout=aiohttp.ClientTimeout(total=30)) as head_response:
+                    head_timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+                    async with session.head(url, timeout=head_timeout) as head_response:
                         if head_response.status == 200:
                             remote_size = int(head_response.headers.get('content-length', 0))
                             if remote_size > 0 and existing_size >= remote_size:
@@ -436,7 +458,9 @@ class ASMRDownloadService:
                 if resume_offset > 0:
                     headers['Range'] = f'bytes={resume_offset}-'
 
-                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                # 不限制总时长（大文件），只限制建立连接和两次读取之间的时间；在连接池中排队的时间不计入
+                stream_timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=timeout)
+                async with session.get(url, headers=headers, timeout=stream_timeout) as response:
                     # 处理响应状态
                     if resume_offset > 0 and response.status == 206:
                         # 服务器支持断点续传
@@ -468,12 +492,13 @@ class ASMRDownloadService:
                     write_path = temp_path if resume_offset == 0 or response.status == 206 else dest_path
                     mode = 'ab' if resume_offset > 0 and response.status == 206 else 'wb'
 
-                    with open(write_path, mode) as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
+                    report = ProgressThrottle(progress_callback if total_size > 0 else None)
+                    async with BufferedFileSink(write_path, mode) as sink:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            await sink.write(chunk)
                             downloaded += len(chunk)
-                            if progress_callback and total_size > 0:
-                                progress_callback(downloaded, total_size)
+                            report(downloaded, total_size)
+                    report.flush()
 
                     # 下载完成，重命名临时文件
                     if os.path.exists(temp_path):
@@ -505,6 +530,188 @@ class ASMRDownloadService:
         logger.error(f"[下载] 文件下载失败，已尝试 {max_retries} 次: {os.path.basename(dest_path)}")
         return False
 
+    def _should_segment(self, dest_path: str, size_hint: int) -> bool:
+        """是否使用分段下载：文件足够大，且没有单连接下载留下的未完成文件"""
+        cfg = self.sync_config
+        if cfg.segment_connections <= 1 or size_hint < cfg.segment_threshold_mb * 1024 * 1024:
+            return False
+        if os.path.exists(dest_path):
+            return False
+        temp_path = dest_path + '.downloading'
+        return not os.path.exists(temp_path) or os.path.exists(temp_path + '.json')
+
+    @staticmethod
+    def _load_segment_manifest(manifest_path: str, total_size: int) -> Optional[Set[int]]:
+        """读取已完成的段；清单不存在或与当前文件不一致时返回 None"""
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('size') != total_size or manifest.get('segment_size') != SEGMENT_SIZE:
+                return None
+            return set(manifest.get('done', []))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _parse_content_range(header: Optional[str]) -> Optional[Tuple[int, int, int]]:
+        """解析 Content-Range: bytes start-end/total，格式不符或总大小未知时返回 None"""
+        match = re.fullmatch(r'bytes\s+(\d+)-(\d+)/(\d+)', (header or '').strip())
+        if not match:
+            return None
+        return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+    @staticmethod
+    def _save_segment_manifest(manifest_path: str, total_size: int, done: Set[int]):
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': total_size, 'segment_size': SEGMENT_SIZE, 'done': sorted(done)}, f)
+        os.replace(tmp_path, manifest_path)
+
+    async def _download_segmented(
+        self,
+        url: str,
+        dest_path: str,
+        total_size: int,
+        progress_callback: Optional[Callable[[int, int], None]],
+        max_retries: int,
+        timeout: int
+    ) -> Optional[bool]:
+        """分段并发下载大文件
+
+        预分配稀疏的 .downloading 文件，多个连接各自请求一段字节范围并写入对应位置，
+        每完成一段写入 .downloading.json 清单，续传时跳过已完成的段；全部完成后直接重命名为目标文件。
+        第一个连接使用调用方的传输名额，其余连接各占用一个传输名额，连接数不超过 connections_per_host。
+
+        文件列表中的大小（total_size）可能与服务器上的文件不一致，每个 206 响应都核对 Content-Range，
+        范围或总大小不符时同样改为单连接下载。写入磁盘出错（OSError）时不再重试，停止其余连接并返回失败。
+
+        Returns:
+            是否成功；服务器不支持 Range 或文件大小与列表不一致时返回 None
+            （已清理临时文件，由调用方改为单连接下载）
+        """
+        cfg = self.sync_config
+        name = os.path.basename(dest_path)
+        temp_path = dest_path + '.downloading'
+        manifest_path = temp_path + '.json'
+        segments = [(start, min(start + SEGMENT_SIZE, total_size) - 1) for start in range(0, total_size, SEGMENT_SIZE)]
+
+        done = self._load_segment_manifest(manifest_path, total_size)
+        if done is None or not os.path.exists(temp_path) or os.path.getsize(temp_path) != total_size:
+            try:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                with open(temp_path, 'wb') as f:
+                    f.truncate(total_size)
+                done = set()
+                self._save_segment_manifest(manifest_path, total_size, done)
+            except OSError as e:
+                logger.error(f"[下载] 无法创建分段下载文件: {name}, {e}")
+                return False
+        else:
+            logger.info(f"[下载] 分段续传，已完成 {len(done)}/{len(segments)} 段: {name}")
+
+        received = {index: segments[index][1] - segments[index][0] + 1 for index in done}
+        pending = deque(index for index in range(len(segments)) if index not in done)
+        # fallback: 需要改为单连接下载的原因
+        state = {'fallback': None, 'failed': False}
+        session = await self._get_session()
+        segment_timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=timeout)
+
+        throttle = ProgressThrottle(progress_callback)
+
+        def report():
+            throttle(sum(received.values()), total_size)
+
+        async def fetch_segment(index: int) -> bool:
+            start, end = segments[index]
+            for attempt in range(max_retries):
+                received[index] = 0
+                try:
+                    headers = {'Range': f'bytes={start}-{end}'}
+                    async with session.get(url, headers=headers, timeout=segment_timeout) as response:
+                        if response.status == 200:
+                            state['fallback'] = '服务器不支持分段下载'
+                            return False
+                        if response.status != 206:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        content_range = self._parse_content_range(response.headers.get('Content-Range'))
+                        if content_range != (start, end, total_size):
+                            state['fallback'] = (f"服务器返回的范围与文件列表不一致 "
+                                                 f"({response.headers.get('Content-Range')}, 列表大小 {total_size})")
+                            return False
+                        async with BufferedFileSink(temp_path, 'r+b', offset=start) as sink:
+                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                                await sink.write(chunk)
+                                received[index] += len(chunk)
+                                report()
+                    if received[index] != end - start + 1:
+                        raise aiohttp.ClientPayloadError(f"分段数据不完整 ({received[index]}/{end - start + 1})")
+                    return True
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    logger.warning(f"[下载] 分段 {index + 1}/{len(segments)} 失败 ({e})，第 {attempt + 1}/{max_retries} 次尝试: {name}")
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(min(5 * (attempt + 1), 30))
+                except OSError as e:
+                    # 磁盘写入错误（网络错误已在上面处理），重试无用
+                    logger.error(f"[下载] 分段 {index + 1}/{len(segments)} 写入失败: {name}, {e}")
+                    break
+            received[index] = 0
+            return False
+
+        async def worker():
+            while pending and not state['fallback'] and not state['failed']:
+                index = pending.popleft()
+                if not await fetch_segment(index):
+                    state['failed'] = True
+                    continue
+                done.add(index)
+                try:
+                    self._save_segment_manifest(manifest_path, total_size, done)
+                except OSError as e:
+                    logger.error(f"[下载] 保存分段清单失败: {name}, {e}")
+                    state['failed'] = True
+
+        limiter = self._get_transfer_limiter()
+        started: Set[asyncio.Task] = set()
+
+        async def extra_worker():
+            await limiter.acquire()
+            try:
+                started.add(asyncio.current_task())
+                await worker()
+            finally:
+                limiter.release()
+
+        connections = min(cfg.segment_connections, max(1, cfg.connections_per_host), len(pending))
+        logger.info(f"[下载] 分段下载 {name}: {total_size} bytes, {len(segments)} 段, 最多 {connections} 个连接")
+        extras = [asyncio.create_task(extra_worker()) for _ in range(connections - 1)]
+        try:
+            await worker()
+        finally:
+            # 没有剩余的段时，仍在等待传输名额的连接不再需要
+            for task in extras:
+                if task not in started:
+                    task.cancel()
+            await asyncio.gather(*extras, return_exceptions=True)
+        throttle.flush()
+
+        if state['fallback']:
+            logger.info(f"[下载] {state['fallback']}，改为单连接下载: {name}")
+            for path in (temp_path, manifest_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return None
+        if len(done) < len(segments):
+            # 保留临时文件和清单，下次从未完成的段继续
+            logger.error(f"[下载] 分段下载失败，已完成 {len(done)}/{len(segments)} 段: {name}")
+            return False
+
+        os.replace(temp_path, dest_path)
+        os.remove(manifest_path)
+        logger.info(f"下载完成: {dest_path} ({total_size} bytes, 分段)")
+        return True
+
     def filter_files(self, files: List[Dict], filter_rules: List) -> List[Dict]:
         """
         应用筛选规则过滤文件列表
@@ -603,6 +810,138 @@ class ASMRDownloadService:
         logger.info(f"[筛选] 原始文件数: {len(files)}, 筛选后: {len(filtered_files)}, 排除: {excluded_count}")
         return filtered_files
 
+    def _resolve_download_url(self, file_info: Dict) -> Optional[str]:
+        """获取下载 URL - 优先使用 API 返回的完整下载链接，没有时通过 hash 构建"""
+        download_url = file_info.get('media_download_url')
+        if not download_url:
+            file_hash = file_info.get('hash')
+            if file_hash:
+                download_url = f"{self._get_api_base()}/download/{file_hash}"
+                logger.info(f"[ASMR] 构建下载链接: {download_url}")
+        return download_url
+
+    async def _download_files(
+        self,
+        files: List[Dict],
+        dest_dir: str,
+        rjcode: str,
+        result: Dict,
+        progress_callback: Optional[Callable[[str, int, int, str], None]] = None,
+        file_progress_callback: Optional[Callable[[str, int, int, int, int], None]] = None,
+        check_pause: Optional[Callable[[], bool]] = None
+    ) -> List[Dict]:
+        """并发下载作品的文件，返回失败的文件列表
+
+        - 每个作品最多同时下载 max_concurrent_downloads 个文件，所有作品合计最多使用 max_total_downloads 个连接
+          （分段下载的文件占用多个连接）
+        - 小文件（字幕、图片）先下载，单个大文件下载慢不会拖住其余文件
+        - progress_callback 报告整个作品的字节进度（文件大小未知时按文件数），
+          file_progress_callback 报告各文件的进度
+        - 暂停时不再开始新文件，正在下载的文件完成后返回（result['paused'] = True）
+        """
+        cfg = self.sync_config
+        total_files = len(files)
+        failed_files: List[Dict] = []
+        # 小文件优先；文件序号按下载顺序
+        queue = sorted(files, key=lambda f: f.get('size') or 0)
+        next_index = 0
+
+        total_bytes = sum(f.get('size') or 0 for f in files)
+        file_bytes: Dict[str, int] = {}
+        completed = 0
+        last_reported = -1
+
+        def report(step: str):
+            nonlocal last_reported
+            if not progress_callback:
+                return
+            if total_bytes > 0:
+                current = min(sum(file_bytes.values()), total_bytes)
+                # 整个作品的进度每变化 0.5% 报告一次
+                bucket = current * 200 // total_bytes
+                if bucket == last_reported and not step.startswith('完成'):
+                    return
+                last_reported = bucket
+                progress_callback(rjcode, current, total_bytes, step)
+            else:
+                progress_callback(rjcode, completed, total_files, step)
+
+        async def download_one(index: int, file_info: Dict):
+            nonlocal completed
+            relative_path = file_info.get('path', file_info['title'])
+            download_url = self._resolve_download_url(file_info)
+            if not download_url:
+                logger.warning(f"无法获取下载链接: {file_info['title']}")
+                failed_files.append({
+                    'path': relative_path,
+                    'title': file_info['title'],
+                    'reason': '无法获取下载链接'
+                })
+                completed += 1
+                return
+
+            # 构建目标路径 - 使用完整路径（包含文件夹层级）
+            file_path = os.path.join(dest_dir, relative_path)
+
+            def on_progress(downloaded, total):
+                file_bytes[relative_path] = downloaded
+                if file_progress_callback:
+                    file_progress_callback(relative_path, index, total_files, downloaded, total)
+                report(f"下载中 ({completed}/{total_files}): {relative_path[:30]}")
+
+            limiter = self._get_transfer_limiter()
+            await limiter.acquire()
+            try:
+                logger.info(f"[ASMR] 下载文件 ({index}/{total_files}): {relative_path}")
+                success = await self.download_file(
+                    download_url, file_path, progress_callback=on_progress, size_hint=file_info.get('size') or 0
+                )
+            except Exception as e:
+                # 单个文件出错（如磁盘写入失败）记为失败，不影响其余文件
+                logger.error(f"[ASMR] 下载文件出错: {relative_path}, {e}")
+                success = False
+            finally:
+                limiter.release()
+
+            completed += 1
+            if success:
+                # 已存在而跳过的文件没有进度回调，按文件大小计入
+                file_bytes[relative_path] = file_info.get('size') or file_bytes.get(relative_path, 0)
+                result['downloaded_files'].append({
+                    'path': file_path,
+                    'title': file_info['title'],
+                    'relative_path': relative_path,
+                    'size': file_info.get('size', 0)
+                })
+            else:
+                failed_files.append({
+                    'path': relative_path,
+                    'title': file_info['title'],
+                    'download_url': download_url,
+                    'file_info': file_info,
+                    'reason': '下载失败'
+                })
+            report(f"{'完成' if completed == total_files else '下载中'} ({completed}/{total_files}): {relative_path[:30]}")
+
+        async def worker():
+            nonlocal next_index
+            while next_index < len(queue):
+                # 检查是否需要暂停
+                if check_pause and check_pause():
+                    result['paused'] = True
+                    return
+                file_info = queue[next_index]
+                next_index += 1
+                await download_one(next_index, file_info)
+
+        workers = max(1, min(cfg.max_concurrent_downloads, total_files))
+        logger.info(f"[ASMR] 开始下载 {total_files} 个文件，并发 {workers}")
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        if result['paused']:
+            logger.info(f"[ASMR] 下载被暂停，已完成 {completed}/{total_files} 个文件")
+        return failed_files
+
     async def download_work(
         self,
         rjcode: str,
@@ -610,12 +949,20 @@ class ASMRDownloadService:
         filter_rules: List = None,
         progress_callback: Optional[Callable[[str, int, int, str], None]] = None,
         file_progress_callback: Optional[Callable[[str, int, int, int, int], None]] = None,
-        check_pause: Optional[Callable[[], bool]] = None
+        check_pause: Optional[Callable[[], bool]] = None,
+        subtitle_folder: Optional[str] = None
     ) -> Dict:
         """
         下载整个作品并应用筛选规则
         自动搜索最佳可用版本（简中 > 繁中 > 日文）
 
+        同步过的作品按上次的同步清单增量同步：直接获取上次版本的文件列表，
+        只下载变化或缺失的文件。文件都没有变化、上次交付的文件夹仍然存在、且 subtitle_folder
+        已处理过时不下载，result['up_to_date'] = True。
+
+        本次的同步清单放在 result['manifest'] 中，不在这里保存：
+        调用方在后续步骤（字幕同步、重命名、移动）都成功后调用 save_manifest。
+
         Args:
             rjcode: RJ号
             dest_dir: 目标目录
@@ -623,6 +970,7 @@ class ASMRDownloadService:
             progress_callback: 进度回调 (rjcode, current, total, step)
             file_progress_callback: 文件进度回调 (file_name, file_index, total_files, downloaded_bytes, total_bytes)
             check_pause: 检查是否需要暂停的回调函数，返回True表示需要暂停
+            subtitle_folder: 本次同步的字幕文件夹
 
         Returns:
             下载结果
@@ -638,31 +986,63 @@ class ASMRDownloadService:
             'filtered_files': [],
             'error': None,
             'tried_versions': [],  # 尝试过的版本列表
-            'paused': False  # 是否被暂停
+            'paused': False,  # 是否被暂停
+            'up_to_date': False,  # 与上次同步相比没有变化
+            'skipped_files': 0,  # 未变化而跳过的文件数
+            'manifest': None  # 本次的同步清单（由调用方在整个流程成功后保存）
         }
 
         try:
-            # 查找最佳可用版本
-            if progress_callback:
-                progress_callback(rjcode, 0, 100, "搜索最佳版本...")
+            previous = self.manifest_store.get(rjcode)
+            actual_rjcode, work_info, tracks = None, None, None
 
-            actual_rjcode, work_info = await self.find_best_available_work(rjcode)
+            if previous:
+                # 上次同步的不是最高优先级的版本时，先检查更高优先级的版本（如后来上线的中文版）
+                actual_rjcode, work_info = await self.find_best_available_work(
+                    rjcode, better_than=previous.actual_rjcode
+                )
+                if actual_rjcode:
+                    logger.info(f"[增量同步] {rjcode} 有更高优先级的版本 {actual_rjcode}，"
+                                f"不再沿用上次的版本 {previous.actual_rjcode}")
+                    tracks = await self.get_track_list(actual_rjcode)
+                    if tracks is None:
+                        result['error'] = '无法获取文件列表'
+                        return result
+
+            if previous and not tracks:
+                # 增量同步：直接获取上次下载版本的文件列表
+                if progress_callback:
+                    progress_callback(previous.actual_rjcode, 0, 100, "检查文件变化...")
+                tracks = await self.fetch_track_list(previous.actual_rjcode)
+                if tracks:
+                    actual_rjcode = previous.actual_rjcode
+                    work_info = {'title': previous.title}
+                    logger.info(f"[增量同步] {rjcode} 使用上次同步的版本 {actual_rjcode}")
+                else:
+                    previous = None
 
-            if not work_info:
-                result['error'] = '在 asmr.one 上未找到该作品的任何版本'
-                return result
+            if not tracks:
+                # 查找最佳可用版本
+                if progress_callback:
+                    progress_callback(rjcode, 0, 100, "搜索最佳版本...")
 
-            result['actual_rjcode'] = actual_rjcode
-            result['title'] = work_info.get('title', '未知标题')
+                actual_rjcode, work_info = await self.find_best_available_work(rjcode)
 
-            # 获取文件列表
-            if progress_callback:
-                progress_callback(actual_rjcode, 5, 100, "获取文件列表...")
+                if not work_info:
+                    result['error'] = '在 asmr.one 上未找到该作品的任何版本'
+                    return result
 
-            tracks = await self.fetch_track_list(actual_rjcode)
-            if tracks is None:
-                result['error'] = '无法获取文件列表'
-                return result
+                # 获取文件列表
+                if progress_callback:
+                    progress_callback(actual_rjcode, 5, 100, "获取文件列表...")
+
+                tracks = await self.get_track_list(actual_rjcode)
+                if tracks is None:
+                    result['error'] = '无法获取文件列表'
+                    return result
+
+            result['actual_rjcode'] = actual_rjcode
+            result['title'] = work_info.get('title', '未知标题')
 
             if not tracks:
                 result['error'] = '文件列表为空'
@@ -672,9 +1052,29 @@ class ASMRDownloadService:
             all_files = self._flatten_tracks(tracks)
             logger.info(f"作品 {actual_rjcode} 共有 {len(all_files)} 个文件")
 
-            # 应用筛选规则
-            if filter_rules:
-                logger.info(f"[筛选] 收到 {len(filter_rules)} 条筛选规则")
+            # 应用筛选规则（文件和规则都未变化时沿用上次的结果）
+            manifest = SyncManifest(
+                rjcode=rjcode, actual_rjcode=actual_rjcode, title=result['title'],
+                rules_hash=rules_fingerprint(filter_rules)
+            )
+            previous_entries = previous.entries if previous and previous.actual_rjcode == actual_rjcode else {}
+            reuse_decisions = previous is not None and previous.rules_hash == manifest.rules_hash
+
+            def entry_of(file_info: Dict) -> ManifestEntry:
+                return manifest.entries[file_info.get('path') or file_info.get('title', '')]
+
+            undecided = []
+            for file_info in all_files:
+                entry = ManifestEntry.from_file(file_info)
+                old = previous_entries.get(entry.path)
+                if reuse_decisions and old and old.same_file(entry):
+                    entry.included = old.included
+                else:
+                    undecided.append(file_info)
+                manifest.entries[entry.path] = entry
+
+            if undecided and filter_rules:
+                logger.info(f"[筛选] 收到 {len(filter_rules)} 条筛选规则，需要判断 {len(undecided)} 个文件")
                 # 详细打印每条规则
                 for i, rule in enumerate(filter_rules):
                     if isinstance(rule, dict):
@@ -682,75 +1082,51 @@ class ASMRDownloadService:
                     else:
                         logger.info(f"[筛选] 规则{i+1}: {getattr(rule, 'name', 'unknown')}, enabled={getattr(rule, 'enabled', True)}, pattern={getattr(rule, 'pattern', '')}")
 
-                filtered_files = self.filter_files(all_files, filter_rules)
-                result['filtered_files'] = [f for f in all_files if f not in filtered_files]
-                all_files = filtered_files
-                logger.info(f"筛选后剩余 {len(all_files)} 个文件")
-            else:
+                kept = {id(f) for f in self.filter_files(undecided, filter_rules)}
+                for file_info in undecided:
+                    entry_of(file_info).included = id(file_info) in kept
+            elif not filter_rules:
                 logger.warning("[筛选] 没有收到筛选规则，将下载所有文件！")
 
+            result['filtered_files'] = [f for f in all_files if not entry_of(f).included]
+            all_files = [f for f in all_files if entry_of(f).included]
+            logger.info(f"筛选后剩余 {len(all_files)} 个文件")
+
             if not all_files:
                 result['error'] = '筛选后没有可下载的文件'
                 return result
 
-            # 创建下载目录
-            os.makedirs(dest_dir, exist_ok=True)
-
-            # 下载文件
-            total_files = len(all_files)
-            failed_files = []  # 记录失败的文件
-
-            for i, file_info in enumerate(all_files):
-                # 检查是否需要暂停
-                if check_pause and check_pause():
-                    result['paused'] = True
-                    result['failed_files'] = failed_files
-                    logger.info(f"[ASMR] 下载被暂停，已完成 {i}/{total_files} 个文件")
-                    return result
+            # 与上次的清单比较：未变化且已下载完成的文件不再请求
+            unchanged = []
+            to_download = []
+            for file_info in all_files:
+                entry = entry_of(file_info)
+                old = previous_entries.get(entry.path)
+                if old and old.done and old.same_file(entry):
+                    entry.done = True
+                    unchanged.append(file_info)
+                else:
+                    if old and not old.same_file(entry):
+                        self._remove_stale_file(os.path.join(dest_dir, entry.path))
+                    to_download.append(file_info)
+
+            result['manifest'] = manifest
+            if not to_download and await self._is_delivered(previous, subtitle_folder, len(unchanged)):
+                logger.info(f"[增量同步] {actual_rjcode} 的 {len(unchanged)} 个文件都没有变化，无需下载")
+                manifest.output_path = previous.output_path
+                manifest.subtitle_folder = previous.subtitle_folder
+                result['up_to_date'] = True
+                result['skipped_files'] = len(unchanged)
+                result['success'] = True
+                return result
 
+            # 有变化（或上次的结果已失效）时补齐目标目录中缺失的未变化文件，已存在的直接使用
+            for file_info in unchanged:
                 relative_path = file_info.get('path', file_info['title'])
-                if progress_callback:
-                    progress_callback(actual_rjcode, i + 1, total_files, f"下载: {relative_path[:30]}")
-
-                # 获取下载 URL - 优先使用 API 返回的完整下载链接
-                download_url = file_info.get('media_download_url')
-
-                # 如果没有完整链接，尝试通过 hash 构建
-                if not download_url:
-                    api_base = self._get_api_base()
-                    file_hash = file_info.get('hash')
-                    if file_hash:
-                        download_url = f"{api_base}/download/{file_hash}"
-                        logger.info(f"[ASMR] 构建下载链接: {download_url}")
-
-                if not download_url:
-                    logger.warning(f"无法获取下载链接: {file_info['title']}")
-                    failed_files.append({
-                        'path': relative_path,
-                        'title': file_info['title'],
-                        'reason': '无法获取下载链接'
-                    })
-                    continue
-
-                # 构建目标路径 - 使用完整路径（包含文件夹层级）
                 file_path = os.path.join(dest_dir, relative_path)
-
-                logger.info(f"[ASMR] 下载文件 ({i+1}/{total_files}): {relative_path}")
-
-                # 文件进度回调包装
-                def make_file_callback(fname, findex, ftotal):
-                    def cb(downloaded, total):
-                        if file_progress_callback:
-                            file_progress_callback(fname, findex, ftotal, downloaded, total)
-                    return cb
-
-                # 下载文件
-                success = await self.download_file(
-                    download_url,
-                    file_path,
-                    progress_callback=make_file_callback(relative_path, i + 1, total_files) if file_progress_callback else None
-                )
-                if success:
+                size = file_info.get('size') or 0
+                if os.path.exists(file_path) and (not size or os.path.getsize(file_path) == size):
+                    result['skipped_files'] += 1
                     result['downloaded_files'].append({
                         'path': file_path,
                         'title': file_info['title'],
@@ -758,16 +1134,31 @@ class ASMRDownloadService:
                         'size': file_info.get('size', 0)
                     })
                 else:
-                    failed_files.append({
-                        'path': relative_path,
-                        'title': file_info['title'],
-                        'download_url': download_url,
-                        'file_info': file_info,
-                        'reason': '下载失败'
-                    })
+                    # 重新下载成功后才标记为完成
+                    entry_of(file_info).done = False
+                    to_download.append(file_info)
+            if previous_entries:
+                logger.info(f"[增量同步] {actual_rjcode}: 下载 {len(to_download)} 个文件，跳过 {result['skipped_files']} 个未变化的文件")
 
+            # 创建下载目录
+            os.makedirs(dest_dir, exist_ok=True)
+
+            # 下载文件
+            failed_files = await self._download_files(
+                to_download, dest_dir, actual_rjcode, result,
+                progress_callback, file_progress_callback, check_pause
+            )
             result['failed_files'] = failed_files
 
+            # 标记已下载完成的文件（部分失败时，下次只下载其余文件）
+            for downloaded in result['downloaded_files']:
+                entry = manifest.entries.get(downloaded['relative_path'])
+                if entry:
+                    entry.done = True
+
+            if result['paused']:
+                return result
+
             # 如果有失败文件，记录警告但不标记为完全失败（部分文件可能已下载）
             if failed_files:
                 logger.warning(f"[ASMR] 下载完成但有 {len(failed_files)} 个文件失败:")
@@ -783,6 +1174,35 @@ class ASMRDownloadService:
 
         return result
 
+    async def _is_delivered(self, previous: Optional[SyncManifest], subtitle_folder: Optional[str],
+                            file_count: int) -> bool:
+        """上次同步的结果是否仍然有效：交付的文件夹存在且文件齐全，字幕文件夹已处理过"""
+        if previous is None or not previous.output_path:
+            return False
+        if os.path.normpath(subtitle_folder or '.') != os.path.normpath(previous.subtitle_folder or '.'):
+            logger.info(f"[增量同步] 字幕文件夹未处理过: {subtitle_folder}")
+            return False
+        # 字幕同步会复制字幕文件，交付的文件夹中的文件数不少于下载的文件数
+        delivered = await asyncio.to_thread(get_tree_stats_service().get_file_count, previous.output_path)
+        if delivered < file_count:
+            logger.info(f"[增量同步] 上次交付的文件夹不存在或不完整 ({delivered}/{file_count}): {previous.output_path}")
+            return False
+        return True
+
+    def save_manifest(self, manifest: Optional[SyncManifest], output_path: str, subtitle_folder: Optional[str]):
+        """同步任务整个流程成功后保存同步清单，记录作品所在的文件夹和处理过的字幕文件夹"""
+        if manifest is None:
+            return
+        manifest.output_path = output_path or ''
+        manifest.subtitle_folder = subtitle_folder or ''
+        self.manifest_store.save(manifest)
+
+    @staticmethod
+    def _remove_stale_file(file_path: str):
+        """远程文件已变化，删除本地的旧文件和未完成的下载，避免续传到旧数据上"""
+        for path in (file_path, file_path + '.downloading', file_path + '.downloading.json'):
+            if os.path.exists(path):
+                os.remove(path)
 
 # 全局服务实例
 _asmr_download_service: Optional[ASMRDownloadService] = None
@@ -0,0 +1,138 @@
+"""ASMR 同步清单
+
+每个作品的同步任务整个流程（下载、字幕同步、重命名、移动到库存）成功后，在 AsmrSyncManifest 表中
+记录文件清单（路径、asmr.one 的文件 hash、大小、筛选结果、是否已下载完成），以及作品最终所在的路径
+和处理过的字幕文件夹。再次同步时把新的文件列表与清单比较：
+
+- 没有更高优先级的版本时直接获取上次下载版本的文件列表，不再重新搜索所有版本
+- 文件未变化且筛选规则未变化时沿用上次的筛选结果
+- 未变化且已下载完成的文件不再请求（不再逐个 HEAD 比较大小），只下载变化或缺失的文件
+- 只有上次交付的文件夹仍然存在、且字幕文件夹已处理过时，才认为没有变化（已是最新）
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+
+from ..models.database import AsmrSyncManifest, get_db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ManifestEntry:
+    """清单中的一个文件"""
+    path: str
+    hash: Optional[str] = None
+    size: int = 0
+    included: bool = True  # 是否通过筛选
+    done: bool = False     # 是否已下载完成
+
+    @classmethod
+    def from_file(cls, file_info: Dict, included: bool = True) -> 'ManifestEntry':
+        return cls(
+            path=file_info.get('path') or file_info.get('title', ''),
+            hash=file_info.get('hash') or (str(file_info['id']) if file_info.get('id') is not None else None),
+            size=file_info.get('size') or 0,
+            included=included
+        )
+
+    def same_file(self, other: 'ManifestEntry') -> bool:
+        """远程文件是否未变化"""
+        return self.path == other.path and self.hash == other.hash and self.size == other.size
+
+
+@dataclass
+class SyncManifest:
+    """一个作品的同步清单"""
+    rjcode: str
+    actual_rjcode: str
+    title: str = ''
+    rules_hash: str = ''
+    entries: Dict[str, ManifestEntry] = field(default_factory=dict)
+    output_path: str = ''      # 上次同步后作品所在的文件夹（库存中）
+    subtitle_folder: str = ''  # 上次同步处理过的字幕文件夹
+
+    @property
+    def complete(self) -> bool:
+        """通过筛选的文件是否都已下载完成"""
+        return all(entry.done for entry in self.entries.values() if entry.included)
+
+
+def rules_fingerprint(filter_rules: Optional[List]) -> str:
+    """筛选规则的指纹（规则可以是对象或字典）"""
+    rules = []
+    for rule in filter_rules or []:
+        if hasattr(rule, 'model_dump'):
+            rule = rule.model_dump()
+        rules.append(rule if isinstance(rule, dict) else vars(rule))
+    data = json.dumps(rules, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class ASMRManifestStore:
+    """基于 AsmrSyncManifest 表的同步清单存储"""
+
+    def get(self, rjcode: str) -> Optional[SyncManifest]:
+        rjcode = rjcode.upper()
+        db = next(get_db())
+        try:
+            row = db.query(AsmrSyncManifest).filter(AsmrSyncManifest.rjcode == rjcode).first()
+            if row is None or not row.actual_rjcode:
+                return None
+            entries = {}
+            for item in row.files or []:
+                entry = ManifestEntry(**item)
+                entries[entry.path] = entry
+            return SyncManifest(
+                rjcode=row.rjcode,
+                actual_rjcode=row.actual_rjcode,
+                title=row.title or '',
+                rules_hash=row.rules_hash or '',
+                entries=entries,
+                output_path=row.output_path or '',
+                subtitle_folder=row.subtitle_folder or ''
+            )
+        except Exception as e:
+            logger.warning(f"[同步清单] 读取失败: {rjcode}, {e}")
+            return None
+        finally:
+            db.close()
+
+    def save(self, manifest: SyncManifest):
+        rjcode = manifest.rjcode.upper()
+        files = [vars(entry) for entry in manifest.entries.values()]
+        db = next(get_db())
+        try:
+            row = db.query(AsmrSyncManifest).filter(AsmrSyncManifest.rjcode == rjcode).first()
+            if row is None:
+                row = AsmrSyncManifest(rjcode=rjcode)
+                db.add(row)
+            row.actual_rjcode = manifest.actual_rjcode
+            row.title = manifest.title
+            row.rules_hash = manifest.rules_hash
+            row.files = files
+            row.output_path = manifest.output_path
+            row.subtitle_folder = manifest.subtitle_folder
+            row.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[同步清单] 保存失败: {rjcode}, {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# 全局存储实例
+_manifest_store: Optional[ASMRManifestStore] = None
+
+
+def get_asmr_manifest_store() -> ASMRManifestStore:
+    """获取同步清单存储实例（单例）"""
+    global _manifest_store
+    if _manifest_store is None:
+        _manifest_store = ASMRManifestStore()
+    return _manifest_store
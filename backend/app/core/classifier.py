@@ -1,13 +1,18 @@
 import os
 import re
 import shutil
+import asyncio
 from pathlib import Path
 from typing import Optional, Dict
 import logging
 
 from ..config.settings import get_config, ClassificationRule
-from ..models.database import LibrarySnapshot, ConflictWork, get_db
+from ..models.database import ConflictWork, get_db
 from ..core.task_engine import Task
+from .stage_pools import get_stage_pools, get_volume_key, is_cross_device
+from .library_index import get_library_index
+from .tree_stats import get_tree_stats_service
+from .event_bus import get_event_bus
 
 logger = logging.getLogger(__name__)
 
@@ -40,7 +45,7 @@ class SmartClassifier:
             return True
         
         # 2. 检查库中是否已存在
-        existing = self._check_existing(rjcode)
+        existing = await self._check_existing(rjcode)
         
         if existing:
             # 强制使用DUPLICATE类型（预检阶段无法判断语言差异）
@@ -78,7 +83,7 @@ class SmartClassifier:
         
         # 1. 检查是否已存在
         task.update_progress(82, "检查重复")
-        existing = self._check_existing(rjcode)
+        existing = await self._check_existing(rjcode)
         
         if existing:
             # 使用DUPLICATE类型（解压后的重复检测，已有元数据但统一标记为重复）
@@ -96,7 +101,7 @@ class SmartClassifier:
             source_folder_name = os.path.basename(source_path)
             conflict_base_path = os.path.join(self.config.storage.library_path, '_conflicts')
             os.makedirs(conflict_base_path, exist_ok=True)
-            final_path = self._move_with_rename(source_path, conflict_base_path)
+            final_path = await self._move_to_library(source_path, conflict_base_path)
             return final_path
         
         # 2. 应用分类规则
@@ -105,60 +110,29 @@ class SmartClassifier:
         
         # 3. 移动文件
         task.update_progress(90, "移动到库存")
-        final_path = self._move_with_rename(source_path, target_path)
+        final_path = await self._move_to_library(source_path, target_path)
         
         # 4. 更新库存快照
         self._update_library_snapshot(rjcode, final_path)
         
         return final_path
     
-    def _check_existing(self, rjcode: str) -> Optional[Dict]:
-        """检查作品是否已存在于库存"""
+    async def _check_existing(self, rjcode: str) -> Optional[Dict]:
+        """检查作品是否已存在于库存（查询库存索引）"""
         logger.info(f"检查RJ号 {rjcode} 是否已存在于库存")
         
-        db = next(get_db())
         try:
-            # 从数据库查询
-            snapshot = db.query(LibrarySnapshot).filter(
-                LibrarySnapshot.rjcode == rjcode
-            ).first()
-
-            # 验证数据库中的路径是否真实存在
-            if snapshot:
-                folder_path = str(snapshot.folder_path)
-                logger.info(f"数据库中找到记录: {rjcode} -> {folder_path}")
-                if os.path.exists(folder_path):
-                    logger.info(f"确认路径存在: {folder_path}")
-                    return {
-                        'path': folder_path,
-                        'size': snapshot.folder_size
-                    }
-                else:
-                    # 路径不存在，清理过期的数据库记录
-                    logger.warning(f"数据库记录存在但路径已不存在，清理过期记录: {rjcode} -> {folder_path}")
-                    db.delete(snapshot)
-                    db.commit()
-
-            # 如果没有数据库记录，扫描库存目录
-            library_path = Path(self.config.storage.library_path)
-            logger.info(f"扫描库存目录: {library_path}")
-            found_count = 0
-            for folder in library_path.rglob('*'):
-                if folder.is_dir() and rjcode in folder.name:
-                    found_count += 1
-                    logger.info(f"目录扫描找到已存在的作品: {rjcode} -> {folder}")
-                    return {
-                        'path': str(folder),
-                        'size': self._get_folder_size(str(folder))
-                    }
-            
-            logger.info(f"扫描完成，找到 {found_count} 个匹配项")
+            existing = await get_library_index().lookup_async(rjcode)
+            if existing:
+                logger.info(f"库存索引找到已存在的作品: {rjcode} -> {existing['path']}")
+                return {
+                    'path': existing['path'],
+                    'size': existing['size']
+                }
             return None
         except Exception as e:
             logger.error(f"检查作品存在性时出错: {e}")
             return None
-        finally:
-            db.close()
     
     def _determine_conflict_type(self, existing: Dict, new_metadata: Dict) -> str:
         """确定冲突类型"""
@@ -230,6 +204,7 @@ class SmartClassifier:
             db.add(conflict)
             db.commit()
             logger.info(f"添加问题作品记录: {rjcode}")
+            get_event_bus().publish('conflict', {'action': 'created', 'id': conflict.id, 'rjcode': rjcode})
         except Exception as e:
             logger.error(f"添加问题作品失败: {e}")
             db.rollback()
@@ -347,6 +322,17 @@ class SmartClassifier:
             path = path[:100]
         return path.strip()
     
+    async def _move_to_library(self, source: str, target_dir: str) -> str:
+        """移动到库存
+
+        跨设备移动需要复制全部数据，按目标卷限制并发并在线程中执行，避免阻塞事件循环；
+        同设备移动只是重命名，直接执行。
+        """
+        if is_cross_device(source, target_dir):
+            async with get_stage_pools().slot('move', get_volume_key(target_dir)):
+                return await asyncio.to_thread(self._move_with_rename, source, target_dir)
+        return self._move_with_rename(source, target_dir)
+
     def _move_with_rename(self, source: str, target_dir: str) -> str:
         """移动文件/文件夹，处理重名"""
         source_path = Path(source)
@@ -372,47 +358,15 @@ class SmartClassifier:
         return str(final_target)
     
     def _update_library_snapshot(self, rjcode: str, folder_path: str):
-        """更新库存快照"""
-        from datetime import datetime
-        
-        db = next(get_db())
+        """更新库存快照（通过库存索引写入 LibrarySnapshot）"""
+        if not rjcode:
+            return
         try:
-            # 删除旧记录
-            db.query(LibrarySnapshot).filter(
-                LibrarySnapshot.rjcode == rjcode
-            ).delete()
-            
-            # 创建新记录
-            folder_size = self._get_folder_size(folder_path)
-            file_count = self._get_file_count(folder_path)
-            
-            snapshot = LibrarySnapshot(
-                rjcode=rjcode,
-                folder_path=folder_path,
-                folder_size=folder_size,
-                file_count=file_count,
-                scanned_at=datetime.utcnow()
-            )
-            db.add(snapshot)
-            db.commit()
+            stats = get_tree_stats_service().get_stats(folder_path)
+            if stats.settled:
+                get_library_index().add(rjcode, folder_path, stats.size, stats.file_count)
+            else:
+                # 刚写入的文件夹统计结果可能不准，留到查找时再统计
+                get_library_index().add(rjcode, folder_path)
         except Exception as e:
             logger.error(f"更新库存快照失败: {e}")
-            db.rollback()
-        finally:
-            db.close()
-    
-    def _get_folder_size(self, folder_path: str) -> int:
-        """获取文件夹大小"""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-        return total_size
-    
-    def _get_file_count(self, folder_path: str) -> int:
-        """获取文件数量"""
-        count = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            count += len(filenames)
-        return count
@@ -0,0 +1,335 @@
+"""DLsite HTTP 客户端
+
+所有对 DLsite product.json 的请求共享一个 aiohttp 会话（连接池 + keep-alive），
+用令牌桶限制请求速率（被限流时自动降速），同一作品同一语言的并发请求合并为一次。
+
+短时间窗口内到达的同一语言的请求会合并成一次多作品请求（workno=RJ1,RJ2,...），
+结果按 workno 分发给各调用方；批量响应中缺失的作品再逐个单独请求。
+如果发现接口不支持批量查询，本次运行内自动退回单个请求。
+"""
+
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+import aiohttp
+
+from ..config.settings import get_config
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_API_URL = "https://www.dlsite.com/maniax/api/=/product.json"
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.0'
+
+# 被限流（429）后最多重试的次数
+RATE_LIMIT_RETRIES = 3
+
+
+class DLsiteRequestError(Exception):
+    """请求 DLsite 失败（网络错误或非 200/404 响应）"""
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数），无法解析时返回 None"""
+    try:
+        return min(max(float(value), 0.0), 300.0) if value else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """令牌桶限速：平均每 interval 秒一个请求，最多允许 capacity 个突发请求
+
+    服务端返回 429 时调用 backoff()：在 Retry-After 时间内暂停发放令牌，并把间隔加倍（最多 MAX_SLOWDOWN 倍）；
+    之后每次请求成功调用 recover()，间隔逐步恢复到配置值。
+    """
+
+    MAX_SLOWDOWN = 8
+    # 配置的间隔为 0（不限速）时，被限流后使用的基础间隔（秒）
+    MIN_BACKOFF_INTERVAL = 0.5
+
+    def __init__(self, interval: float, capacity: int):
+        self.interval = interval
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.slowdown = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def configure(self, interval: float, capacity: int):
+        self.interval = interval
+        self.capacity = max(1, capacity)
+        self.tokens = min(self.tokens, self.capacity)
+
+    @property
+    def effective_interval(self) -> float:
+        if self.slowdown <= 1:
+            return self.interval
+        return max(self.interval, self.MIN_BACKOFF_INTERVAL) * self.slowdown
+
+    def _refill(self):
+        now = time.monotonic()
+        interval = self.effective_interval
+        if now <= self._updated:
+            return
+        if interval > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) / interval)
+        else:
+            self.tokens = float(self.capacity)
+        self._updated = now
+
+    async def acquire(self):
+        """取得一个令牌，没有令牌时按到达顺序等待"""
+        async with self._lock:
+            while True:
+                paused = self._paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.effective_interval)
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """服务端限流：降低速率，并暂停发放令牌 retry_after 秒（未提供时为一个间隔）"""
+        self.slowdown = min(self.MAX_SLOWDOWN, self.slowdown * 2)
+        pause = retry_after if retry_after is not None else self.effective_interval
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        # 暂停期间不积累令牌，恢复后按新间隔重新开始
+        self.tokens = 0
+        self._updated = self._paused_until
+
+    def recover(self):
+        """请求成功：逐步恢复到配置的速率"""
+        if self.slowdown > 1:
+            self.slowdown = max(1.0, self.slowdown * 0.9)
+
+
+class DLsiteClient:
+    """共享的 DLsite API 客户端"""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_key: Optional[Tuple] = None
+        cfg = self.config.metadata
+        self._bucket = TokenBucket(cfg.sleep_interval, cfg.rate_limit_burst)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # 按语言分组的待发批次
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._batch_supported = True
+        self.request_count = 0
+        self.batch_count = 0
+        self.merged_count = 0
+        self.throttled_count = 0
+
+    @property
+    def config(self):
+        return get_config()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话，超时配置变更时重建"""
+        cfg = self.config.metadata
+        key = (cfg.connect_timeout, cfg.read_timeout)
+        if self._session is None or self._session.closed or key != self._session_key:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=16, limit_per_host=8, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=cfg.connect_timeout, sock_read=cfg.read_timeout),
+                headers={'User-Agent': USER_AGENT}
+            )
+            self._session_key = key
+        return self._session
+
+    async def get_product(self, rjcode: str, locale: Optional[str] = None) -> Optional[Dict]:
+        """获取作品的 product.json 数据（第一个元素），作品不存在时返回 None
+
+        同一作品同一语言正在请求时，等待已有请求的结果而不是重复请求
+        """
+        key = (rjcode.upper(), locale or '')
+        request = self._inflight.get(key)
+        if request is not None:
+            self.merged_count += 1
+        else:
+            request = asyncio.get_running_loop().create_future()
+            self._inflight[key] = request
+            request.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._enqueue(key, request)
+        # 某个调用方被取消不影响其他等待者
+        return await asyncio.shield(request)
+
+    async def get_products(self, rjcodes: Iterable[str], locale: Optional[str] = None) -> Dict[str, Optional[Dict]]:
+        """同时获取多个作品，请求会被合并成尽量少的批量请求
+
+        作品不存在时对应值为 None，请求失败的作品不包含在结果中
+        """
+        codes = list(dict.fromkeys(code.upper() for code in rjcodes))
+        results = await asyncio.gather(*(self.get_product(code, locale) for code in codes), return_exceptions=True)
+        products = {}
+        for code, result in zip(codes, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"[DLsite] 获取作品失败: {code}, {result}")
+                continue
+            products[code] = result
+        return products
+
+    def _enqueue(self, key: Tuple[str, str], future: asyncio.Future):
+        """把请求放入对应语言的待发批次，批次满或窗口结束时发出"""
+        rjcode, locale = key
+        cfg = self.config.metadata
+        pending = self._pending.setdefault(locale, {})
+        pending[rjcode] = future
+
+        batch_size = cfg.batch_size if self._batch_supported else 1
+        if len(pending) >= max(1, batch_size):
+            self._flush(locale)
+        elif locale not in self._flush_handles:
+            self._flush_handles[locale] = asyncio.get_running_loop().call_later(
+                max(0.0, cfg.batch_window), self._flush, locale
+            )
+
+    def _flush(self, locale: str):
+        handle = self._flush_handles.pop(locale, None)
+        if handle is not None:
+            handle.cancel()
+        futures = self._pending.pop(locale, None)
+        if futures:
+            task = asyncio.ensure_future(self._run_batch(futures, locale))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, futures: Dict[str, asyncio.Future], locale: str):
+        """发出一个批次并把结果分发给等待者"""
+        try:
+            await self._dispatch_batch(futures, locale)
+        finally:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(DLsiteRequestError("DLsite 批量请求被中断"))
+
+    async def _dispatch_batch(self, futures: Dict[str, asyncio.Future], locale: str):
+        codes = list(futures)
+        products: Dict[str, Dict] = {}
+
+        if len(codes) > 1:
+            try:
+                products = await self._request_batch(codes, locale)
+            except DLsiteRequestError as e:
+                logger.warning(f"[DLsite] 批量请求失败，改为逐个请求: {e}")
+
+        # 批量响应中缺失的作品逐个请求（单个作品或接口不支持批量时即全部）
+        missing = [code for code in codes if code not in products]
+        results = await asyncio.gather(
+            *(self._request_product(code, locale) for code in missing), return_exceptions=True
+        )
+        found_later = 0
+        for code, result in zip(missing, results):
+            future = futures[code]
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                if result is not None:
+                    found_later += 1
+                future.set_result(result)
+
+        if len(codes) > 1 and len(products) <= 1 and found_later >= 2:
+            # 批量请求只返回了一个作品，而单独请求能找到多个：接口不支持批量查询
+            self._batch_supported = False
+            logger.warning("[DLsite] product.json 不支持批量查询，之后改为逐个请求")
+
+        for code, product in products.items():
+            future = futures.get(code)
+            if future is not None and not future.done():
+                future.set_result(product)
+
+    async def _request_batch(self, rjcodes: List[str], locale: str) -> Dict[str, Dict]:
+        """一次请求多个作品，返回 {RJ号: product}"""
+        self.batch_count += 1
+        data = await self._request(','.join(rjcodes), locale)
+        products = {}
+        for item in data if isinstance(data, list) else []:
+            workno = str(item.get('workno', '')).upper()
+            if workno in rjcodes:
+                products[workno] = item
+        logger.debug(f"[DLsite] 批量请求 {len(rjcodes)} 个作品，返回 {len(products)} 个")
+        return products
+
+    async def _request_product(self, rjcode: str, locale: Optional[str]) -> Optional[Dict]:
+        data = await self._request(rjcode, locale)
+        if isinstance(data, list) and data:
+            return data[0]
+        return None
+
+    async def _request(self, workno: str, locale: Optional[str]):
+        """请求 product.json，404 返回 None"""
+        params = {'workno': workno}
+        if locale:
+            params['locale'] = locale
+
+        cfg = self.config.metadata
+        self._bucket.configure(cfg.sleep_interval, cfg.rate_limit_burst)
+        await self._bucket.acquire()
+
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            if attempt:
+                await self._bucket.acquire()
+            session = await self._get_session()
+            self.request_count += 1
+            logger.debug(f"[DLsite] 请求 product.json: {workno} (locale={locale or '默认'})")
+            try:
+                async with session.get(PRODUCT_API_URL, params=params, proxy=cfg.http_proxy or None) as response:
+                    if response.status == 429:
+                        self.throttled_count += 1
+                        self._bucket.backoff(_retry_after(response.headers.get('Retry-After')))
+                        logger.warning(
+                            f"[DLsite] 请求被限流 (429)，降低请求速率，间隔 {self._bucket.effective_interval:.1f} 秒: {workno}"
+                        )
+                        continue
+                    if response.status == 404:
+                        self._bucket.recover()
+                        return None
+                    if response.status != 200:
+                        raise DLsiteRequestError(f"DLsite 返回状态码 {response.status}: {workno}")
+                    self._bucket.recover()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise DLsiteRequestError(f"请求 DLsite 失败: {workno}, {e}") from e
+        raise DLsiteRequestError(f"DLsite 持续限流，已重试 {RATE_LIMIT_RETRIES} 次: {workno}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'requests': self.request_count,
+            'batches': self.batch_count,
+            'merged': self.merged_count,
+            'batch_supported': self._batch_supported,
+            'inflight': len(self._inflight),
+            'tokens': round(self._bucket.tokens, 2),
+            'throttled': self.throttled_count,
+            'slowdown': round(self._bucket.slowdown, 2)
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# 全局客户端实例
+_dlsite_client: Optional[DLsiteClient] = None
+
+
+def get_dlsite_client() -> DLsiteClient:
+    """获取 DLsite 客户端实例（单例）"""
+    global _dlsite_client
+    if _dlsite_client is None:
+        _dlsite_client = DLsiteClient()
+    return _dlsite_client
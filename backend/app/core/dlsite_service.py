@@ -3,13 +3,16 @@ DLsite API 服务 - 用于获取作品关联信息和翻译链
 参考 VoiceLinks 的实现
 """
 import asyncio
-import httpx
 import logging
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
 from functools import lru_cache
 
+from ..config.settings import get_config
+from .dlsite_client import get_dlsite_client
+from .linkage_store import LinkageComponent, get_linkage_store
+from .memory_cache import MISSING, MemoryCache, get_memory_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,53 +48,49 @@ class DLsiteApiService:
     """DLsite API 服务"""
     
     def __init__(self):
-        self.client: Optional[httpx.AsyncClient] = None
-        self.cache: Dict[str, Dict] = {}  # 缓存 API 响应
-        self.cache_ttl = timedelta(hours=24)  # 缓存24小时
+        self.client = get_dlsite_client()
+        self.linkage_store = get_linkage_store()
+        # 原作品 RJ 号 -> 进行中的关联分量爬取
+        self._crawls: Dict[str, asyncio.Future] = {}
     
-    async def _get_client(self) -> httpx.AsyncClient:
-        """获取或创建 HTTP 客户端"""
-        if self.client is None:
-            self.client = httpx.AsyncClient(
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.0'
-                },
-                timeout=30.0
-            )
-        return self.client
+    @property
+    def cache(self) -> MemoryCache:
+        """作品数据缓存，作品不存在（404）时负缓存"""
+        cfg = get_config().metadata
+        return get_memory_cache('dlsite_product', cfg.memory_cache_size, 24 * 3600, cfg.negative_cache_ttl)
     
-    async def _fetch_api(self, url: str) -> Optional[Dict]:
-        """从 DLsite API 获取数据"""
-        cache_key = url
+    async def _fetch_product(self, rjcode: str) -> Optional[Dict]:
+        """从 DLsite API 获取作品数据（product.json 的第一个元素）"""
+        cache_key = rjcode.upper()
         
         # 检查缓存
-        if cache_key in self.cache:
-            cached_data = self.cache[cache_key]
-            if datetime.now() - cached_data['timestamp'] < self.cache_ttl:
-                logger.debug(f"使用缓存数据: {url}")
-                return cached_data['data']
+        cached = self.cache.get(cache_key)
+        if cached is not MISSING:
+            logger.debug(f"使用缓存数据: {rjcode}")
+            return cached
         
         try:
-            client = await self._get_client()
-            response = await client.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                # 保存到缓存
-                self.cache[cache_key] = {
-                    'data': data,
-                    'timestamp': datetime.now()
-                }
-                return data
-            elif response.status_code == 404:
-                logger.warning(f"API 返回 404: {url}")
-                return None
-            else:
-                logger.error(f"API 请求失败: {url}, 状态码: {response.status_code}")
-                return None
+            product = await self.client.get_product(rjcode)
         except Exception as e:
-            logger.error(f"API 请求异常: {url}, 错误: {e}")
+            logger.error(f"API 请求异常: {rjcode}, 错误: {e}")
             return None
+        
+        if product is None:
+            logger.warning(f"API 未找到作品: {rjcode}")
+        # 保存到缓存（未找到的作品也缓存一段较短的时间）
+        self.cache.set(cache_key, product)
+        return product
+    
+    async def prefetch(self, rjcodes: List[str]):
+        """批量预取多个作品的数据并写入缓存，之后的单个查询直接命中缓存"""
+        cache = self.cache
+        missing = [code for code in dict.fromkeys(c.upper() for c in rjcodes) if cache.get(code) is MISSING]
+        if not missing:
+            return
+        products = await self.client.get_products(missing)
+        for code, product in products.items():
+            cache.set(code, product)
+        logger.info(f"预取作品数据: 请求 {len(missing)} 个，获得 {sum(p is not None for p in products.values())} 个")
     
     async def get_translation_info(self, rjcode: str) -> TranslationInfo:
         """
@@ -101,11 +100,9 @@ class DLsiteApiService:
             TranslationInfo: 包含 is_original, is_parent, is_child 等信息
         """
         # 尝试从 API2 获取
-        url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}"
-        data = await self._fetch_api(url)
+        product = await self._fetch_product(rjcode)
         
-        if data and isinstance(data, list) and len(data) > 0:
-            product = data[0]
+        if product:
             translation_info = product.get('translation_info', {})
             
             return TranslationInfo(
@@ -119,24 +116,16 @@ class DLsiteApiService:
         
         return TranslationInfo(is_original=True)
     
-    async def get_linked_works(self, rjcode: str) -> Dict[str, LinkedWork]:
-        """
-        获取作品的关联作品（不递归获取所有语言版本）
-        
-        返回:
-            Dict[str, LinkedWork]: RJ号到作品信息的映射
-        """
+    async def _fetch_linked_works(self, rjcode: str) -> Optional[Dict[str, LinkedWork]]:
+        """从 DLsite 获取作品的直接关联作品，获取失败时返回 None"""
         trans = await self.get_translation_info(rjcode)
         result = {}
         
         try:
-            url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}"
-            data = await self._fetch_api(url)
-            
-            if not (data and isinstance(data, list) and len(data) > 0):
-                return {rjcode: LinkedWork(workno=rjcode, work_type='original', lang='JPN')}
+            product = await self._fetch_product(rjcode)
             
-            product = data[0]
+            if not product:
+                return None
             
             if trans.is_original:
                 # 原作品 - 获取所有语言版本
@@ -201,7 +190,95 @@ class DLsiteApiService:
             
         except Exception as e:
             logger.error(f"获取关联作品失败 {rjcode}: {e}")
-            return {rjcode: LinkedWork(workno=rjcode, work_type='original', lang='JPN')}
+            return None
+    
+    async def _original_of(self, rjcode: str) -> str:
+        """rjcode 所在关联分量的原作品 RJ 号"""
+        trans = await self.get_translation_info(rjcode)
+        if not trans.is_original and trans.original_workno:
+            return trans.original_workno.upper()
+        return rjcode.upper()
+    
+    async def _crawl_component(self, original_rjcode: str) -> Optional[Dict[str, LinkedWork]]:
+        """从 DLsite 爬取原作品的完整关联分量：原作品、所有语言版本及其子级，并写回关联图存储"""
+        works = await self._fetch_linked_works(original_rjcode)
+        if works is None:
+            return None
+        
+        # 各语言版本的数据一次批量预取
+        editions = [workno for workno, work in works.items() if work.work_type == 'parent']
+        await self.prefetch(editions)
+        for workno in editions:
+            for k, v in (await self._fetch_linked_works(workno) or {}).items():
+                works.setdefault(k, v)
+        
+        self._save_component(original_rjcode, works)
+        return works
+    
+    def _save_component(self, original_rjcode: str, works: Dict[str, LinkedWork]):
+        self.linkage_store.save_component(
+            original_rjcode, {k: (v.work_type, v.lang) for k, v in works.items()}
+        )
+    
+    async def get_component(self, rjcode: str) -> Dict[str, LinkedWork]:
+        """从关联图存储读取 rjcode 所在的关联分量，不存在或已过期时重新爬取并写回
+        
+        同一原作品的爬取同时只进行一次，分量中其他成员的并发查询等待同一次爬取。
+        """
+        component = self.linkage_store.get_component(rjcode)
+        if component and not component.stale:
+            return self._component_works(component)
+        
+        if component:
+            original_rjcode = component.original_rjcode
+        else:
+            original_rjcode = await self._original_of(rjcode)
+        crawl = self._crawls.get(original_rjcode)
+        if crawl is None:
+            crawl = asyncio.ensure_future(self._crawl_component(original_rjcode))
+            self._crawls[original_rjcode] = crawl
+            crawl.add_done_callback(lambda _: self._crawls.pop(original_rjcode, None))
+        # 某个调用方被取消不影响同一分量的其他等待者
+        crawled = await asyncio.shield(crawl)
+        if crawled is not None:
+            works = dict(crawled)
+            if rjcode.upper() not in works:
+                for k, v in (await self._fetch_linked_works(rjcode) or {}).items():
+                    works.setdefault(k, v)
+                self._save_component(original_rjcode, works)
+            return works
+        
+        if component:
+            logger.warning(f"刷新关联作品失败，使用过期的关联数据: {rjcode}")
+            return self._component_works(component)
+        return {rjcode: LinkedWork(workno=rjcode, work_type='original', lang='JPN')}
+    
+    @staticmethod
+    def _component_works(component: LinkageComponent) -> Dict[str, LinkedWork]:
+        return {
+            workno: LinkedWork(workno=workno, work_type=work_type, lang=lang)
+            for workno, (work_type, lang) in component.works.items()
+        }
+    
+    async def get_linked_works(self, rjcode: str) -> Dict[str, LinkedWork]:
+        """
+        获取作品的关联作品（不递归获取所有语言版本）
+        
+        原作品返回原作品和各语言版本；语言版本父级返回原作品、自身和子级；
+        子级返回原作品、同语言的父级和自身。
+        
+        返回:
+            Dict[str, LinkedWork]: RJ号到作品信息的映射
+        """
+        works = await self.get_component(rjcode)
+        me = works.get(rjcode.upper())
+        if me is None or me.work_type == 'original':
+            return {k: v for k, v in works.items() if v.work_type in ('original', 'parent')}
+        if me.work_type == 'parent':
+            return {k: v for k, v in works.items()
+                    if v.work_type == 'original' or v is me or (v.work_type == 'child' and v.lang == me.lang)}
+        return {k: v for k, v in works.items()
+                if v.work_type == 'original' or v is me or (v.work_type == 'parent' and v.lang == me.lang)}
     
     async def get_full_linkage(self, rjcode: str, cue_languages: List[str] = None) -> Dict[str, LinkedWork]:
         """
@@ -209,75 +286,31 @@ class DLsiteApiService:
         
         Args:
             rjcode: RJ号
-            cue_languages: 需要查询的语言列表，如 ['CHI_HANS', 'CHI_HANT', 'ENG']
+            cue_languages: 需要查询子级的语言列表，如 ['CHI_HANS', 'CHI_HANT', 'ENG']
         
         返回:
-            Dict[str, LinkedWork]: 所有关联作品的映射
+            Dict[str, LinkedWork]: 原作品、所有语言版本，以及 cue_languages 中语言版本的子级
         """
+        works = await self.get_component(rjcode)
+        return self.select_full_linkage(rjcode, works, cue_languages)
+    
+    @staticmethod
+    def select_full_linkage(
+        rjcode: str, works: Dict[str, LinkedWork], cue_languages: List[str] = None
+    ) -> Dict[str, LinkedWork]:
+        """从已取得的关联分量中选出完整关联链（见 get_full_linkage）"""
         if cue_languages is None:
             cue_languages = ['CHI_HANS', 'CHI_HANT']
-        
-        # 首先获取翻译信息
-        trans = await self.get_translation_info(rjcode)
-        
-        # 如果是非原作品，先从原作品开始查询
-        original_rjcode = rjcode
-        if not trans.is_original and trans.original_workno:
-            original_rjcode = trans.original_workno
-        
-        # 检查缓存
-        cache_key = f"{original_rjcode}_{'_'.join(sorted(cue_languages))}"
-        if cache_key in self.cache:
-            cached_data = self.cache[cache_key]
-            if datetime.now() - cached_data['timestamp'] < self.cache_ttl:
-                logger.debug(f"使用完整关联链缓存: {original_rjcode}")
-                return cached_data['data']
-        
-        # 获取原作品的关联信息
-        result = await self.get_linked_works(original_rjcode)
-        
-        try:
-            url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={original_rjcode}"
-            data = await self._fetch_api(url)
-            
-            if data and isinstance(data, list) and len(data) > 0:
-                product = data[0]
-                language_editions = product.get('language_editions', [])
-                if isinstance(language_editions, dict):
-                    language_editions = list(language_editions.values())
-                
-                # 对每种语言版本递归查询
-                for edition in language_editions:
-                    lang = edition.get('lang', 'JPN')
-                    if lang not in cue_languages:
-                        continue
-                    
-                    workno = edition.get('workno')
-                    if workno and workno not in result:
-                        # 递归获取该语言版本的关联作品
-                        linked = await self.get_linked_works(workno)
-                        for k, v in linked.items():
-                            if k not in result:
-                                result[k] = v
-                
-                # 保存到缓存
-                self.cache[cache_key] = {
-                    'data': result,
-                    'timestamp': datetime.now()
-                }
-        
-        except Exception as e:
-            logger.error(f"获取完整关联链失败 {rjcode}: {e}")
-        
-        return result
+        return {
+            k: v for k, v in works.items()
+            if v.work_type != 'child' or v.lang in cue_languages or k == rjcode.upper()
+        }
     
     async def get_work_info(self, rjcode: str) -> Optional[Dict]:
         """获取作品详细信息"""
-        url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}"
-        data = await self._fetch_api(url)
+        product = await self._fetch_product(rjcode)
         
-        if data and isinstance(data, list) and len(data) > 0:
-            product = data[0]
+        if product:
             return {
                 'rjcode': rjcode,
                 'title': product.get('work_name', ''),
@@ -302,9 +335,7 @@ class DLsiteApiService:
         return chain
     
     async def close(self):
-        """关闭 HTTP 客户端"""
-        if self.client:
-            await self.client.aclose()
+        """HTTP 连接由共享的 DLsite 客户端管理，应用关闭时统一释放"""
 
 
 # 全局服务实例
@@ -0,0 +1,156 @@
+"""下载数据写入
+
+下载的数据块先在事件循环中合并成较大的缓冲区，再交给专用的写入线程写入磁盘，
+事件循环不再为每个小数据块执行阻塞的 write()。等待写入的缓冲区数量有上限，
+磁盘跟不上网络时 write() 会等待（背压），内存占用不会无限增长。
+
+进度回调按时间节流，避免每个数据块都触发一次回调。
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+# 合并后的缓冲区大小
+BUFFER_SIZE = 2 * 1024 * 1024
+# 等待写入线程处理的缓冲区数量上限
+MAX_PENDING_BUFFERS = 2
+# 从响应中读取数据块的大小
+CHUNK_SIZE = 256 * 1024
+# 进度回调的最小间隔（秒）
+PROGRESS_INTERVAL = 0.25
+
+
+class BufferedFileSink:
+    """在专用线程中写入文件的缓冲写入器
+
+    用法::
+
+        async with BufferedFileSink(path, 'wb') as sink:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                await sink.write(chunk)
+
+    退出时（包括出错、被取消）会写完已接收的数据再关闭文件，续传依赖文件中的已写入数据。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = 'wb',
+        offset: Optional[int] = None,
+        buffer_size: int = BUFFER_SIZE,
+        max_pending: int = MAX_PENDING_BUFFERS
+    ):
+        self.path = path
+        self.mode = mode
+        self.offset = offset  # 打开后定位到该位置（分段下载写入文件中间）
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending
+        self._buffer = bytearray()
+        self._queue: queue.Queue = queue.Queue()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._error: Optional[BaseException] = None
+
+    async def __aenter__(self) -> 'BufferedFileSink':
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._file = await asyncio.to_thread(self._open_file)
+        self._thread = threading.Thread(target=self._run, name='download-writer', daemon=True)
+        self._thread.start()
+
+    def _open_file(self):
+        f = open(self.path, self.mode)
+        if self.offset is not None:
+            f.seek(self.offset)
+        return f
+
+    def _run(self):
+        """写入线程：依次写入队列中的缓冲区，收到 None 时退出"""
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            try:
+                if self._error is None:
+                    self._file.write(data)
+            except BaseException as e:
+                self._error = e
+            finally:
+                try:
+                    self._loop.call_soon_threadsafe(self._slots.release)
+                except RuntimeError:
+                    # 事件循环已关闭
+                    pass
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    async def write(self, chunk: bytes):
+        """追加数据，缓冲区满时交给写入线程（等待写入的缓冲区过多时等待）"""
+        self._raise_error()
+        self._buffer += chunk
+        if len(self._buffer) >= self.buffer_size:
+            await self._submit()
+
+    async def _submit(self):
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        await self._slots.acquire()
+        self._queue.put(data)
+
+    async def close(self):
+        """写完剩余数据并关闭文件，写入出错时抛出异常"""
+        if self._thread is None:
+            return
+        try:
+            await self._submit()
+        finally:
+            self._queue.put(None)
+            await asyncio.to_thread(self._finish)
+        self._raise_error()
+
+    def _finish(self):
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+
+class ProgressThrottle:
+    """按时间节流的进度回调：最多每 interval 秒调用一次，flush() 补发最后一次的进度"""
+
+    def __init__(self, callback: Optional[Callable[..., None]], interval: float = PROGRESS_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self._last = 0.0
+        self._pending: Optional[tuple] = None
+
+    def __call__(self, *args):
+        if self.callback is None:
+            return
+        self._pending = args
+        if time.monotonic() - self._last >= self.interval:
+            self._emit()
+
+    def flush(self):
+        if self.callback is not None and self._pending is not None:
+            self._emit()
+
+    def _emit(self):
+        args, self._pending = self._pending, None
+        self._last = time.monotonic()
+        self.callback(*args)
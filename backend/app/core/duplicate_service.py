@@ -10,7 +10,8 @@ from datetime import datetime
 from pathlib import Path
 import os
 
-from ..models.database import LibrarySnapshot, ConflictWork, get_db
+from ..models.database import ConflictWork, get_db
+from ..core.library_index import get_library_index
 from ..core.dlsite_service import get_dlsite_service, LinkedWork
 from ..core.kikoeru_duplicate_service import (
     get_kikoeru_service, 
@@ -59,7 +60,8 @@ class EnhancedDuplicateService:
         self, 
         rjcode: str, 
         check_linked_works: bool = True,
-        cue_languages: List[str] = None
+        cue_languages: List[str] = None,
+        component: Optional[Dict[str, LinkedWork]] = None
     ) -> DuplicateCheckResult:
         """
         改进的查重检测
@@ -68,6 +70,7 @@ class EnhancedDuplicateService:
             rjcode: 要检查的 RJ 号
             check_linked_works: 是否检查关联作品
             cue_languages: 需要检查的语言版本列表
+            component: 已取得的关联分量（批量查重时传入，不再重新读取）
         
         返回:
             DuplicateCheckResult: 详细的查重结果
@@ -91,7 +94,10 @@ class EnhancedDuplicateService:
         if check_linked_works:
             try:
                 # 获取作品的完整关联链
-                linked_works = await self.dlsite_service.get_full_linkage(rjcode, cue_languages)
+                if component is not None:
+                    linked_works = self.dlsite_service.select_full_linkage(rjcode, component, cue_languages)
+                else:
+                    linked_works = await self.dlsite_service.get_full_linkage(rjcode, cue_languages)
                 
                 if len(linked_works) > 1:
                     logger.info(f"发现关联作品链 {rjcode}: {list(linked_works.keys())}")
@@ -167,42 +173,15 @@ class EnhancedDuplicateService:
     
     async def _check_direct_duplicate(self, rjcode: str) -> Optional[Dict]:
         """检查是否存在直接重复（相同 RJ 号）"""
-        db = next(get_db())
-        try:
-            # 从数据库查询
-            snapshot = db.query(LibrarySnapshot).filter(
-                LibrarySnapshot.rjcode == rjcode
-            ).first()
-            
-            if snapshot:
-                folder_path = str(snapshot.folder_path)
-                if os.path.exists(folder_path):
-                    return {
-                        'rjcode': rjcode,
-                        'path': folder_path,
-                        'size': snapshot.folder_size,
-                        'file_count': snapshot.file_count
-                    }
-                else:
-                    # 路径不存在，清理过期记录
-                    logger.warning(f"清理过期记录: {rjcode}")
-                    db.delete(snapshot)
-                    db.commit()
-            
-            # 如果没有数据库记录，扫描库存目录
-            library_path = Path(self.config.storage.library_path)
-            for folder in library_path.rglob('*'):
-                if folder.is_dir() and rjcode in folder.name:
-                    return {
-                        'rjcode': rjcode,
-                        'path': str(folder),
-                        'size': self._get_folder_size(str(folder)),
-                        'file_count': self._get_file_count(str(folder))
-                    }
-            
+        existing = await get_library_index().lookup_async(rjcode)
+        if not existing:
             return None
-        finally:
-            db.close()
+        return {
+            'rjcode': rjcode,
+            'path': existing['path'],
+            'size': existing['size'],
+            'file_count': existing['file_count']
+        }
     
     async def _check_linked_works_in_library(
         self, 
@@ -216,56 +195,32 @@ class EnhancedDuplicateService:
             List[LinkedWorkInLibrary]: 在库中找到的关联作品列表（不包括当前检查的 RJ）
         """
         found = []
-        db = next(get_db())
+        library_index = get_library_index()
         
-        try:
-            for workno, linked_work in linked_works.items():
-                # 跳过当前检查的 RJ 号
-                if workno == exclude_rjcode:
-                    continue
-                
-                # 检查数据库
-                snapshot = db.query(LibrarySnapshot).filter(
-                    LibrarySnapshot.rjcode == workno
-                ).first()
-                
-                if snapshot:
-                    folder_path = str(snapshot.folder_path)
-                    if os.path.exists(folder_path):
-                        # 获取作品信息
-                        work_info = await self.dlsite_service.get_work_info(workno)
-                        
-                        found.append(LinkedWorkInLibrary(
-                            rjcode=workno,
-                            work_type=linked_work.work_type,
-                            lang=linked_work.lang,
-                            folder_path=folder_path,
-                            folder_size=snapshot.folder_size,
-                            file_count=snapshot.file_count,
-                            work_name=work_info.get('title', '') if work_info else ""
-                        ))
-                        logger.debug(f"发现库中关联作品: {workno} ({linked_work.work_type})")
-                else:
-                    # 扫描目录
-                    library_path = Path(self.config.storage.library_path)
-                    for folder in library_path.rglob('*'):
-                        if folder.is_dir() and workno in folder.name:
-                            work_info = await self.dlsite_service.get_work_info(workno)
-                            
-                            found.append(LinkedWorkInLibrary(
-                                rjcode=workno,
-                                work_type=linked_work.work_type,
-                                lang=linked_work.lang,
-                                folder_path=str(folder),
-                                folder_size=self._get_folder_size(str(folder)),
-                                file_count=self._get_file_count(str(folder)),
-                                work_name=work_info.get('title', '') if work_info else ""
-                            ))
-                            break
+        for workno, linked_work in linked_works.items():
+            # 跳过当前检查的 RJ 号
+            if workno == exclude_rjcode:
+                continue
             
-            return found
-        finally:
-            db.close()
+            existing = await library_index.lookup_async(workno)
+            if not existing:
+                continue
+            
+            # 获取作品信息
+            work_info = await self.dlsite_service.get_work_info(workno)
+            
+            found.append(LinkedWorkInLibrary(
+                rjcode=workno,
+                work_type=linked_work.work_type,
+                lang=linked_work.lang,
+                folder_path=existing['path'],
+                folder_size=existing['size'],
+                file_count=existing['file_count'],
+                work_name=work_info.get('title', '') if work_info else ""
+            ))
+            logger.debug(f"发现库中关联作品: {workno} ({linked_work.work_type})")
+        
+        return found
     
     def _analyze_linked_works(
         self,
@@ -329,22 +284,6 @@ class EnhancedDuplicateService:
         
         return analysis
     
-    def _get_folder_size(self, folder_path: str) -> int:
-        """获取文件夹大小"""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-        return total_size
-    
-    def _get_file_count(self, folder_path: str) -> int:
-        """获取文件数量"""
-        count = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            count += len(filenames)
-        return count
-    
     def _get_lang_priority(self, lang: str) -> int:
         """获取语言优先级，数字越小优先级越高"""
         priorities = {
@@ -540,11 +479,94 @@ class EnhancedDuplicateService:
         
         return options
     
+    def batch_check(
+        self,
+        check_linked_works: bool = True,
+        cue_languages: List[str] = None,
+        concurrency: Optional[int] = None
+    ) -> 'BatchDuplicateCheck':
+        """创建一批作品的并发查重（见 BatchDuplicateCheck）"""
+        if concurrency is None:
+            concurrency = self.config.metadata.duplicate_check_concurrency
+        return BatchDuplicateCheck(self, check_linked_works, cue_languages, concurrency)
+    
     async def close(self):
         """清理资源"""
         await self.dlsite_service.close()
 
 
+class BatchDuplicateCheck:
+    """一批作品的并发查重
+    
+    - 同一 RJ 号只检查一次，多个文件夹共享结果
+    - 同一关联分量只解析一次（关联图存储或 DLsite），分量中的其他作品直接复用
+    - 最多 concurrency 个作品同时查询，DLsite 请求速率由共享客户端的令牌桶控制
+    """
+    
+    def __init__(
+        self,
+        service: EnhancedDuplicateService,
+        check_linked_works: bool = True,
+        cue_languages: List[str] = None,
+        concurrency: int = 8
+    ):
+        self.service = service
+        self.check_linked_works = check_linked_works
+        self.cue_languages = cue_languages
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._results: Dict[str, asyncio.Task] = {}
+        # RJ号 -> 所在关联分量的解析结果（分量中的所有成员共享同一个 Future）
+        self._components: Dict[str, asyncio.Future] = {}
+    
+    async def check(self, rjcode: str) -> DuplicateCheckResult:
+        """检查一个作品；同一 RJ 号的重复调用等待同一个结果"""
+        code = rjcode.upper()
+        task = self._results.get(code)
+        if task is None:
+            task = asyncio.ensure_future(self._check(code))
+            self._results[code] = task
+        # 某个调用方被取消不影响其他等待者
+        return await asyncio.shield(task)
+    
+    async def _check(self, rjcode: str) -> DuplicateCheckResult:
+        async with self._semaphore:
+            component = None
+            # 直接重复时不需要关联分量
+            if self.check_linked_works and not await get_library_index().lookup_async(rjcode):
+                component = await self._resolve_component(rjcode)
+            return await self.service.check_duplicate_enhanced(
+                rjcode,
+                check_linked_works=self.check_linked_works,
+                cue_languages=self.cue_languages,
+                component=component
+            )
+    
+    async def _resolve_component(self, rjcode: str) -> Optional[Dict[str, LinkedWork]]:
+        future = self._components.get(rjcode)
+        if future is not None:
+            return await future
+        
+        future = asyncio.get_running_loop().create_future()
+        self._components[rjcode] = future
+        works = None
+        try:
+            works = await self.service.dlsite_service.get_component(rjcode)
+        except Exception as e:
+            # 交给 check_duplicate_enhanced 重新获取并记录错误
+            logger.warning(f"[批量查重] 获取关联分量失败: {rjcode}, {e}")
+        finally:
+            # 被取消时也要让等待同一分量的其他检查继续
+            future.set_result(works)
+        for member in works or ():
+            self._components.setdefault(member.upper(), future)
+        return works
+    
+    def cancel(self):
+        """取消尚未完成的检查（客户端断开时调用）"""
+        for task in self._results.values():
+            task.cancel()
+
+
 # 全局服务实例
 _duplicate_service: Optional[EnhancedDuplicateService] = None
 
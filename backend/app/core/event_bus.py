@@ -0,0 +1,165 @@
+"""服务端事件推送
+
+把任务进度、问题作品、监视器状态等变化通过 /api/events（SSE）推送给前端，替代前端轮询。
+
+- 每个事件带递增的序号，最近的事件保存在环形缓冲区中，客户端断线重连时从上次的序号继续；
+  缓冲区已覆盖掉需要的事件时发送 reset，客户端重新拉取完整状态
+- 序号在重启后从 0 开始，事件 id 带上进程的启动标识（"<boot_id>-<seq>"），
+  重连时启动标识不同（后端已重启）或序号超过当前序号时同样发送 reset
+- 同一个 key（如同一个任务）的事件按最小间隔节流，间隔内只保留最后一个，到时再发出
+- publish 可以在任意线程调用（监视器的文件事件在 watchdog 线程中）
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """进程内事件总线"""
+
+    def __init__(self, buffer_size: int = 1000, min_interval: float = 0.25):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.min_interval = min_interval  # 同一 key 的最小发送间隔（秒）
+        self._buffer: Deque[Dict] = deque(maxlen=buffer_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_emit: Dict[str, float] = {}  # key -> 上次发送时间
+        self._pending: Dict[str, Dict] = {}  # key -> 节流中等待发送的最新事件
+        self.subscribers = 0
+        self.published = 0
+        self.coalesced = 0
+
+    def event_id(self, seq: int) -> str:
+        """SSE 事件 id：启动标识和序号"""
+        return f"{self.boot_id}-{seq}"
+
+    def parse_event_id(self, event_id: str) -> int:
+        """从客户端的 Last-Event-ID 取出序号；不是本进程的 id 时返回 -1（订阅时发送 reset）"""
+        boot_id, _, seq = event_id.rpartition('-')
+        if boot_id != self.boot_id or not seq.isdigit():
+            return -1
+        return int(seq)
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """绑定事件循环（服务启动时调用），其他线程的 publish 转到该循环执行"""
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def publish(self, event_type: str, data: Dict, key: Optional[str] = None):
+        """发布事件；key 相同的事件会被节流合并"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        event = {'type': event_type, 'data': data}
+        if running is loop:
+            self._publish(event, key)
+        else:
+            loop.call_soon_threadsafe(self._publish, event, key)
+
+    def _publish(self, event: Dict, key: Optional[str]):
+        if key is None:
+            self._emit(event)
+            return
+
+        if key in self._pending:
+            # 已有等待发送的事件，替换成最新的
+            self._pending[key] = event
+            self.coalesced += 1
+            return
+
+        now = time.monotonic()
+        wait = self._last_emit.get(key, 0) + self.min_interval - now
+        if wait > 0:
+            self._pending[key] = event
+            self._loop.call_later(wait, self._flush_key, key)
+            return
+
+        self._last_emit[key] = now
+        self._emit(event)
+
+    def _flush_key(self, key: str):
+        event = self._pending.pop(key, None)
+        if event is not None:
+            self._last_emit[key] = time.monotonic()
+            self._emit(event)
+
+    def _emit(self, event: Dict):
+        self.seq += 1
+        self.published += 1
+        self._buffer.append({'seq': self.seq, 'ts': time.time(), **event})
+
+        # 清理已过节流间隔的 key，避免任务 ID 不断累积
+        if len(self._last_emit) > 4096:
+            cutoff = time.monotonic() - self.min_interval
+            self._last_emit = {k: t for k, t in self._last_emit.items() if t > cutoff}
+
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def _events_after(self, since: int) -> list:
+        """序号 since 之后的事件；缓冲区已不完整或 since 不是本进程的序号时返回 reset 事件"""
+        if since == self.seq:
+            return []
+        oldest = self._buffer[0]['seq'] if self._buffer else self.seq + 1
+        if since < oldest - 1 or since > self.seq:
+            return [{'seq': self.seq, 'ts': time.time(), 'type': 'reset', 'data': {}}]
+        return [event for event in self._buffer if event['seq'] > since]
+
+    async def subscribe(self, since: Optional[int] = None, heartbeat: float = 15) -> AsyncIterator[Optional[Dict]]:
+        """订阅事件，从序号 since 之后开始（None 表示只接收新事件，-1 表示先发送 reset）
+
+        超过 heartbeat 秒没有事件时产出 None，供调用方发送心跳。
+        """
+        if self._wakeup is None:
+            self.bind_loop(asyncio.get_running_loop())
+        last = self.seq if since is None else since
+        self.subscribers += 1
+        try:
+            while True:
+                wakeup = self._wakeup
+                events = self._events_after(last)
+                if events:
+                    for event in events:
+                        yield event
+                    # reset 的序号为当前序号，之后从当前序号继续
+                    last = events[-1]['seq']
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+    def get_stats(self) -> Dict:
+        return {
+            'boot_id': self.boot_id,
+            'seq': self.seq,
+            'subscribers': self.subscribers,
+            'published': self.published,
+            'coalesced': self.coalesced,
+            'buffered': len(self._buffer),
+        }
+
+
+# 全局事件总线实例
+_event_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """获取事件总线实例（单例）"""
+    global _event_bus
+    if _event_bus is None:
+        _event_bus = EventBus()
+    return _event_bus
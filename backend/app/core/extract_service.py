@@ -4,13 +4,17 @@ import shutil
 import subprocess
 import asyncio
 import sys
+import unicodedata
 import filetype
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable, Awaitable
 from pathlib import Path
 import logging
 
 from ..config.settings import get_config
 from ..core.task_engine import Task
+from .stage_pools import get_stage_pools
+from .file_stability import get_stability_monitor
+from . import zip_backend
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +28,7 @@ class ArchiveInfo:
     """压缩包信息"""
     def __init__(self, path: str, file_list: List[Dict], password: Optional[str] = None):
         self.path = path
-        self.file_list = file_list  # [{"name": "...", "size": 123, "crc": "..."}, ...]
+        self.file_list = file_list  # [{"name": "...", "size": 123, "crc": "...", "is_dir": False, "encrypted": False}, ...]
         self.password = password
         self.is_volume = False
         self.volume_set: Optional[List[str]] = None
@@ -32,6 +36,10 @@ class ArchiveInfo:
 class ExtractService:
     """解压服务"""
     
+    def __init__(self):
+        # (路径, 大小, 修改时间) -> 内置 ZIP 后端使用的文件名编码，None 表示需要使用 7z
+        self._zip_encodings: Dict[tuple, Optional[str]] = {}
+    
     @property
     def config(self):
         """动态获取最新配置"""
@@ -86,12 +94,12 @@ class ExtractService:
         解压压缩包
         返回解压后的目录路径
         """
-        # 首先检查 7z 是否可用
-        if not self._check_7z_available():
-            raise Exception("找不到 7z 可执行文件。请安装 7-Zip 并确保它在 PATH 中，或在配置中指定正确路径。")
-        
         archive_path = task.source_path
         
+        # 首先检查 7z 是否可用（内置 ZIP 后端能处理的压缩包不需要 7z）
+        if not await self._zip_encoding(archive_path) and not self._check_7z_available():
+            raise Exception("找不到 7z 可执行文件。请安装 7-Zip 并确保它在 PATH 中，或在配置中指定正确路径。")
+        
         # 检查是否被取消
         if task.is_cancelled():
             logger.info(f"任务 {task.id} 已被取消，跳过解压")
@@ -130,6 +138,12 @@ class ExtractService:
             logger.info(f"任务 {task.id} 在等待分卷后被取消")
             return None
         
+        # 4~8. 读取、解压、验证（占用解压阶段的并发名额）
+        async with get_stage_pools().slot('extract'):
+            return await self._extract_archive(archive_path, task)
+
+    async def _extract_archive(self, archive_path: str, task: Task) -> Optional[str]:
+        """读取压缩包内容、解压、验证并处理嵌套压缩包"""
         # 4. 获取压缩包内文件列表
         task.update_progress(20, "读取压缩包内容")
         archive_info = await self._get_archive_info(archive_path)
@@ -301,22 +315,18 @@ class ExtractService:
                                 if not success:
                                     logger.info(f"使用常规密码解压嵌套压缩包失败，尝试从密码库查找密码: {filename}")
                                     vault_passwords = await self._get_passwords_for_archive(file_path)
+                                    vault_passwords = [
+                                        pwd for pwd in vault_passwords
+                                        if pwd != nested_archive_info.password and pwd != parent_password
+                                    ]
                                     if vault_passwords:
-                                        for pwd in vault_passwords:
-                                            if pwd != nested_archive_info.password and pwd != parent_password:
-                                                logger.info(f"尝试使用密码库密码解压嵌套压缩包: {filename}")
-                                                # 重新获取压缩包信息
-                                                new_info = await self._get_nested_archive_info(file_path, pwd)
-                                                if new_info:
-                                                    success, nested_success_password = await self._try_extract_nested(
-                                                        new_info, 
-                                                        nested_output_dir, 
-                                                        task,
-                                                        pwd
-                                                    )
-                                                    if success:
-                                                        nested_archive_info = new_info
-                                                        break
+                                        success, nested_success_password = await self._probe_and_extract(
+                                            nested_archive_info,
+                                            nested_output_dir,
+                                            vault_passwords,
+                                            task,
+                                            lambda pwd: "密码库"
+                                        )
                                 
                                 if success:
                                     logger.info(f"成功解压嵌套压缩包: {filename} (使用密码: {nested_success_password or '无密码'})")
@@ -400,12 +410,12 @@ class ExtractService:
                 unique_passwords.append(pwd)
         
         # 尝试所有密码，找到能读取内容的
-        for password in unique_passwords:
-            file_list = await self._list_archive_contents(archive_path, password)
-            if file_list is not None:
-                source = "父密码" if password == parent_password else ("无密码" if password == "" else "通用密码")
-                logger.info(f"成功读取嵌套压缩包内容，使用: {source} ({password or '无密码'})")
-                return ArchiveInfo(archive_path, file_list, password)
+        found = await self._find_list_password(archive_path, unique_passwords)
+        if found:
+            password, file_list = found
+            source = "父密码" if password == parent_password else ("无密码" if password == "" else "通用密码")
+            logger.info(f"成功读取嵌套压缩包内容，使用: {source} ({password or '无密码'})")
+            return ArchiveInfo(archive_path, file_list, password)
         
         return None
     
@@ -437,114 +447,32 @@ class ExtractService:
         
         logger.info(f"开始尝试解压嵌套压缩包，共 {len(password_list)} 个密码")
         
-        for password, source in password_list:
-            cmd = [
-                self.seven_zip, 'x',
-                '-y',  # 自动确认
-                '-o' + output_path,  # 输出目录
-                archive_info.path
-            ]
-            
-            if password:
-                cmd.append(f'-p{password}')
-            else:
-                cmd.append('-p')  # 空密码
-            
-            try:
-                logger.info(f"尝试解压嵌套压缩包使用: {source} ({password or '无密码'})")
-                result = await self._run_7z_command(cmd)
-                
-                if result.returncode == 0:
-                    logger.info(f"嵌套压缩包解压成功，使用: {source} ({password or '无密码'})")
-                    # 更新archive_info中的密码，用于传递给下一层
-                    archive_info.password = password
-                    return True, password
-                else:
-                    logger.warning(f"密码 {source} ({password or '无密码'}) 解压失败")
-                
-            except Exception as e:
-                logger.warning(f"嵌套压缩包解压尝试失败: {e}")
-                continue
-        
-        logger.error(f"嵌套压缩包解压失败，已尝试所有 {len(password_list)} 个密码")
-        return False, None
+        sources = {password: source for password, source in reversed(password_list)}
+        success, password = await self._probe_and_extract(
+            archive_info,
+            output_path,
+            [password for password, _source in password_list],
+            task,
+            lambda pwd: sources.get(pwd, "通用密码")
+        )
+        if not success:
+            logger.error(f"嵌套压缩包解压失败，已尝试所有 {len(password_list)} 个密码")
+        return success, password
     
     async def _wait_file_stable(self, file_path: str, task: Optional[Task] = None, max_wait: int = 3600):
-        """等待文件大小稳定（文件复制完成检测）"""
+        """等待文件复制完成（优先使用监视器的文件事件，见 file_stability）"""
         config = self.config.processing
-        previous_size = -1
-        stable_count = 0
-        start_time = asyncio.get_event_loop().time()
-        last_progress_time = start_time
-        
         logger.info(f"开始等待文件复制完成: {file_path}")
-        
-        while stable_count < config.file_stable_checks:
-            current_time = asyncio.get_event_loop().time()
-            
-            # 检查总超时
-            if current_time - start_time > max_wait:
-                raise TimeoutError(f"等待文件复制完成超时 ({max_wait}秒): {file_path}")
-            
-            # 检查任务是否被取消
-            if task and task.is_cancelled():
-                logger.info(f"任务在等待文件复制时被取消: {file_path}")
-                return
-            
-            # 检查任务是否暂停
-            if task:
-                await task.wait_if_paused()
-            
-            try:
-                # 检查文件是否存在
-                if not os.path.exists(file_path):
-                    await asyncio.sleep(config.file_stable_interval)
-                    continue
-                
-                # 获取文件大小
-                current_size = os.path.getsize(file_path)
-                
-                # 检查文件是否为空或太小（可能是刚开始复制）
-                if current_size < 1024:  # 小于1KB认为可能是刚开始复制
-                    logger.debug(f"文件太小 ({current_size} bytes)，等待更多数据写入...")
-                    await asyncio.sleep(config.file_stable_interval)
-                    continue
-                
-                # 检查文件大小是否稳定
-                if current_size == previous_size:
-                    stable_count += 1
-                    # 尝试打开文件检查是否被锁定
-                    try:
-                        with open(file_path, 'rb') as f:
-                            # 尝试读取文件开头（检查是否可以访问）
-                            f.read(1)
-                        # 如果成功读取且稳定次数达标，认为文件已复制完成
-                        if stable_count >= config.file_stable_checks:
-                            logger.info(f"文件复制完成检测通过: {file_path} ({current_size} bytes)")
-                            return
-                    except (PermissionError, OSError):
-                        # 文件仍被锁定，重置稳定计数
-                        logger.debug(f"文件仍被锁定，继续等待: {file_path}")
-                        stable_count = 0
-                else:
-                    # 文件大小在变化，正在复制中
-                    if stable_count > 0:
-                        logger.info(f"文件仍在复制中，当前大小: {current_size} bytes")
-                    stable_count = 0
-                    last_progress_time = current_time
-                
-                previous_size = current_size
-                
-                # 如果长时间没有进度，发出警告
-                if current_time - last_progress_time > 60:  # 1分钟没有变化
-                    logger.warning(f"文件复制可能已停滞: {file_path}, 当前大小: {current_size} bytes")
-                    
-            except Exception as e:
-                logger.warning(f"等待文件稳定时出错: {e}")
-                await asyncio.sleep(config.file_stable_interval)
-                continue
-            
-            await asyncio.sleep(config.file_stable_interval)
+        completed = await get_stability_monitor().wait_stable(
+            file_path,
+            checks=config.file_stable_checks,
+            interval=config.file_stable_interval,
+            max_wait=max_wait,
+            should_stop=lambda: task is not None and task.is_cancelled(),
+            before_check=task.wait_if_paused if task else None
+        )
+        if not completed:
+            logger.info(f"任务在等待文件复制时被取消: {file_path}")
     
     async def _repair_extension(self, file_path: str) -> str:
         """修复文件后缀名和文件名
@@ -1059,14 +987,11 @@ class ExtractService:
             if task:
                 await task.wait_if_paused()
             
-            all_stable = True
-            for volume in volume_set.volumes:
-                if not os.path.exists(volume):
-                    all_stable = False
-                    break
-                if not await self._is_file_stable_quick(volume):
-                    all_stable = False
-                    break
+            # 所有分卷都存在后并发检查是否都已写入完成
+            all_stable = (
+                all(os.path.exists(volume) for volume in volume_set.volumes)
+                and await get_stability_monitor().all_quiet(volume_set.volumes)
+            )
             
             if all_stable:
                 return True
@@ -1075,24 +1000,19 @@ class ExtractService:
         
         return False
     
-    async def _is_file_stable_quick(self, file_path: str) -> bool:
-        """快速检查文件是否稳定（只检查一次）"""
-        try:
-            size1 = os.path.getsize(file_path)
-            await asyncio.sleep(2)
-            size2 = os.path.getsize(file_path)
-            return size1 == size2
-        except OSError:
-            return False
-    
     async def _get_passwords_for_archive(self, archive_path: str) -> List[str]:
         """从密码库查找适合该压缩包的密码列表
         
         返回按优先级排序的密码列表：
         1. RJ号匹配的密码
         2. 文件名匹配的密码
-        3. 通用的密码（无RJ号和文件名）
+        3. 通用的密码（无RJ号和文件名，按使用次数和最近使用时间排序）
         """
+        matched, generic = self._get_vault_passwords(archive_path)
+        return matched + [pwd for pwd in generic if pwd not in matched]
+    
+    def _get_vault_passwords(self, archive_path: str) -> tuple[List[str], List[str]]:
+        """从密码库查找密码，返回 (RJ号/文件名匹配的密码, 通用密码)"""
         from ..models.database import PasswordEntry, get_db
         from pathlib import Path
         
@@ -1103,33 +1023,37 @@ class ExtractService:
         rjcode = rj_match.group(0).upper() if rj_match else None
         
         db = next(get_db())
-        passwords = []
+        matched = []
+        generic = []
         
         try:
             # 1. 首先尝试精确匹配RJ号
             if rjcode:
                 entries = db.query(PasswordEntry).filter(PasswordEntry.rjcode == rjcode).all()
                 for entry in entries:
-                    passwords.append(entry.password)
+                    matched.append(entry.password)
                     logger.info(f"找到RJ号匹配的密码: {rjcode}")
             
             # 2. 其次尝试文件名匹配
             entries = db.query(PasswordEntry).filter(PasswordEntry.filename == filename).all()
             for entry in entries:
-                if entry.password not in passwords:
-                    passwords.append(entry.password)
+                if entry.password not in matched:
+                    matched.append(entry.password)
                     logger.info(f"找到文件名匹配的密码: {filename}")
             
             # 3. 最后添加通用密码（无RJ号和文件名的密码）
             generic_entries = db.query(PasswordEntry).filter(
                 PasswordEntry.rjcode.is_(None),
                 PasswordEntry.filename.is_(None)
+            ).order_by(
+                PasswordEntry.use_count.desc(),
+                PasswordEntry.last_used_at.desc()
             ).all()
             for entry in generic_entries:
-                if entry.password not in passwords:
-                    passwords.append(entry.password)
+                if entry.password not in generic:
+                    generic.append(entry.password)
             
-            return passwords
+            return matched, generic
         finally:
             db.close()
     
@@ -1175,55 +1099,94 @@ class ExtractService:
             logger.debug(f"从文件名提取RJ号生成密码: {passwords}")
         return passwords
 
+    def _get_candidate_passwords(
+        self,
+        archive_path: str,
+        known_password: Optional[str] = None,
+        encrypted: bool = False
+    ) -> tuple[List[str], Dict[str, str]]:
+        """构建候选密码列表，返回 (排序后的密码列表, 密码 -> 来源)
+        
+        已知密码（能解开加密文件头的密码一定正确）和密码库中RJ号/文件名匹配的密码固定在最前，
+        其余密码（RJ号派生、通用密码、无密码、默认密码）按历史命中率排序。
+        清单显示有加密文件（encrypted）时不再尝试无密码
+        """
+        from .password_ranking import get_password_ranker
+        
+        matched, generic = self._get_vault_passwords(archive_path)
+        rj_passwords = self._get_rj_passwords(archive_path)
+        default_passwords = list(self.config.extract.password_list)
+        
+        # 密码来源（按优先级，先出现的来源优先）
+        sources: Dict[str, str] = {}
+        for passwords, source in (
+            (rj_passwords, "RJ号"),
+            (matched + generic, "密码库"),
+            ([known_password] if known_password else [], "已知"),
+            ([] if encrypted else [""], "无"),
+            (default_passwords, "默认")
+        ):
+            for pwd in passwords:
+                sources.setdefault(pwd, source)
+        
+        pinned = ([known_password] if known_password else []) + matched
+        learned = [
+            pwd for pwd in dict.fromkeys(rj_passwords + generic + [""] + default_passwords)
+            if pwd not in pinned and not (encrypted and pwd == "")
+        ]
+        ranked = get_password_ranker().rank(archive_path, learned, rj_passwords)
+        
+        return list(dict.fromkeys(pinned + ranked)), sources
+    
     async def _get_archive_info(self, archive_path: str) -> Optional[ArchiveInfo]:
         """获取压缩包信息（文件列表、大小等）
 
         注意：这里只获取文件列表，不解压。真正能解压的密码在 _try_extract 中确定。
         为了不限制解压时的密码选择，这里尝试找一个能读取内容的密码即可。
         """
-        # 从密码库查找所有相关密码
-        vault_passwords = await self._get_passwords_for_archive(archive_path)
-
-        # 获取RJ号相关密码
-        rj_passwords = self._get_rj_passwords(archive_path)
-
-        # 构建密码列表：RJ号密码优先，然后密码库密码，最后是配置中的默认密码
-        password_list = []
-        password_list.extend(rj_passwords)  # RJ号密码（RJ号, RJ号+1, RJ号-1）
-        password_list.extend(vault_passwords)  # 密码库密码
-        password_list.append("")  # 无密码
-        password_list.extend(self.config.extract.password_list)  # 默认密码
+        unique_passwords, sources = self._get_candidate_passwords(archive_path)
         
-        # 去重（保持顺序）
-        seen = set()
-        unique_passwords = []
-        for pwd in password_list:
-            if pwd not in seen:
-                seen.add(pwd)
-                unique_passwords.append(pwd)
-        
-        for password in unique_passwords:
-            file_list = await self._list_archive_contents(archive_path, password)
-            if file_list is not None:
-                # 判断密码来源
-                if password in rj_passwords:
-                    source = "RJ号"
-                elif password in vault_passwords:
-                    source = "密码库"
-                elif password in self.config.extract.password_list:
-                    source = "默认"
-                else:
-                    source = "无"
-                logger.info(f"成功读取压缩包内容，使用密码来源: {source} ({password or '无密码'})")
-                # 注意：这里返回的 password 只是能读取内容的密码，不一定能解压
-                # 真正能解压的密码会在 _try_extract 中更新
-                return ArchiveInfo(archive_path, file_list, password)
+        found = await self._find_list_password(archive_path, unique_passwords)
+        if found:
+            password, file_list = found
+            source = sources.get(password, "无")
+            logger.info(f"成功读取压缩包内容，使用密码来源: {source} ({password or '无密码'})")
+            # 注意：文件头未加密时这里返回空密码，真正能解压的密码会在 _try_extract 中更新
+            return ArchiveInfo(archive_path, file_list, password)
         
         return None
     
+    async def _zip_encoding(self, archive_path: str) -> Optional[str]:
+        """内置 ZIP 后端能处理该压缩包时返回文件名编码，否则返回 None（使用 7z）"""
+        if not self.config.extract.builtin_zip:
+            return None
+        try:
+            stat = os.stat(archive_path)
+        except OSError:
+            return None
+        
+        key = (archive_path, stat.st_size, stat.st_mtime_ns)
+        if key not in self._zip_encodings:
+            raw = await asyncio.to_thread(zip_backend.raw_names, archive_path)
+            if raw is None:
+                encoding = None
+            elif raw:
+                encoding = self._detect_best_encoding(raw)
+            else:
+                encoding = 'utf-8'  # 所有文件名都已标记为 UTF-8
+            if encoding:
+                logger.info(f"[ZIP] 使用内置后端处理: {os.path.basename(archive_path)} (编码: {encoding})")
+            self._zip_encodings[key] = encoding
+        return self._zip_encodings[key]
+    
     async def _list_archive_contents(self, archive_path: str, password: str = "") -> Optional[List[Dict]]:
-        """列出压缩包内容，自动检测最佳编码"""
-        cmd = [self.seven_zip, 'l', '-ba', archive_path]
+        """列出压缩包内容（-slt 技术信息：文件名、大小、CRC、是否加密），自动检测最佳编码"""
+        encoding = await self._zip_encoding(archive_path)
+        if encoding:
+            # ZIP 文件头不加密，无需密码即可列出
+            return await asyncio.to_thread(zip_backend.list_contents, archive_path, encoding)
+        
+        cmd = [self.seven_zip, 'l', '-ba', '-slt', archive_path]
         if password:
             # Windows下使用 -p密码 格式（无空格），与7z官方用法一致
             cmd.append(f'-p{password}')
@@ -1320,98 +1283,260 @@ class ExtractService:
         return int(score)
     
     def _parse_7z_list_output(self, output: str) -> List[Dict]:
-        """解析7z列表输出"""
-        files = []
-        # 7z l -ba 输出格式: 日期 时间 属性 大小 压缩大小 文件名
-        pattern = r'^(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}:\d{2})\s+([D.][R.][H.][S.][A.])\s+(\d+)\s+(\d+)?\s+(.+)$'
+        """解析 7z l -slt 输出
         
-        for line in output.strip().split('\n'):
-            match = re.match(pattern, line)
-            if match:
-                size = int(match.group(4))
-                name = match.group(6)
-                files.append({
-                    'name': name,
-                    'size': size,
-                    'is_dir': 'D' in match.group(3)
-                })
+        每个文件是一段 "键 = 值" 块，块之间以空行分隔；带有 Type 字段的块是压缩包本身的信息，跳过
+        """
+        files = []
+        blocks = re.split(r'\r?\n\s*\r?\n', re.sub(r'^-{10}\s*$', '', output, flags=re.MULTILINE))
+        
+        for block in blocks:
+            props = {}
+            for line in block.splitlines():
+                key, sep, value = line.partition(' = ')
+                if sep:
+                    props[key.strip()] = value
+            
+            name = props.get('Path')
+            if not name or 'Type' in props:
+                continue
+            try:
+                size = int(props.get('Size') or 0)
+            except ValueError:
+                size = 0
+            files.append({
+                'name': name,
+                'size': size,
+                'crc': props.get('CRC') or None,
+                'is_dir': props.get('Folder') == '+' or props.get('Attributes', '').startswith('D'),
+                'encrypted': props.get('Encrypted') == '+'
+            })
         
         return files
     
     async def _try_extract(self, archive_info: ArchiveInfo, output_path: str, task: Task) -> tuple[bool, Optional[str]]:
         """尝试解压，返回 (是否成功, 成功使用的密码)"""
-        # 再次从密码库查找所有相关密码（以防用户在处理过程中添加了新密码）
-        vault_passwords = await self._get_passwords_for_archive(archive_info.path)
-
-        # 获取RJ号相关密码
-        rj_passwords = self._get_rj_passwords(archive_info.path)
-
-        # 构建密码列表：RJ号密码优先，然后密码库密码，已知密码，最后是默认密码
-        password_list = []
-        password_list.extend(rj_passwords)  # RJ号密码（RJ号, RJ号+1, RJ号-1）
-        password_list.extend(vault_passwords)  # 密码库密码
-        if archive_info.password and archive_info.password not in password_list:
-            password_list.append(archive_info.password)
-        password_list.append("")  # 无密码
-        password_list.extend(self.config.extract.password_list)  # 默认密码
+        from .password_ranking import get_password_ranker
+        
+        # 再次构建候选密码（以防用户在处理过程中添加了新密码），按历史命中率排序
+        encrypted = any(f.get('encrypted') for f in archive_info.file_list or [])
+        unique_passwords, sources = self._get_candidate_passwords(
+            archive_info.path, archive_info.password, encrypted
+        )
+        
+        misses: List[str] = []
+        success, password = await self._probe_and_extract(
+            archive_info,
+            output_path,
+            unique_passwords,
+            task,
+            lambda pwd: sources.get(pwd, "默认"),
+            misses
+        )
+        
+        # 记录命中与未命中，用于后续排序（无密码即可解压的压缩包未加密，不计入）
+        if not (success and password == ""):
+            get_password_ranker().record(
+                archive_info.path,
+                password if success else None,
+                misses,
+                self._get_rj_passwords(archive_info.path)
+            )
+        # 记录成功使用的密码
+        if success and password and sources.get(password) == "密码库":
+            await self._record_password_usage(password, archive_info.path)
+        return success, password
+    
+    async def _probe_passwords(self, candidates: List[str], probe: Callable[[str], Awaitable[bool]]) -> Optional[str]:
+        """并行探测密码
         
-        # 去重（保持顺序）
-        seen = set()
-        unique_passwords = []
-        for pwd in password_list:
-            if pwd not in seen:
-                seen.add(pwd)
-                unique_passwords.append(pwd)
+        排名第一的候选先单独探测（排序准确时只需一次 7z 调用），失败后其余候选按顺序并行探测
+        （同时运行的 7z 进程数受 password_probe_concurrency 限制），任一密码通过后立即取消其余探测。
+        返回通过探测的密码，全部失败返回 None
+        """
+        if not candidates:
+            return None
+        
+        semaphore = asyncio.Semaphore(max(1, self.config.extract.password_probe_concurrency))
+        
+        async def run(password: str) -> bool:
+            async with semaphore:
+                try:
+                    return await probe(password)
+                except Exception as e:
+                    logger.warning(f"密码探测失败: {e}")
+                    return False
+        
+        if await run(candidates[0]):
+            return candidates[0]
+        
+        probes = {asyncio.create_task(run(password)): password for password in candidates[1:]}
+        pending = set(probes)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for probe_task in done:
+                    if probe_task.result():
+                        return probes[probe_task]
+            return None
+        finally:
+            for probe_task in pending:
+                probe_task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def _find_list_password(self, archive_path: str, candidates: List[str]) -> Optional[tuple[str, List[Dict]]]:
+        """找到能读取压缩包文件列表的密码，返回 (密码, 文件列表)
+        
+        文件头未加密时无需密码即可列出内容；只有文件头加密（如 7z -mhe）时才并行探测候选密码
+        """
+        file_list = await self._list_archive_contents(archive_path, "")
+        if file_list is not None:
+            return "", file_list
+        
+        file_lists: Dict[str, List[Dict]] = {}
+        
+        async def probe(password: str) -> bool:
+            result = await self._list_archive_contents(archive_path, password)
+            if result is None:
+                return False
+            file_lists[password] = result
+            return True
+        
+        password = await self._probe_passwords([pwd for pwd in candidates if pwd], probe)
+        if password is None:
+            return None
+        return password, file_lists[password]
+    
+    def _pick_probe_entry(self, file_list: List[Dict]) -> Optional[str]:
+        """选择用于测试密码的文件：最小的非空加密文件
+        
+        只选择纯 ASCII 文件名，避免 7z 因文件名编码不同而匹配不到文件；
+        未加密的文件任何密码都能通过测试，所以清单标明了加密文件时只从加密文件中选
+        """
+        files = file_list or []
+        if any(f.get('encrypted') for f in files):
+            files = [f for f in files if f.get('encrypted')]
+        candidates = [
+            f for f in files
+            if not f.get('is_dir') and f.get('size', 0) > 0
+            and f['name'].isascii()
+            and not any(c in f['name'] for c in '*?')
+            and not f['name'].startswith(('-', '@'))
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda f: f['size'])['name']
+    
+    async def _test_password(self, archive_path: str, password: str, entry: Optional[str] = None) -> bool:
+        """用 7z t 测试密码（指定 entry 时只测试该文件，不写入磁盘；普通 ZIP 在进程内测试）"""
+        encoding = await self._zip_encoding(archive_path)
+        if encoding:
+            return await asyncio.to_thread(zip_backend.test_password, archive_path, password, entry, encoding)
+        
+        cmd = [self.seven_zip, 't', '-y', f'-p{password}' if password else '-p', archive_path]
+        if entry:
+            cmd.append(entry)
+        
+        result = await self._run_7z_command(cmd)
+        if result.returncode != 0:
+            return False
+        if entry and b'No files to process' in result.stdout:
+            logger.debug(f"[7z] 测试文件未匹配: {entry}")
+            return False
+        return True
+    
+    async def _extract_with_password(self, archive_path: str, output_path: str, password: str) -> bool:
+        """使用指定密码解压到输出目录"""
+        encoding = await self._zip_encoding(archive_path)
+        if encoding:
+            return await asyncio.to_thread(zip_backend.extract, archive_path, output_path, password, encoding)
+        
+        cmd = [
+            self.seven_zip, 'x',
+            '-y',  # 自动确认
+            '-o' + output_path,  # 输出目录
+            archive_path
+        ]
+        
+        if password:
+            # Windows下使用 -p密码 格式（无空格）
+            cmd.append(f'-p{password}')
+        else:
+            cmd.append('-p')  # 空密码
         
-        for password in unique_passwords:
-            cmd = [
-                self.seven_zip, 'x',
-                '-y',  # 自动确认
-                '-o' + output_path,  # 输出目录
-                archive_info.path
-            ]
+        try:
+            result = await self._run_7z_command(cmd)
+            return result.returncode == 0
+        except Exception as e:
+            logger.warning(f"解压尝试失败: {e}")
+            return False
+    
+    async def _probe_and_extract(
+        self,
+        archive_info: ArchiveInfo,
+        output_path: str,
+        candidates: List[str],
+        task: Task,
+        describe: Callable[[str], str],
+        misses: Optional[List[str]] = None
+    ) -> tuple[bool, Optional[str]]:
+        """先并行探测密码，再用探测到的密码执行真正的解压，返回 (是否成功, 成功使用的密码)
+        
+        优先只测试最小的文件；若探测到的密码解压失败（如部分文件未加密的 ZIP），
+        再以整包测试探测剩余密码。misses 用于收集已确认错误的密码
+        """
+        # 清单中没有加密文件时无需探测，直接用空密码解压（省去一次 7z t）
+        if archive_info.file_list and not archive_info.password and not any(
+            f.get('encrypted') for f in archive_info.file_list
+        ):
+            task.update_progress(40, "开始解压 (未加密)")
+            if await self._extract_with_password(archive_info.path, output_path, ""):
+                logger.info("解压成功，压缩包未加密")
+                return True, ""
+            logger.warning("压缩包清单显示未加密，但无密码解压失败，继续探测密码")
+        
+        remaining = list(candidates)
+        entry = self._pick_probe_entry(archive_info.file_list)
+        rounds = [entry, None] if entry else [None]
+        
+        for probe_entry in rounds:
+            if not remaining:
+                break
             
-            if password:
-                # Windows下使用 -p密码 格式（无空格）
-                cmd.append(f'-p{password}')
-            else:
-                cmd.append('-p')  # 空密码
+            async def probe(pwd: str, probe_entry: Optional[str] = probe_entry) -> bool:
+                passed = await self._test_password(archive_info.path, pwd, probe_entry)
+                if not passed and misses is not None:
+                    misses.append(pwd)
+                return passed
             
-            try:
-                # 判断密码来源
-                if password in rj_passwords:
-                    password_source = "RJ号"
-                elif password in vault_passwords:
-                    password_source = "密码库"
-                elif password == archive_info.password:
-                    password_source = "已知"
-                elif password == "":
-                    password_source = "无"
-                else:
-                    password_source = "默认"
-                task.update_progress(40, f"尝试解压 (密码来源: {password_source})")
-                result = await self._run_7z_command(cmd)
-                
-                if result.returncode == 0:
-                    # 记录成功使用的密码
-                    if password and password in vault_passwords:
-                        await self._record_password_usage(password, archive_info.path)
-                    # 更新 archive_info 中的密码，用于传递给嵌套压缩包
-                    archive_info.password = password
-                    logger.info(f"解压成功，使用{password_source}密码: {password or '无密码'}")
-                    return True, password
-                
-            except Exception as e:
-                logger.warning(f"解压尝试失败: {e}")
-                continue
+            task.update_progress(35, f"探测密码 (共 {len(remaining)} 个候选)")
+            password = await self._probe_passwords(remaining, probe)
+            if password is None:
+                break
+            remaining.remove(password)
+            
+            source = describe(password)
+            task.update_progress(40, f"尝试解压 (密码来源: {source})")
+            if await self._extract_with_password(archive_info.path, output_path, password):
+                # 更新 archive_info 中的密码，用于传递给嵌套压缩包
+                archive_info.password = password
+                logger.info(f"解压成功，使用{source}密码: {password or '无密码'}")
+                return True, password
+            logger.warning(f"密码 {source} ({password or '无密码'}) 通过探测但解压失败")
         
         return False, None
     
     async def _verify_extraction(self, archive_info: ArchiveInfo, output_path: str) -> bool:
-        """验证解压完整性"""
+        """验证解压完整性
+        
+        7z 解压时已校验 CRC，这里只用一次 os.scandir 遍历输出目录，与清单中的文件大小对比
+        """
         if not self.config.extract.verify_after_extract:
             return True
         
+        actual_sizes = await asyncio.to_thread(self._scan_output_sizes, output_path)
+        
         missing_files = []
         size_mismatch_files = []
         
@@ -1419,28 +1544,15 @@ class ExtractService:
             if expected.get('is_dir'):
                 continue
             
-            # 尝试多种可能的路径（处理编码问题）
-            possible_paths = [
-                os.path.join(output_path, expected['name']),  # 原始路径
-                os.path.join(output_path, expected['name'].encode('utf-8', errors='ignore').decode('utf-8', errors='ignore')),  # UTF-8
-                os.path.join(output_path, expected['name'].encode('cp932', errors='ignore').decode('cp932', errors='ignore')),  # Shift_JIS
-            ]
-            
-            found = False
-            for actual_path in set(possible_paths):  # 去重
-                if os.path.exists(actual_path):
-                    found = True
-                    actual_size = os.path.getsize(actual_path)
-                    if actual_size != expected['size']:
-                        size_mismatch_files.append({
-                            'name': expected['name'],
-                            'expected': expected['size'],
-                            'actual': actual_size
-                        })
-                    break
-            
-            if not found:
+            actual_size = actual_sizes.get(self._manifest_key(expected['name']))
+            if actual_size is None:
                 missing_files.append(expected['name'])
+            elif actual_size != expected['size']:
+                size_mismatch_files.append({
+                    'name': expected['name'],
+                    'expected': expected['size'],
+                    'actual': actual_size
+                })
         
         # 如果有文件缺失，记录警告但不失败（可能是编码问题）
         if missing_files:
@@ -1460,6 +1572,32 @@ class ExtractService:
         
         return True
     
+    @staticmethod
+    def _manifest_key(name: str) -> str:
+        """清单与磁盘文件名的比较键：统一路径分隔符和 Unicode 规范化形式"""
+        return unicodedata.normalize('NFC', name.replace('\\', '/').strip('/'))
+    
+    def _scan_output_sizes(self, output_path: str) -> Dict[str, int]:
+        """一次遍历输出目录，返回 {相对路径: 文件大小}"""
+        sizes: Dict[str, int] = {}
+        stack = [(output_path, '')]
+        while stack:
+            directory, prefix = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative = prefix + entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append((entry.path, relative + '/'))
+                            else:
+                                sizes[self._manifest_key(relative)] = entry.stat(follow_symlinks=False).st_size
+                        except OSError as e:
+                            logger.debug(f"读取文件信息失败: {entry.path}, {e}")
+            except OSError as e:
+                logger.warning(f"遍历解压目录失败: {directory}, {e}")
+        return sizes
+    
     def _cleanup_extract_path(self, output_path: str):
         """清理解压路径，包括所有残留文件和目录"""
         import shutil
@@ -1501,7 +1639,14 @@ class ExtractService:
                 **kwargs
             )
             
-            stdout, stderr = await process.communicate()
+            try:
+                stdout, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                # 探测被取消（如其他密码已成功）时结束子进程
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
             
             if process.returncode != 0:
                 logger.error(f"7z命令执行失败，返回码: {process.returncode}")
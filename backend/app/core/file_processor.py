@@ -17,6 +17,7 @@ import logging
 
 from ..config.settings import get_config
 from ..core.task_engine import Task, TaskType, get_task_engine
+from .file_stability import get_stability_monitor
 
 logger = logging.getLogger(__name__)
 
@@ -129,11 +130,7 @@ class FileProcessor:
 
             # 5. 检查是否已在任务队列中
             engine = get_task_engine()
-            existing = any(
-                t.source_path == file_path and t.status.value in ["pending", "processing"]
-                for t in engine.get_all_tasks()
-            )
-            if existing:
+            if engine.has_active_task(file_path):
                 logger.info(f"[FileProcessor] 文件已在任务队列中: {file_path}")
                 if mark_processed:
                     mark_processed(file_path)
@@ -356,7 +353,9 @@ class FileProcessor:
         return None
 
     async def wait_file_stable(self, file_path: str, max_wait: int = 300):
-        """等待文件稳定（大小不再变化）
+        """等待文件稳定（复制完成）
+
+        监视目录内的文件优先根据文件事件判断，其余按间隔比较文件大小，见 file_stability。
 
         Args:
             file_path: 文件路径
@@ -365,45 +364,7 @@ class FileProcessor:
         Raises:
             TimeoutError: 等待超时
         """
-        previous_size = -1
-        stable_count = 0
-        required_stable = 3  # 需要连续3次稳定
-        check_interval = 2  # 每2秒检查一次
-        start_time = asyncio.get_event_loop().time()
-
-        while stable_count < required_stable:
-            current_time = asyncio.get_event_loop().time()
-
-            # 检查超时
-            if current_time - start_time > max_wait:
-                raise TimeoutError(f"等待文件稳定超时: {file_path}")
-
-            try:
-                if not os.path.exists(file_path):
-                    await asyncio.sleep(check_interval)
-                    continue
-
-                current_size = os.path.getsize(file_path)
-
-                # 检查文件是否为空
-                if current_size < 1024:  # 小于1KB
-                    logger.debug(f"[FileProcessor] 文件太小，继续等待: {file_path} ({current_size} bytes)")
-                    stable_count = 0
-                elif current_size == previous_size:
-                    stable_count += 1
-                    logger.debug(f"[FileProcessor] 文件大小稳定 ({stable_count}/{required_stable}): {file_path}")
-                else:
-                    if previous_size != -1:
-                        logger.info(f"[FileProcessor] 文件仍在复制中: {file_path} ({previous_size} -> {current_size} bytes)")
-                    stable_count = 0
-
-                previous_size = current_size
-
-            except Exception as e:
-                logger.debug(f"[FileProcessor] 等待文件稳定时出错: {e}")
-                stable_count = 0
-
-            await asyncio.sleep(check_interval)
+        await get_stability_monitor().wait_stable(file_path, checks=3, interval=2, max_wait=max_wait)
 
     # ========== 私有方法 ==========
 
@@ -436,15 +397,14 @@ class FileProcessor:
             if mark_processed and not (is_processed and is_processed(volume)):
                 mark_processed(volume)
 
-        # 等待所有分卷稳定
-        for volume in volume_set.volumes:
-            if volume != file_path:
-                try:
-                    await self.wait_file_stable(volume, max_wait=300)
-                    logger.debug(f"[FileProcessor] 分卷已稳定: {volume}")
-                except TimeoutError:
-                    logger.error(f"[FileProcessor] 等待分卷稳定超时: {volume}")
-                    return None
+        # 并发等待其余分卷稳定
+        others = [volume for volume in volume_set.volumes if volume != file_path]
+        try:
+            await get_stability_monitor().wait_all_stable(others, checks=3, interval=2, max_wait=300)
+            logger.debug(f"[FileProcessor] 分卷已稳定: {others}")
+        except TimeoutError as e:
+            logger.error(f"[FileProcessor] 等待分卷稳定超时: {e}")
+            return None
 
         return file_path
 
@@ -0,0 +1,211 @@
+"""文件写入完成检测
+
+判断文件是否已复制/写入完成。监视器的 watchdog 观察者把输入目录的文件事件转发到这里：
+
+- 收到写入后关闭（inotify IN_CLOSE_WRITE）或移动到该路径的事件时，文件立即视为完成
+- 否则在连续 checks × interval 秒内没有修改事件且大小不变时视为完成
+- 路径不在监视目录内，或一直没有收到该文件的事件（如网络文件系统不产生通知、
+  文件在监视器启动前已存在）时，回退为按间隔比较文件大小
+
+文件事件只用于提前结束或延长等待，最终都会确认文件大小稳定。
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 小于该大小的文件可能是刚开始复制
+MIN_SIZE = 1024
+
+MODIFIED = 'modified'
+CLOSED = 'closed'
+
+# 收到关闭事件后确认没有再次写入的时间（秒）
+CLOSE_CONFIRM = 0.5
+
+
+class FileStabilityMonitor:
+    """基于文件事件的写入完成检测"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._root: Optional[str] = None
+        # 路径 -> (最后事件类型, 时间)
+        self._activity: Dict[str, tuple] = {}
+        # 路径 -> 等待该路径事件的 asyncio.Event
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop, root: str):
+        """监视器启动后调用，root 下的文件事件会转发到这里"""
+        self._loop = loop
+        self._root = os.path.join(os.path.abspath(root), '')
+
+    def detach(self):
+        self._root = None
+        self._activity.clear()
+
+    def covers(self, path: str) -> bool:
+        return self._root is not None and os.path.abspath(path).startswith(self._root)
+
+    def notify(self, path: str, kind: str):
+        """文件事件（在 watchdog 线程中调用）"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or self._root is None:
+            return
+        loop.call_soon_threadsafe(self._record, path, kind)
+
+    def _record(self, path: str, kind: str):
+        now = time.monotonic()
+        self._activity[path] = (kind, now)
+        for event in self._waiters.get(path, ()):
+            event.set()
+        # 清理一小时前的记录
+        if len(self._activity) > 10000:
+            cutoff = now - 3600
+            self._activity = {p: a for p, a in self._activity.items() if a[1] > cutoff}
+
+    def _last_event(self, path: str) -> Optional[str]:
+        """最后收到的事件类型（路径不在监视范围内或没有事件时为 None）"""
+        if not self.covers(path):
+            return None
+        activity = self._activity.get(path)
+        return activity[0] if activity else None
+
+    async def _wait_event(self, path: str, timeout: float) -> bool:
+        """等待该路径的下一个文件事件，超时返回 False"""
+        event = asyncio.Event()
+        waiters = self._waiters.setdefault(path, set())
+        waiters.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters.discard(event)
+            if not waiters:
+                self._waiters.pop(path, None)
+
+    async def _confirm_closed(self, path: str, size: int) -> bool:
+        """关闭事件后短暂确认没有再次写入（部分下载工具会分段打开、关闭文件）"""
+        if await self._wait_event(path, CLOSE_CONFIRM):
+            return False
+        return _size(path) == size
+
+    async def wait_stable(
+        self,
+        path: str,
+        checks: int,
+        interval: float,
+        max_wait: float,
+        should_stop: Optional[Callable[[], bool]] = None,
+        before_check: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> bool:
+        """等待文件写入完成
+
+        Args:
+            checks / interval: 没有关闭事件时，需要连续 checks 次、每次间隔 interval 秒大小不变
+            max_wait: 最大等待时间（秒）
+            should_stop: 返回 True 时放弃等待（如任务被取消），此时返回 False
+            before_check: 每次检查前调用（如等待任务暂停结束）
+
+        Raises:
+            TimeoutError: 等待超时
+        """
+        start = time.monotonic()
+        previous_size = -1
+        stable_count = 0
+
+        while True:
+            if time.monotonic() - start > max_wait:
+                raise TimeoutError(f"等待文件复制完成超时 ({max_wait}秒): {path}")
+            if should_stop and should_stop():
+                return False
+            if before_check:
+                await before_check()
+
+            size = _size(path)
+            if size is not None and size >= MIN_SIZE and _readable(path):
+                if self._last_event(path) == CLOSED and await self._confirm_closed(path, size):
+                    logger.info(f"文件写入已关闭，复制完成: {path} ({size} bytes)")
+                    return True
+                if size == previous_size:
+                    stable_count += 1
+                    if stable_count >= checks:
+                        logger.info(f"文件复制完成检测通过: {path} ({size} bytes)")
+                        return True
+                else:
+                    if previous_size >= MIN_SIZE:
+                        logger.info(f"文件仍在复制中: {path} ({previous_size} -> {size} bytes)")
+                    stable_count = 0
+            else:
+                stable_count = 0
+            previous_size = size if size is not None else -1
+
+            if self.covers(path):
+                # 等到 interval 秒内没有修改事件；关闭事件立即重新检查，修改事件重新计数
+                while await self._wait_event(path, interval):
+                    stable_count = 0
+                    # 监视已停止（记录已清空）时不再等待事件，退出后按轮询继续检查
+                    last = self._activity.get(path, (None, 0))[0]
+                    if last is None or last == CLOSED or time.monotonic() - start > max_wait:
+                        break
+            else:
+                await asyncio.sleep(interval)
+
+    async def wait_all_stable(self, paths: Iterable[str], **kwargs) -> bool:
+        """并发等待多个文件（如分卷组的所有分卷）写入完成"""
+        results = await asyncio.gather(*(self.wait_stable(path, **kwargs) for path in paths))
+        return all(results)
+
+    async def is_quiet(self, path: str, window: float = 2) -> bool:
+        """快速检查：window 秒内没有修改且大小不变（已收到关闭事件时立即返回）"""
+        size = _size(path)
+        if size is None:
+            return False
+        if self._last_event(path) == CLOSED:
+            return await self._confirm_closed(path, size)
+        if self.covers(path):
+            if await self._wait_event(path, window):
+                return self._last_event(path) == CLOSED and _size(path) == size
+        else:
+            await asyncio.sleep(window)
+        return _size(path) == size
+
+    async def all_quiet(self, paths: Iterable[str], window: float = 2) -> bool:
+        """并发快速检查多个文件"""
+        results = await asyncio.gather(*(self.is_quiet(path, window) for path in paths))
+        return all(results)
+
+
+def _size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def _readable(path: str) -> bool:
+    """尝试读取文件开头，检查文件是否仍被锁定"""
+    try:
+        with open(path, 'rb') as f:
+            f.read(1)
+        return True
+    except OSError:
+        return False
+
+
+# 全局实例
+_monitor: Optional[FileStabilityMonitor] = None
+
+
+def get_stability_monitor() -> FileStabilityMonitor:
+    """获取文件写入完成检测实例（单例）"""
+    global _monitor
+    if _monitor is None:
+        _monitor = FileStabilityMonitor()
+    return _monitor
@@ -9,10 +9,11 @@ import time
 from typing import Dict, List, Optional, Set
 from dataclasses import dataclass, field
 import aiohttp
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from ..config.settings import get_config, save_config
 from ..core.dlsite_service import get_dlsite_service
+from .memory_cache import MemoryCache, get_memory_cache
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,7 @@ class KikoeruServerConfig:
     token_expires: int = 0  # Token 过期时间戳
     timeout: int = 10     # 请求超时(秒)
     cache_ttl: int = 300  # 缓存时间(秒)
+    cache_max_entries: int = 2000  # 缓存最大条目数
 
 
 @dataclass
@@ -63,7 +65,6 @@ class KikoeruDuplicateService:
     
     def __init__(self, config: Optional[KikoeruServerConfig] = None):
         self.config = config or self._load_config()
-        self._cache: Dict[str, tuple] = {}  # 缓存: rjcode -> (result, timestamp)
         self._session: Optional[aiohttp.ClientSession] = None
     
     def _load_config(self) -> KikoeruServerConfig:
@@ -79,7 +80,8 @@ class KikoeruDuplicateService:
                 api_token=kikoeru_config.api_token,
                 token_expires=kikoeru_config.token_expires,
                 timeout=kikoeru_config.timeout,
-                cache_ttl=kikoeru_config.cache_ttl
+                cache_ttl=kikoeru_config.cache_ttl,
+                cache_max_entries=kikoeru_config.cache_max_entries
             )
         else:
             return KikoeruServerConfig()
@@ -194,22 +196,18 @@ class KikoeruDuplicateService:
         
         return bool(self.config.api_token)
     
+    @property
+    def _cache(self) -> MemoryCache:
+        """查重结果缓存: rjcode -> KikoeruCheckResult"""
+        return get_memory_cache('kikoeru', self.config.cache_max_entries, self.config.cache_ttl)
+    
     def _get_cache(self, rjcode: str) -> Optional[KikoeruCheckResult]:
         """从缓存获取结果"""
-        if rjcode not in self._cache:
-            return None
-        
-        result, timestamp = self._cache[rjcode]
-        if datetime.now() - timestamp > timedelta(seconds=self.config.cache_ttl):
-            # 缓存过期
-            del self._cache[rjcode]
-            return None
-        
-        return result
+        return self._cache.get(rjcode, None)
     
     def _set_cache(self, rjcode: str, result: KikoeruCheckResult):
         """设置缓存"""
-        self._cache[rjcode] = (result, datetime.now())
+        self._cache.set(rjcode, result)
     
     def _build_search_url(self, rjcode: str) -> str:
         """构建搜索 URL"""
@@ -0,0 +1,437 @@
+"""库存索引
+
+RJ号 -> 库存文件夹的持久化索引，替代查重时对整个库存目录的 rglob 扫描。
+
+启动时从 LibrarySnapshot 表加载，再用一次限定深度的 os.scandir 遍历补全；
+之后由分类器（移动到库存后）和库存目录的文件系统监视增量维护，查找为 O(1)。
+网络存储上文件系统事件可能丢失，可通过 API 重建或校验索引。
+"""
+
+import os
+import re
+import asyncio
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from ..config.settings import get_config
+from ..models.database import LibrarySnapshot, get_db
+from .tree_stats import get_tree_stats_service
+
+logger = logging.getLogger(__name__)
+
+RJ_PATTERN = re.compile(r'[RVB]J(\d{8}|\d{6})(?!\d)', re.IGNORECASE)
+
+# 扫描时跳过的目录（冲突作品暂存目录不算已入库）
+SKIPPED_DIRS = {'_conflicts'}
+
+
+def extract_rjcode(name: str) -> Optional[str]:
+    """从文件夹名提取RJ号"""
+    match = RJ_PATTERN.search(name)
+    return match.group(0).upper() if match else None
+
+
+@dataclass
+class LibraryEntry:
+    """索引中的一个作品文件夹"""
+    path: str
+    folder_size: Optional[int] = None
+    file_count: Optional[int] = None
+
+
+class LibraryEventHandler(FileSystemEventHandler):
+    """库存目录的文件系统事件处理器，只关心文件夹的创建、删除和移动"""
+
+    def __init__(self, index: 'LibraryIndex'):
+        self.index = index
+
+    def on_created(self, event):
+        if event.is_directory:
+            self.index.on_folder_added(str(event.src_path))
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.index.on_folder_removed(str(event.src_path))
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self.index.on_folder_moved(str(event.src_path), str(event.dest_path))
+
+
+class LibraryIndex:
+    """RJ号 -> 库存文件夹索引"""
+
+    def __init__(self):
+        self._entries: Dict[str, LibraryEntry] = {}
+        self._lock = threading.RLock()
+        self._crawl_lock = threading.Lock()
+        self._loaded = False
+        self._crawled = False
+        self._observer = None
+        self._crawl_task: Optional[asyncio.Task] = None
+        self.last_crawl: Optional[Dict] = None
+
+    @property
+    def config(self):
+        return get_config()
+
+    @property
+    def library_path(self) -> str:
+        return self.config.storage.library_path
+
+    # ========== 查找 ==========
+
+    def lookup(self, rjcode: str) -> Optional[Dict]:
+        """查找作品在库存中的文件夹，返回 {'path', 'size', 'file_count'}，不存在返回 None
+
+        首次扫描完成前未命中时会同步执行一次扫描，避免漏检
+        """
+        rjcode = rjcode.upper()
+        self._ensure_loaded()
+
+        entry = self._entries.get(rjcode)
+        if entry is None and not self._crawled:
+            logger.info(f"[库存索引] 索引尚未完成首次扫描，立即扫描库存目录: {rjcode}")
+            self.rebuild(if_needed=True)
+            entry = self._entries.get(rjcode)
+        if entry is None:
+            return None
+
+        if not os.path.isdir(entry.path):
+            logger.warning(f"[库存索引] 记录的路径已不存在，移除: {rjcode} -> {entry.path}")
+            self.remove(rjcode)
+            return None
+
+        if entry.folder_size is None or entry.file_count is None:
+            entry = self._fill_stats(rjcode, entry)
+
+        return {
+            'path': entry.path,
+            'size': entry.folder_size,
+            'file_count': entry.file_count
+        }
+
+    async def lookup_async(self, rjcode: str) -> Optional[Dict]:
+        """在异步代码中查找：首次扫描进行中时等待扫描任务完成，查找本身（可能统计文件夹大小）在线程池中执行"""
+        crawl_task = self._crawl_task
+        if not self._crawled and crawl_task is not None and not crawl_task.done():
+            await asyncio.wait({crawl_task})
+        return await asyncio.to_thread(self.lookup, rjcode)
+
+    def _fill_stats(self, rjcode: str, entry: LibraryEntry) -> LibraryEntry:
+        """补全扫描时未统计的文件夹大小和文件数"""
+        stats = get_tree_stats_service().get_stats(entry.path)
+        if stats.settled:
+            self.add(rjcode, entry.path, stats.size, stats.file_count)
+        return LibraryEntry(entry.path, stats.size, stats.file_count)
+
+    # ========== 增量维护 ==========
+
+    def add(self, rjcode: str, folder_path: str, folder_size: Optional[int] = None, file_count: Optional[int] = None):
+        """添加或更新作品文件夹"""
+        rjcode = rjcode.upper()
+        self._ensure_loaded()
+        with self._lock:
+            previous = self._entries.get(rjcode)
+            if previous and previous.path == folder_path:
+                # 同一路径的重复通知（如文件系统事件）不覆盖已统计的大小
+                if folder_size is None:
+                    folder_size = previous.folder_size
+                if file_count is None:
+                    file_count = previous.file_count
+            entry = LibraryEntry(folder_path, folder_size, file_count)
+            self._entries[rjcode] = entry
+        self._save_entries({rjcode: entry})
+
+    def remove(self, rjcode: str):
+        """移除作品"""
+        rjcode = rjcode.upper()
+        with self._lock:
+            self._entries.pop(rjcode, None)
+        self._delete_entries([rjcode])
+
+    def on_folder_added(self, folder_path: str):
+        """库存中出现新文件夹"""
+        rjcode = extract_rjcode(os.path.basename(folder_path))
+        if not rjcode or not self._within_depth(folder_path):
+            return
+        existing = self._entries.get(rjcode)
+        if existing and existing.path != folder_path and os.path.isdir(existing.path):
+            return
+        logger.debug(f"[库存索引] 新增: {rjcode} -> {folder_path}")
+        self.add(rjcode, folder_path)
+
+    def on_folder_removed(self, folder_path: str):
+        """库存中的文件夹被删除（包括上级目录被删除）"""
+        removed = [rjcode for rjcode, entry in list(self._entries.items()) if self._is_same_or_under(entry.path, folder_path)]
+        if not removed:
+            return
+        logger.debug(f"[库存索引] 移除: {removed}")
+        with self._lock:
+            for rjcode in removed:
+                self._entries.pop(rjcode, None)
+        self._delete_entries(removed)
+
+    def on_folder_moved(self, src_path: str, dest_path: str):
+        """库存中的文件夹被移动或重命名"""
+        if not self._is_same_or_under(dest_path, self.library_path):
+            self.on_folder_removed(src_path)
+            return
+
+        moved: Dict[str, LibraryEntry] = {}
+        with self._lock:
+            for rjcode, entry in list(self._entries.items()):
+                if self._is_same_or_under(entry.path, src_path):
+                    new_path = dest_path + entry.path[len(src_path):]
+                    moved[rjcode] = LibraryEntry(new_path, entry.folder_size, entry.file_count)
+            self._entries.update(moved)
+        if moved:
+            logger.debug(f"[库存索引] 移动: {src_path} -> {dest_path} ({len(moved)} 个作品)")
+            self._save_entries(moved)
+
+        # 重命名后文件夹名可能带上了RJ号
+        self.on_folder_added(dest_path)
+
+    # ========== 扫描 ==========
+
+    def rebuild(self, if_needed: bool = False) -> Optional[Dict]:
+        """扫描库存目录重建索引，返回统计信息
+
+        if_needed: 只在尚未完成首次扫描时扫描（等待进行中的扫描结束后不再重复扫描）
+        """
+        with self._crawl_lock:
+            if if_needed and self._crawled:
+                return self.last_crawl
+            self._ensure_loaded()
+            start = datetime.now()
+            found = self._crawl(self.library_path, max(1, self.config.storage.library_index_depth))
+
+            with self._lock:
+                old = self._entries
+                new: Dict[str, LibraryEntry] = {}
+                for rjcode, path in found.items():
+                    previous = old.get(rjcode)
+                    # 同一RJ号有多个文件夹时保留索引中原有的那个
+                    if previous and (previous.path == path or (
+                        self._is_same_or_under(previous.path, self.library_path) and os.path.isdir(previous.path)
+                    )):
+                        new[rjcode] = previous
+                    else:
+                        new[rjcode] = LibraryEntry(path)
+                # 超出扫描深度但仍存在的记录（如分类器放入的深层目录）保留
+                for rjcode, entry in old.items():
+                    if rjcode not in new and self._is_same_or_under(entry.path, self.library_path) and os.path.isdir(entry.path):
+                        new[rjcode] = entry
+                self._entries = new
+                self._crawled = True
+
+            changed = {rjcode: entry for rjcode, entry in new.items() if old.get(rjcode) is not entry}
+            removed = [rjcode for rjcode in old if rjcode not in new]
+            self._save_entries(changed)
+            self._delete_entries(removed)
+
+            self.last_crawl = {
+                'total': len(new),
+                'added': len([rjcode for rjcode in changed if rjcode not in old]),
+                'updated': len([rjcode for rjcode in changed if rjcode in old]),
+                'removed': len(removed),
+                'duration_ms': int((datetime.now() - start).total_seconds() * 1000),
+                'finished_at': datetime.now().isoformat()
+            }
+            logger.info(f"[库存索引] 扫描完成: {self.last_crawl}")
+            return self.last_crawl
+
+    def verify(self) -> Dict:
+        """校验索引：检查记录的路径是否存在，并与一次新的扫描结果对比（不修改索引）"""
+        self._ensure_loaded()
+        found = self._crawl(self.library_path, max(1, self.config.storage.library_index_depth))
+        entries = dict(self._entries)
+
+        missing = [rjcode for rjcode, entry in entries.items() if not os.path.isdir(entry.path)]
+        unindexed = [rjcode for rjcode in found if rjcode not in entries]
+        # 磁盘上另有同一RJ号的文件夹（重复入库或索引记录的是另一份）
+        mismatched = [
+            rjcode for rjcode, path in found.items()
+            if rjcode in entries and rjcode not in missing and os.path.normpath(entries[rjcode].path) != os.path.normpath(path)
+        ]
+        return {
+            'indexed': len(entries),
+            'found_on_disk': len(found),
+            'missing': missing,
+            'unindexed': unindexed,
+            'mismatched': mismatched,
+            'consistent': not missing and not unindexed
+        }
+
+    def _crawl(self, library_path: str, max_depth: int) -> Dict[str, str]:
+        """限定深度的 os.scandir 遍历，找到带RJ号的文件夹后不再深入"""
+        found: Dict[str, str] = {}
+        if not os.path.isdir(library_path):
+            return found
+
+        level = [library_path]
+        for depth in range(max_depth):
+            next_level: List[str] = []
+            for directory in level:
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.name.startswith('.') or entry.name in SKIPPED_DIRS:
+                                continue
+                            try:
+                                if not entry.is_dir(follow_symlinks=False):
+                                    continue
+                            except OSError:
+                                continue
+                            rjcode = extract_rjcode(entry.name)
+                            if rjcode:
+                                found.setdefault(rjcode, entry.path)
+                            else:
+                                next_level.append(entry.path)
+                except OSError as e:
+                    logger.warning(f"[库存索引] 无法读取目录: {directory}, {e}")
+            level = next_level
+        return found
+
+    # ========== 持久化 ==========
+
+    def _ensure_loaded(self):
+        """首次使用时从 LibrarySnapshot 表加载索引"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            db = next(get_db())
+            try:
+                for snapshot in db.query(LibrarySnapshot).all():
+                    if snapshot.rjcode and snapshot.folder_path:
+                        self._entries[snapshot.rjcode.upper()] = LibraryEntry(
+                            snapshot.folder_path, snapshot.folder_size, snapshot.file_count
+                        )
+                logger.info(f"[库存索引] 从数据库加载 {len(self._entries)} 条记录")
+            except Exception as e:
+                logger.error(f"[库存索引] 加载失败: {e}")
+            finally:
+                db.close()
+            self._loaded = True
+
+    def _save_entries(self, entries: Dict[str, LibraryEntry]):
+        if not entries:
+            return
+        db = next(get_db())
+        try:
+            existing = {
+                snapshot.rjcode: snapshot
+                for snapshot in db.query(LibrarySnapshot).filter(LibrarySnapshot.rjcode.in_(list(entries))).all()
+            }
+            now = datetime.utcnow()
+            for rjcode, entry in entries.items():
+                snapshot = existing.get(rjcode)
+                if snapshot is None:
+                    snapshot = LibrarySnapshot(rjcode=rjcode)
+                    db.add(snapshot)
+                snapshot.folder_path = entry.path
+                snapshot.folder_size = entry.folder_size
+                snapshot.file_count = entry.file_count
+                snapshot.scanned_at = now
+            db.commit()
+        except Exception as e:
+            logger.error(f"[库存索引] 保存失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _delete_entries(self, rjcodes: List[str]):
+        if not rjcodes:
+            return
+        db = next(get_db())
+        try:
+            db.query(LibrarySnapshot).filter(LibrarySnapshot.rjcode.in_(rjcodes)).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"[库存索引] 删除记录失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    # ========== 辅助 ==========
+
+    @staticmethod
+    def _is_same_or_under(path: str, parent: str) -> bool:
+        path = os.path.normpath(path)
+        parent = os.path.normpath(parent)
+        return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+    def _within_depth(self, folder_path: str) -> bool:
+        if not self._is_same_or_under(folder_path, self.library_path):
+            return False
+        relative = os.path.relpath(folder_path, self.library_path)
+        parts = relative.split(os.sep)
+        if any(part.startswith('.') or part in SKIPPED_DIRS for part in parts):
+            return False
+        return len(parts) <= max(1, self.config.storage.library_index_depth)
+
+    # ========== 生命周期 ==========
+
+    def start(self):
+        """加载索引，后台扫描库存目录并监视其变化"""
+        self._ensure_loaded()
+        self._crawl_task = asyncio.create_task(asyncio.to_thread(self.rebuild))
+
+        library_path = self.library_path
+        if not os.path.isdir(library_path):
+            logger.info(f"[库存索引] 库存目录不存在，跳过监视: {library_path}")
+            return
+        try:
+            observer = Observer()
+            observer.schedule(LibraryEventHandler(self), library_path, recursive=True)
+            observer.start()
+            self._observer = observer
+            logger.info(f"[库存索引] 开始监视库存目录: {library_path}")
+        except Exception as e:
+            logger.warning(f"[库存索引] 无法监视库存目录，仅依赖分类器更新和手动重建: {e}")
+
+    def stop(self):
+        """停止监视"""
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._crawl_task and not self._crawl_task.done():
+            self._crawl_task.cancel()
+
+    def restart(self):
+        """库存路径变更后重新加载并扫描"""
+        self.stop()
+        with self._lock:
+            self._crawled = False
+        self.start()
+
+    def get_status(self) -> Dict:
+        self._ensure_loaded()
+        return {
+            'library_path': self.library_path,
+            'indexed': len(self._entries),
+            'crawled': self._crawled,
+            'watching': self._observer is not None,
+            'last_crawl': self.last_crawl
+        }
+
+
+# 全局索引实例
+_library_index: Optional[LibraryIndex] = None
+
+
+def get_library_index() -> LibraryIndex:
+    """获取库存索引实例（单例）"""
+    global _library_index
+    if _library_index is None:
+        _library_index = LibraryIndex()
+    return _library_index
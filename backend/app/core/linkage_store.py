@@ -0,0 +1,137 @@
+"""作品关联图存储
+
+把 DLsite 的翻译关联（原作品 -> 各语言版本父级 -> 子级）持久化到 WorkLinkage 表。
+每条边是 (original_rjcode, linked_rjcode)，同一原作品下的所有边构成一个连通分量，
+任意成员的 RJ 号都可以用一次带子查询的索引查询取回整个分量。
+
+每条边有自己的 expires_at；分量中有任何一条边过期时视为需要刷新，
+刷新失败时仍可使用过期数据。
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+import logging
+
+from ..config.settings import get_config
+from ..models.database import WorkLinkage, get_db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LinkageComponent:
+    """一个原作品的关联分量"""
+    original_rjcode: str
+    # RJ号 -> (work_type, lang)
+    works: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    stale: bool = False
+
+
+class LinkageStore:
+    """基于 WorkLinkage 表的关联图存储"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl(self) -> timedelta:
+        return timedelta(hours=get_config().metadata.linkage_ttl_hours)
+
+    def get_component(self, rjcode: str) -> Optional[LinkageComponent]:
+        """取回包含 rjcode 的整个关联分量，不存在时返回 None"""
+        rjcode = rjcode.upper()
+        db = next(get_db())
+        try:
+            roots = db.query(WorkLinkage.original_rjcode).filter(WorkLinkage.linked_rjcode == rjcode)
+            rows = db.query(WorkLinkage).filter(WorkLinkage.original_rjcode.in_(roots.scalar_subquery())).all()
+        except Exception as e:
+            logger.warning(f"[关联图] 查询失败: {rjcode}, {e}")
+            return None
+        finally:
+            db.close()
+
+        if not rows:
+            self.misses += 1
+            return None
+
+        now = datetime.utcnow()
+        component = LinkageComponent(original_rjcode=rows[0].original_rjcode)
+        for row in rows:
+            component.works[row.linked_rjcode] = (row.work_type, row.lang)
+            if row.expires_at is None or row.expires_at <= now:
+                component.stale = True
+        self.hits += 1
+        return component
+
+    def save_component(self, original_rjcode: str, works: Dict[str, Tuple[str, str]]):
+        """写入（替换）一个原作品的关联分量"""
+        original_rjcode = original_rjcode.upper()
+        members = [code.upper() for code in works]
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+
+        db = next(get_db())
+        try:
+            # 成员可能之前属于别的分量（或分量本身变化），先删除相关的旧边
+            db.query(WorkLinkage).filter(
+                (WorkLinkage.original_rjcode == original_rjcode) | WorkLinkage.linked_rjcode.in_(members)
+            ).delete(synchronize_session=False)
+            for rjcode, (work_type, lang) in works.items():
+                db.add(WorkLinkage(
+                    original_rjcode=original_rjcode,
+                    linked_rjcode=rjcode.upper(),
+                    work_type=work_type,
+                    lang=lang,
+                    cached_at=now,
+                    expires_at=expires_at
+                ))
+            # 顺便清理过期已久的边
+            db.query(WorkLinkage).filter(
+                WorkLinkage.expires_at < now - self.ttl
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[关联图] 保存失败: {original_rjcode}, {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def invalidate(self, rjcode: str):
+        """删除包含 rjcode 的关联分量"""
+        rjcode = rjcode.upper()
+        db = next(get_db())
+        try:
+            roots = [row.original_rjcode for row in
+                     db.query(WorkLinkage.original_rjcode).filter(WorkLinkage.linked_rjcode == rjcode).all()]
+            if roots:
+                db.query(WorkLinkage).filter(
+                    WorkLinkage.original_rjcode.in_(roots)
+                ).delete(synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            logger.warning(f"[关联图] 删除失败: {rjcode}, {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict:
+        db = next(get_db())
+        try:
+            edges = db.query(WorkLinkage).count()
+        finally:
+            db.close()
+        return {'edges': edges, 'hits': self.hits, 'misses': self.misses}
+
+
+# 全局存储实例
+_linkage_store: Optional[LinkageStore] = None
+
+
+def get_linkage_store() -> LinkageStore:
+    """获取关联图存储实例（单例）"""
+    global _linkage_store
+    if _linkage_store is None:
+        _linkage_store = LinkageStore()
+    return _linkage_store
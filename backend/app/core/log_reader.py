@@ -0,0 +1,215 @@
+"""日志文件读取
+
+- 日志按大小轮转（app.log → app.log.1 … app.log.N），避免单个文件无限增长
+- 读取最后 N 行时从文件末尾按块向前读取，不读取整个文件；当前文件不够时继续读取轮转的旧文件
+- 跟踪模式从上次读取的位置继续读取新写入的行，文件轮转后从新文件开头继续
+- 按级别、RJ 号过滤在服务端进行；异常堆栈等续行跟随所属的日志行一起保留或过滤
+"""
+
+import asyncio
+import os
+import re
+import logging
+from logging.handlers import RotatingFileHandler
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+
+LOG_FILE_NAME = 'app.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件最大 10MB
+LOG_BACKUP_COUNT = 5  # 保留的轮转文件数
+
+# 日志行开头：2024-01-01 12:00:00 [INFO] name - message
+LOG_LINE_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} \[(\w+)\]')
+
+BLOCK_SIZE = 64 * 1024
+# 跟踪模式每次最多读取的字节数
+FOLLOW_CHUNK = 1024 * 1024
+
+
+def get_log_file() -> str:
+    return os.path.join(os.environ.get('DATA_PATH', './data'), LOG_FILE_NAME)
+
+
+def create_file_handler(log_file: str) -> logging.Handler:
+    """按大小轮转的日志文件处理器"""
+    return RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
+
+class LogFilter:
+    """日志过滤条件（级别、RJ 号）"""
+
+    def __init__(self, levels: Optional[Iterable[str]] = None, rjcode: Optional[str] = None):
+        self.levels = {level.strip().upper() for level in levels if level.strip()} if levels else None
+        self.rjcode = rjcode.strip().upper() if rjcode and rjcode.strip() else None
+
+    def matches(self, line: str) -> bool:
+        """日志行是否符合条件（只对带时间和级别的日志行调用）"""
+        if self.levels:
+            match = LOG_LINE_RE.match(line)
+            if not match or match.group(1).upper() not in self.levels:
+                return False
+        if self.rjcode and self.rjcode not in line.upper():
+            return False
+        return True
+
+
+def _reverse_lines(path: str, end: Optional[int] = None) -> Iterator[str]:
+    """从文件末尾（或 end 位置）向前逐行读取"""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END) if end is None else end
+        remainder = b''
+        while pos > 0:
+            size = min(BLOCK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + remainder).split(b'\n')
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8', errors='replace').rstrip('\r')
+        yield remainder.decode('utf-8', errors='replace').rstrip('\r')
+
+
+def _backup_files(log_file: str) -> List[str]:
+    backups = []
+    for i in range(1, LOG_BACKUP_COUNT + 1):
+        path = f"{log_file}.{i}"
+        if not os.path.exists(path):
+            break
+        backups.append(path)
+    return backups
+
+
+def tail(log_file: str, lines: int, log_filter: Optional[LogFilter] = None) -> Tuple[List[str], int]:
+    """读取最后 lines 行（过滤后）
+
+    Returns:
+        (日志行, 读取时的文件大小)，文件大小作为跟踪模式的起始位置
+    """
+    if not os.path.exists(log_file):
+        return [], 0
+    offset = os.path.getsize(log_file)
+    if lines <= 0:
+        return [], offset
+
+    def all_lines() -> Iterator[str]:
+        yield from _reverse_lines(log_file, offset)
+        for backup in _backup_files(log_file):
+            yield from _reverse_lines(backup)
+
+    result: List[str] = []  # 倒序
+    pending: List[str] = []  # 倒序读取时先遇到的续行，等读到所属日志行再决定
+    for line in all_lines():
+        if not line.strip():
+            continue
+        pending.append(line)
+        if not LOG_LINE_RE.match(line):
+            continue
+        if log_filter is None or log_filter.matches(line):
+            result.extend(pending)
+        pending = []
+        if len(result) >= lines:
+            break
+    else:
+        # 最旧文件开头没有所属日志行的续行
+        if log_filter is None:
+            result.extend(pending)
+
+    result.reverse()
+    return result[-lines:], offset
+
+
+class LogFollower:
+    """从指定位置继续读取新写入的日志行"""
+
+    def __init__(self, log_file: str, offset: int, log_filter: Optional[LogFilter] = None):
+        self.log_file = log_file
+        self.offset = offset
+        self.log_filter = log_filter
+        self._identity = self._stat_identity(log_file)
+        self._keep = True  # 最近一条日志行是否保留（续行跟随）
+
+    @staticmethod
+    def _stat_identity(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+            return (st.st_dev, st.st_ino)
+        except OSError:
+            return None
+
+    def _read_from(self, path: str, offset: int, size: int) -> Tuple[List[str], int]:
+        """读取 offset 之后的完整行，返回 (行, 新位置)；未写完的最后一行留到下次读取"""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(min(size - offset, FOLLOW_CHUNK))
+        end = data.rfind(b'\n')
+        if end < 0:
+            return [], offset
+        data = data[:end + 1]
+        return data.decode('utf-8', errors='replace').splitlines(), offset + len(data)
+
+    def read_new(self) -> List[str]:
+        """读取新写入的行（同步，调用方应在线程池中执行）"""
+        raw: List[str] = []
+        identity = self._stat_identity(self.log_file)
+        if identity is None:
+            return []
+
+        if identity != self._identity:
+            # 已轮转：先读完旧文件（现在是 .1）剩余的部分，再从新文件开头读取
+            rotated = f"{self.log_file}.1"
+            if self._identity is not None and self._stat_identity(rotated) == self._identity:
+                try:
+                    lines, _ = self._read_from(rotated, self.offset, os.path.getsize(rotated))
+                    raw.extend(lines)
+                except OSError:
+                    pass
+            self._identity = identity
+            self.offset = 0
+
+        try:
+            size = os.path.getsize(self.log_file)
+            if size < self.offset:
+                # 文件被截断
+                self.offset = 0
+            if size > self.offset:
+                lines, self.offset = self._read_from(self.log_file, self.offset, size)
+                raw.extend(lines)
+        except OSError:
+            return raw
+
+        result = []
+        for line in raw:
+            if not line.strip():
+                continue
+            if LOG_LINE_RE.match(line):
+                self._keep = self.log_filter is None or self.log_filter.matches(line)
+            if self._keep:
+                result.append(line)
+        return result
+
+
+async def follow(
+    log_file: str,
+    offset: int,
+    log_filter: Optional[LogFilter] = None,
+    interval: float = 0.5,
+    heartbeat: float = 15
+) -> AsyncIterator[Tuple[List[str], int]]:
+    """持续产出新写入的日志行 (行, 读取后的位置)
+
+    超过 heartbeat 秒没有新行时产出空列表，供调用方发送心跳。
+    """
+    follower = LogFollower(log_file, offset, log_filter)
+    idle = 0.0
+    while True:
+        lines = await asyncio.to_thread(follower.read_new)
+        if lines:
+            idle = 0.0
+            yield lines, follower.offset
+            continue
+        idle += interval
+        if idle >= heartbeat:
+            idle = 0.0
+            yield [], follower.offset
+        await asyncio.sleep(interval)
@@ -0,0 +1,121 @@
+"""进程内缓存
+
+带容量上限（LRU 淘汰）和过期时间（TTL）的缓存，替代各服务中只增不减的 dict 缓存。
+值为 None 表示负缓存（如作品不存在），使用单独的较短过期时间。
+所有缓存按名称注册，命中、未命中和淘汰计数可通过 API 查看。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# get() 未命中时的默认返回值，用于区分缓存的 None（负缓存）
+MISSING = object()
+
+
+class MemoryCache:
+    """LRU + TTL 缓存（线程安全）"""
+
+    def __init__(self, name: str, max_size: int, ttl: float, negative_ttl: Optional[float] = None):
+        self.name = name
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        # key -> (value, 过期时间)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """获取缓存值，不存在或已过期时返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存，value 为 None 时按负缓存过期时间保存"""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def resize(self, max_size: int):
+        """调整容量上限，超出部分按最久未使用淘汰"""
+        with self._lock:
+            self.max_size = max(1, max_size)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+# 已注册的缓存
+_caches: Dict[str, MemoryCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_memory_cache(name: str, max_size: int, ttl: float, negative_ttl: Optional[float] = None) -> MemoryCache:
+    """获取指定名称的共享缓存，不存在时按参数创建；已存在时同步容量和过期时间"""
+    with _registry_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = MemoryCache(name, max_size, ttl, negative_ttl)
+            _caches[name] = cache
+            return cache
+    cache.ttl = ttl
+    cache.negative_ttl = ttl if negative_ttl is None else negative_ttl
+    if cache.max_size != max(1, max_size):
+        cache.resize(max_size)
+    return cache
+
+
+def get_cache_stats() -> List[Dict]:
+    """所有缓存的统计信息"""
+    return [cache.get_stats() for cache in list(_caches.values())]
+
+
+def clear_all_caches():
+    for cache in list(_caches.values()):
+        cache.clear()
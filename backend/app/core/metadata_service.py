@@ -1,15 +1,15 @@
 import os
 import re
-import asyncio
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
-import requests
 import logging
 import json
 
 from ..config.settings import get_config
 from ..models.database import WorkMetadata as WorkMetadataModel, get_db
 from ..core.task_engine import Task
+from .stage_pools import get_stage_pools
+from .dlsite_client import get_dlsite_client, DLsiteRequestError
 
 logger = logging.getLogger(__name__)
 
@@ -48,12 +48,8 @@ class MetadataService:
     
     def __init__(self):
         self.config = get_config()
-        self.session = requests.Session()
-        if self.config.metadata.http_proxy:
-            self.session.proxies = {
-                'http': self.config.metadata.http_proxy,
-                'https': self.config.metadata.http_proxy
-            }
+        # HTTP 请求、限速和代理由共享的 DLsite 客户端负责
+        self.client = get_dlsite_client()
     
     async def fetch(self, path: str, task: Task) -> dict:
         """
@@ -73,8 +69,9 @@ class MetadataService:
                 logger.info(f"使用缓存的元数据: {rjcode}")
                 return cached.to_dict()
         
-        # 从DLsite获取
-        metadata = await self._fetch_from_dlsite(rjcode)
+        # 从DLsite获取（占用元数据阶段的并发名额）
+        async with get_stage_pools().slot('metadata'):
+            metadata = await self._fetch_from_dlsite(rjcode)
         
         # 缓存到数据库
         if self.config.metadata.cache_enabled:
@@ -159,23 +156,12 @@ class MetadataService:
     
     async def _fetch_from_dlsite(self, rjcode: str) -> WorkMetadata:
         """从DLsite API获取元数据（支持大家翻译）"""
-        await asyncio.sleep(self.config.metadata.sleep_interval)
-        
-        # 获取基础数据（使用配置的语言）
-        url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}&locale={self.config.metadata.locale}"
-        
         try:
-            response = self.session.get(
-                url,
-                timeout=(self.config.metadata.connect_timeout, self.config.metadata.read_timeout)
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            if not data or len(data) == 0:
+            # 获取基础数据（使用配置的语言）
+            product = await self.client.get_product(rjcode, self.config.metadata.locale)
+            if not product:
                 raise Exception(f"作品未找到: {rjcode}")
             
-            product = data[0]
             metadata = WorkMetadata()
             metadata.rjcode = product.get('workno', rjcode)
             metadata.work_name = product.get('work_name', '')
@@ -302,7 +288,7 @@ class MetadataService:
             
             return metadata
             
-        except requests.exceptions.RequestException as e:
+        except DLsiteRequestError as e:
             logger.error(f"请求DLsite失败: {e}")
             raise Exception(f"获取元数据失败: {e}")
     
@@ -314,21 +300,12 @@ class MetadataService:
             lang: 语言代码 (如 'zh-CN', 'zh-TW')
             validate_chinese: 是否验证标题不包含日文假名（中文翻译标题通常不包含假名）
         """
-        await asyncio.sleep(self.config.metadata.sleep_interval)
-        
-        url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}&locale={lang}"
-        logger.info(f"[{rjcode}] 调用翻译标题API: {url}")
+        logger.info(f"[{rjcode}] 调用翻译标题API: locale={lang}")
         
         try:
-            response = self.session.get(
-                url,
-                timeout=(self.config.metadata.connect_timeout, self.config.metadata.read_timeout)
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            if data and len(data) > 0:
-                title = data[0].get('work_name')
+            product = await self.client.get_product(rjcode, lang)
+            if product:
+                title = product.get('work_name')
                 if title:
                     logger.info(f"[{rjcode}] API返回标题: {title}")
                     
@@ -368,36 +345,27 @@ class MetadataService:
         kana_ratio = kana_count / total_chars
         return kana_ratio > 0.05
 
-    async def fetch_japanese_metadata(self, rjcode: str) -> Optional[dict]:
+    async def fetch_japanese_metadata(self, rjcode: str, raise_errors: bool = False) -> Optional[dict]:
         """
         获取日语版本的元数据
         用于重命名模板中非标题字段的日语原文
 
         Args:
             rjcode: RJ号
+            raise_errors: 请求失败时抛出异常（否则返回 None，与作品不存在无法区分）
 
         Returns:
             日语元数据字典，包含 maker_name, cvs, tags 等字段
         """
-        await asyncio.sleep(self.config.metadata.sleep_interval)
-
-        # 使用日语 locale 获取原始数据
-        url = f"https://www.dlsite.com/maniax/api/=/product.json?workno={rjcode}&locale=ja-JP"
-        logger.info(f"[{rjcode}] 获取日语元数据: {url}")
+        logger.info(f"[{rjcode}] 获取日语元数据")
 
         try:
-            response = self.session.get(
-                url,
-                timeout=(self.config.metadata.connect_timeout, self.config.metadata.read_timeout)
-            )
-            response.raise_for_status()
-
-            data = response.json()
-            if not data or len(data) == 0:
+            # 使用日语 locale 获取原始数据
+            product = await self.client.get_product(rjcode, 'ja-JP')
+            if not product:
                 logger.warning(f"[{rjcode}] 日语元数据未找到")
                 return None
 
-            product = data[0]
             japanese_metadata = {
                 'rjcode': product.get('workno', rjcode),
                 'work_name': product.get('work_name', ''),
@@ -425,4 +393,6 @@ class MetadataService:
 
         except Exception as e:
             logger.error(f"[{rjcode}] 获取日语元数据失败: {e}")
+            if raise_errors:
+                raise
             return None
@@ -0,0 +1,206 @@
+"""
+密码排序服务
+根据历史命中统计（按社团、文件名模式、全局）为候选密码排序，
+使加密压缩包通常只需 1~2 次 7z 调用即可找到正确密码
+"""
+
+import re
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from ..models.database import PasswordEntry, PasswordStat, WorkMetadata, get_db
+
+logger = logging.getLogger(__name__)
+
+# RJ号派生密码的模板（与 ExtractService._get_rj_passwords 的返回顺序一致）
+RJ_PASSWORD_TEMPLATES = ['{RJ}', '{RJ+1}', '{RJ-1}']
+
+
+class PasswordRanker:
+    """基于命中统计的候选密码排序"""
+
+    # 各统计范围的权重：同社团的命中率最有参考价值
+    MAKER_WEIGHT = 4.0
+    PATTERN_WEIGHT = 2.0
+    GLOBAL_WEIGHT = 1.0
+    # 最近命中的加分窗口（天）
+    RECENCY_DAYS = 30
+
+    def get_rjcode(self, archive_path: str) -> Optional[str]:
+        """从压缩包文件名提取RJ号"""
+        match = re.search(r'[RVB]J(\d{6}|\d{8})(?!\d)', Path(archive_path).name, re.IGNORECASE)
+        return match.group(0).upper() if match else None
+
+    def get_filename_pattern(self, archive_path: str) -> Optional[str]:
+        """提取文件名模式：开头的【】/[]/() 标签（通常是社团或发布者名称）"""
+        match = re.match(r'^\s*[\[【(（]([^\]】)）]+)[\]】)）]', Path(archive_path).name)
+        return match.group(1).strip().lower() if match else None
+
+    def _get_password_keys(self, passwords: List[str], rj_passwords: List[str]) -> Dict[str, str]:
+        """密码 -> 统计键，RJ号派生的密码使用模板，使统计可以跨作品复用"""
+        keys = {pwd: pwd for pwd in passwords}
+        for pwd, template in zip(rj_passwords, RJ_PASSWORD_TEMPLATES):
+            keys[pwd] = template
+        return keys
+
+    @staticmethod
+    def _hit_rate(hits: int, misses: int) -> float:
+        """拉普拉斯平滑的命中率，无数据时为 0.5"""
+        return (hits + 1) / (hits + misses + 2)
+
+    def _recency_bonus(self, last_time: Optional[datetime]) -> float:
+        if not last_time:
+            return 0.0
+        age_days = (datetime.utcnow() - last_time).total_seconds() / 86400
+        if age_days >= self.RECENCY_DAYS:
+            return 0.0
+        return 0.5 * (1 - max(age_days, 0) / self.RECENCY_DAYS)
+
+    def rank(self, archive_path: str, candidates: List[str], rj_passwords: Optional[List[str]] = None) -> List[str]:
+        """按历史命中率为候选密码排序（得分相同时保持原顺序）"""
+        if len(candidates) <= 1:
+            return list(candidates)
+
+        keys = self._get_password_keys(candidates, rj_passwords or [])
+        key_list = list(set(keys.values()))
+        rjcode = self.get_rjcode(archive_path)
+        pattern = self.get_filename_pattern(archive_path)
+
+        stat_columns = (
+            PasswordStat.password_key,
+            func.sum(PasswordStat.hit_count),
+            func.sum(PasswordStat.miss_count),
+            func.max(PasswordStat.last_hit_at)
+        )
+
+        db = next(get_db())
+        try:
+            global_stats = {
+                row[0]: row[1:] for row in db.query(*stat_columns)
+                .filter(PasswordStat.password_key.in_(key_list))
+                .group_by(PasswordStat.password_key).all()
+            }
+
+            pattern_stats = {}
+            if pattern:
+                pattern_stats = {
+                    row[0]: row[1:] for row in db.query(*stat_columns)
+                    .filter(PasswordStat.password_key.in_(key_list), PasswordStat.pattern == pattern)
+                    .group_by(PasswordStat.password_key).all()
+                }
+
+            maker_stats = {}
+            maker_id = None
+            if rjcode:
+                row = db.query(WorkMetadata.maker_id).filter(WorkMetadata.rjcode == rjcode).first()
+                maker_id = row[0] if row else None
+            if maker_id:
+                maker_stats = {
+                    row[0]: row[1:] for row in db.query(*stat_columns)
+                    .join(WorkMetadata, WorkMetadata.rjcode == PasswordStat.rjcode)
+                    .filter(PasswordStat.password_key.in_(key_list), WorkMetadata.maker_id == maker_id)
+                    .group_by(PasswordStat.password_key).all()
+                }
+
+            # 密码库中已有的使用次数（统计表建立之前的历史数据）
+            vault_usage = {
+                row[0]: row[1:] for row in db.query(
+                    PasswordEntry.password,
+                    func.sum(PasswordEntry.use_count),
+                    func.max(PasswordEntry.last_used_at)
+                ).filter(PasswordEntry.password.in_(candidates))
+                .group_by(PasswordEntry.password).all()
+            }
+        except Exception as e:
+            logger.warning(f"[密码排序] 读取统计失败，保持原顺序: {e}")
+            return list(candidates)
+        finally:
+            db.close()
+
+        def score(pwd: str) -> float:
+            key = keys[pwd]
+            total = 0.0
+            last_hit = None
+            for stats, weight in (
+                (maker_stats, self.MAKER_WEIGHT),
+                (pattern_stats, self.PATTERN_WEIGHT),
+                (global_stats, self.GLOBAL_WEIGHT)
+            ):
+                hits, misses, last = stats.get(key, (0, 0, None))
+                total += weight * self._hit_rate(hits or 0, misses or 0)
+                if last and (last_hit is None or last > last_hit):
+                    last_hit = last
+
+            use_count, last_used = vault_usage.get(pwd, (0, None))
+            total += min(use_count or 0, 20) / 40
+            if last_used and (last_hit is None or last_used > last_hit):
+                last_hit = last_used
+            return total + self._recency_bonus(last_hit)
+
+        scores = {pwd: score(pwd) for pwd in candidates}
+        ranked = sorted(candidates, key=lambda pwd: -scores[pwd])
+        logger.debug(f"[密码排序] {Path(archive_path).name} (社团: {maker_id or '未知'}, 模式: {pattern or '无'}): "
+                     f"{[keys[pwd] for pwd in ranked[:5]]}")
+        return ranked
+
+    def record(self, archive_path: str, hit: Optional[str], misses: List[str], rj_passwords: Optional[List[str]] = None):
+        """记录一次密码探测的结果（命中的密码和已确认错误的密码）"""
+        outcomes = [(pwd, False) for pwd in misses if pwd != hit]
+        if hit is not None:
+            outcomes.append((hit, True))
+        if not outcomes:
+            return
+
+        keys = self._get_password_keys([pwd for pwd, _ in outcomes], rj_passwords or [])
+        rjcode = self.get_rjcode(archive_path)
+        pattern = self.get_filename_pattern(archive_path)
+        now = datetime.utcnow()
+
+        db = next(get_db())
+        try:
+            for pwd, is_hit in outcomes:
+                query = db.query(PasswordStat).filter(PasswordStat.password_key == keys[pwd])
+                query = query.filter(PasswordStat.rjcode == rjcode if rjcode else PasswordStat.rjcode.is_(None))
+                query = query.filter(PasswordStat.pattern == pattern if pattern else PasswordStat.pattern.is_(None))
+                stat = query.first()
+                if not stat:
+                    stat = PasswordStat(
+                        password_key=keys[pwd],
+                        rjcode=rjcode,
+                        pattern=pattern,
+                        hit_count=0,
+                        miss_count=0
+                    )
+                    db.add(stat)
+
+                if is_hit:
+                    stat.hit_count = (stat.hit_count or 0) + 1
+                    stat.last_hit_at = now
+                else:
+                    stat.miss_count = (stat.miss_count or 0) + 1
+            db.commit()
+            logger.debug(f"[密码排序] 记录结果: 命中 {keys.get(hit) if hit is not None else '无'}, 未命中 {len(misses)} 个")
+        except Exception as e:
+            logger.warning(f"[密码排序] 记录统计失败: {e}")
+            try:
+                db.rollback()
+            except Exception:
+                pass
+        finally:
+            db.close()
+
+
+# 全局排序服务实例
+_password_ranker: Optional[PasswordRanker] = None
+
+
+def get_password_ranker() -> PasswordRanker:
+    """获取密码排序服务实例"""
+    global _password_ranker
+    if _password_ranker is None:
+        _password_ranker = PasswordRanker()
+    return _password_ranker
@@ -8,6 +8,7 @@ import logging
 
 from ..config.settings import get_config
 from ..core.task_engine import Task
+from .memory_cache import MISSING, get_memory_cache
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,11 @@ class RenameService:
 
     def __init__(self):
         self.config = get_config()
-        self._japanese_metadata_cache = {}  # 缓存日语元数据，避免重复请求
+        # 缓存日语元数据，避免重复请求（各实例共享）
+        self._japanese_metadata_cache = get_memory_cache(
+            'japanese_metadata', self.config.metadata.memory_cache_size, 24 * 3600,
+            self.config.metadata.negative_cache_ttl
+        )
 
     async def rename(self, path: str, task: Task):
         """
@@ -82,17 +87,22 @@ class RenameService:
             日语元数据字典
         """
         # 检查缓存
-        if rjcode in self._japanese_metadata_cache:
-            return self._japanese_metadata_cache[rjcode]
+        cached = self._japanese_metadata_cache.get(rjcode)
+        if cached is not MISSING:
+            return cached
 
         # 从 MetadataService 获取
         from .metadata_service import MetadataService
         metadata_service = MetadataService()
 
-        japanese_metadata = await metadata_service.fetch_japanese_metadata(rjcode)
+        try:
+            japanese_metadata = await metadata_service.fetch_japanese_metadata(rjcode, raise_errors=True)
+        except Exception:
+            # 请求失败（超时、限流等）不缓存，下次重新请求
+            return None
 
-        # 缓存结果
-        self._japanese_metadata_cache[rjcode] = japanese_metadata
+        # 缓存结果（作品不存在时按 negative_cache_ttl 缓存 None）
+        self._japanese_metadata_cache.set(rjcode, japanese_metadata)
 
         return japanese_metadata
 
@@ -0,0 +1,173 @@
+"""分阶段资源池
+
+自动处理流程中不同阶段消耗的资源不同：解压占用 CPU/磁盘，获取元数据等待网络，
+移动到库存占用目标卷的磁盘带宽。每个阶段使用独立的并发限制，
+使任务像流水线一样在各阶段之间流动，而不是整个流程占用同一个并发名额。
+"""
+
+import os
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+import logging
+
+from ..config.settings import get_config
+
+logger = logging.getLogger(__name__)
+
+# 阶段名称 -> ProcessingConfig 中对应的并发数字段
+STAGE_LIMIT_FIELDS = {
+    'extract': 'extract_concurrency',
+    'metadata': 'metadata_concurrency',
+    'move': 'move_concurrency_per_volume',
+}
+
+
+class StageLimiter:
+    """可在运行时调整上限的并发限制器"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for fut in self._waiters if not fut.done())
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 已分配到名额但在恢复前被取消，归还名额
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake_waiters()
+
+    def set_limit(self, limit: int):
+        self.limit = max(1, limit)
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self.active < self.limit:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+
+class StagePools:
+    """按阶段（以及可选的资源键，如目标卷）划分的并发池"""
+
+    def __init__(self):
+        self._limiters: dict[tuple[str, str], StageLimiter] = {}
+
+    def _get_limit(self, stage: str) -> int:
+        field = STAGE_LIMIT_FIELDS.get(stage)
+        if not field:
+            return 1
+        return getattr(get_config().processing, field, 1)
+
+    def _get_limiter(self, stage: str, key: str = '') -> StageLimiter:
+        limiter = self._limiters.get((stage, key))
+        if limiter is None:
+            limiter = StageLimiter(self._get_limit(stage))
+            self._limiters[(stage, key)] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, stage: str, key: str = ''):
+        """占用某阶段的一个并发名额
+
+        Args:
+            stage: 阶段名称（extract, metadata, move）
+            key: 资源键，同一阶段不同键互不影响（如不同的目标卷）
+        """
+        limiter = self._get_limiter(stage, key)
+        if limiter.active >= limiter.limit:
+            logger.debug(f"[StagePools] 等待阶段名额: {stage}{'/' + key if key else ''} "
+                         f"({limiter.active}/{limiter.limit})")
+        await limiter.acquire()
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def apply_config(self):
+        """配置变更后更新所有阶段的并发上限"""
+        for (stage, _key), limiter in self._limiters.items():
+            limiter.set_limit(self._get_limit(stage))
+
+    def get_stats(self) -> dict:
+        """获取各阶段的占用情况"""
+        stats = {}
+        for (stage, key), limiter in self._limiters.items():
+            name = f"{stage}:{key}" if key else stage
+            stats[name] = {
+                'limit': limiter.limit,
+                'active': limiter.active,
+                'waiting': limiter.waiting
+            }
+        return stats
+
+
+def get_pipeline_depth(processing=None) -> int:
+    """任务引擎的工作协程数（同时在流水线中的任务数）
+
+    任务在整个流程中占用一个工作协程，工作协程数少于各阶段并发上限之和时，
+    等待某个阶段（如元数据）的任务会占满工作协程，其他阶段的名额闲置。
+    因此取 max_workers 和各阶段并发上限之和中的较大值。
+    """
+    processing = processing or get_config().processing
+    stage_total = sum(max(1, getattr(processing, field, 1)) for field in STAGE_LIMIT_FIELDS.values())
+    return max(processing.max_workers, stage_total)
+
+
+def get_volume_key(path: str) -> str:
+    """获取路径所在的卷标识（用于按目标卷限制移动并发）"""
+    current = os.path.abspath(path)
+    while current and not os.path.exists(current):
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    try:
+        return str(os.stat(current).st_dev)
+    except OSError:
+        return os.path.splitdrive(current)[0] or '/'
+
+
+def is_cross_device(source: str, target_dir: str) -> bool:
+    """判断移动是否跨设备（跨设备移动需要复制数据，同设备只是重命名）"""
+    try:
+        return get_volume_key(source) != get_volume_key(target_dir)
+    except Exception:
+        return True
+
+
+# 全局阶段资源池实例
+_stage_pools: Optional[StagePools] = None
+
+
+def get_stage_pools() -> StagePools:
+    """获取阶段资源池实例"""
+    global _stage_pools
+    if _stage_pools is None:
+        _stage_pools = StagePools()
+    return _stage_pools
@@ -1,13 +1,16 @@
 import asyncio
 import uuid
+import time
 import os
 import shutil
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional, Callable
 from enum import Enum
 from pathlib import Path
 import logging
 
+from .task_store import RESUMABLE_STATUSES, get_task_store, snapshot_task, split_metadata
+
 logger = logging.getLogger(__name__)
 
 class TaskStatus(str, Enum):
@@ -19,6 +22,11 @@ class TaskStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+# 任务结束的状态（wait_done 默认等待这些状态）
+TERMINAL_STATUSES = frozenset({TaskStatus.COMPLETED, TaskStatus.FAILED})
+# 任务不再排队或执行的状态（包括暂停、等待重试、等待人工处理）
+SETTLED_STATUSES = frozenset(set(TaskStatus) - {TaskStatus.PENDING, TaskStatus.PROCESSING})
+
 class TaskType(str, Enum):
     EXTRACT = "extract"
     FILTER = "filter"
@@ -42,6 +50,9 @@ class Task:
         status: Optional[TaskStatus] = None,
         rjcode: Optional[str] = None
     ):
+        # 变化计数：字段 setter、touch() 和 checkpoint() 时递增，引擎据此判断任务是否需要写库
+        # （直接修改 task_metadata 中的内容后调用 touch()）
+        self.change_count = 0
         self.id = task_id if task_id else str(uuid.uuid4())
         self.type = task_type
         self.status = status if status else TaskStatus.PENDING
@@ -60,12 +71,74 @@ class Task:
         self._pause_event = asyncio.Event()
         self._pause_event.set()
         self.rjcode = rjcode  # 作品的RJ号，用于重复检测
+        self.checkpoints: dict = {}  # 已完成阶段的检查点，重启后从这里继续
+        self._checkpoint_listener: Optional[Callable] = None
+        self._change_listener: Optional[Callable] = None  # 状态或进度变化时调用（用于推送进度）
+        self._path_listener: Optional[Callable] = None  # 源路径变化时调用（用于更新引擎的路径索引）
+
+    @property
+    def status(self) -> TaskStatus:
+        return self._status
+
+    @status.setter
+    def status(self, value: TaskStatus):
+        self._status = value
+        self.change_count += 1
+        # 唤醒 wait_done 的等待者，由它们判断是否已到达等待的状态
+        event = getattr(self, '_status_event', None)
+        self._status_event = asyncio.Event()
+        if event is not None:
+            event.set()
+
+    async def wait_done(self, timeout: Optional[float] = None, until=TERMINAL_STATUSES) -> bool:
+        """等待任务进入 until 中的状态（默认完成或失败），超时返回 False"""
+        if self.status in until:
+            return True
+
+        async def wait():
+            while self.status not in until:
+                await self._status_event.wait()
+
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @property
+    def source_path(self) -> str:
+        return self._source_path
+
+    @source_path.setter
+    def source_path(self, value: str):
+        old = getattr(self, '_source_path', None)
+        self._source_path = value
+        self.change_count += 1
+        listener = getattr(self, '_path_listener', None)
+        if listener and old != value:
+            listener(self, old)
+
+    @property
+    def task_metadata(self) -> dict:
+        return self._task_metadata
+
+    @task_metadata.setter
+    def task_metadata(self, value: dict):
+        self._task_metadata = value
+        self.change_count += 1
+
+    def touch(self):
+        """通知任务有变化（状态方法会自动调用，直接修改 task_metadata 等字段后手动调用）"""
+        self.change_count += 1
+        if self._change_listener:
+            self._change_listener(self)
     
     def start(self):
         """开始任务"""
         self.status = TaskStatus.PROCESSING
         self.started_at = datetime.utcnow()
         self.current_step = "处理中"
+        self.touch()
     
     def complete(self):
         """完成任务"""
@@ -73,6 +146,7 @@ class Task:
         self.completed_at = datetime.utcnow()
         self.progress = 100
         self.current_step = "完成"
+        self.touch()
     
     def fail(self, error: str):
         """任务失败"""
@@ -80,16 +154,19 @@ class Task:
         self.completed_at = datetime.utcnow()
         self.error_message = error
         self.current_step = f"失败: {error}"
+        self.touch()
     
     def pause(self):
         """暂停任务"""
         self.status = TaskStatus.PAUSED
         self._pause_event.clear()
+        self.touch()
     
     def resume(self):
         """恢复任务"""
         self.status = TaskStatus.PROCESSING
         self._pause_event.set()
+        self.touch()
 
     def set_waiting_retry(self, reason: str, retry_after: datetime = None):
         """设置等待重试状态"""
@@ -99,6 +176,7 @@ class Task:
         self.task_metadata['retry_after'] = retry_after.isoformat() if retry_after else None
         self.task_metadata['retry_count'] = self.task_metadata.get('retry_count', 0) + 1
         logger.info(f"任务 {self.id} 进入等待重试状态: {reason}")
+        self.touch()
 
     def can_retry_now(self) -> bool:
         """检查是否可以重试"""
@@ -118,6 +196,7 @@ class Task:
         self.completed_at = datetime.utcnow()
         self.current_step = "已取消"
         logger.info(f"任务 {self.id} 已被用户取消")
+        self.touch()
     
     async def wait_if_paused(self):
         """如果暂停则等待"""
@@ -132,6 +211,24 @@ class Task:
         self.progress = min(100, max(0, progress))
         self.current_step = step
         logger.info(f"任务 {self.id}: {step} ({progress}%)")
+        self.touch()
+
+    def checkpoint(self, stage: str, **data):
+        """记录某个阶段已完成（data 为恢复该阶段结果所需的信息，如输出路径）"""
+        self.checkpoints[stage] = data
+        self.change_count += 1
+        if self._checkpoint_listener:
+            self._checkpoint_listener()
+
+    def get_checkpoint(self, stage: str) -> Optional[dict]:
+        """获取阶段检查点；记录了路径但路径已不存在时视为未完成"""
+        data = self.checkpoints.get(stage)
+        if data is None:
+            return None
+        path = data.get('path')
+        if path and not os.path.exists(path):
+            return None
+        return data
 
 def get_conflict_type_name(conflict_type: str) -> str:
     """获取冲突类型的中文名称"""
@@ -149,16 +246,31 @@ def get_conflict_type_name(conflict_type: str) -> str:
 class TaskEngine:
     """任务引擎 - 管理任务队列和执行"""
 
+    # 任务状态批量写库的间隔（秒）
+    PERSIST_INTERVAL = 1.0
+
     def __init__(self, max_concurrent: int = 2):
-        self.max_concurrent = max_concurrent
+        self.max_concurrent = max(1, max_concurrent)
         self.tasks: dict[str, Task] = {}
         self.queue: asyncio.Queue = asyncio.Queue()
         self.processing: set[str] = set()
         self._processing_rjcodes: set[str] = set()  # 正在处理的RJ号集合，防止并发重复处理
         self._shutdown = False
-        self._worker_task: Optional[asyncio.Task] = None
+        self._started = False
+        self._workers: dict[int, asyncio.Task] = {}  # 工作协程（持有强引用，防止被回收）
+        self._worker_current: dict[int, Optional[str]] = {}  # 工作协程当前处理的任务ID
+        self._retiring_workers: set[int] = set()  # 并发数缩小后待退出的工作协程
+        self._next_worker_id = 0
+        self._finished_count = 0  # 已处理完的任务数（用于统计）
         self._progress_callbacks: list[Callable] = []
         self._retry_scheduler_task: Optional[asyncio.Task] = None  # 重试调度器任务
+        self._persist_task: Optional[asyncio.Task] = None  # 任务持久化协程
+        self._persist_wakeup: Optional[asyncio.Event] = None
+        self._persisted: dict[str, tuple] = {}  # 任务ID -> 上次写入数据库时的状态签名
+        self._path_index: dict[str, set[str]] = {}  # 源路径 -> 任务ID，用于快速判断文件是否已有任务
+        # 任务列表版本号：任何任务变化都会递增，从启动时间（毫秒）开始，重启后不会回退
+        self.revision = int(time.time() * 1000)
+        self._revisions: dict[str, tuple[tuple, int]] = {}  # 任务ID -> (状态签名, 最后变化时的版本号)
 
     def is_rjcode_processing(self, rjcode: str) -> bool:
         """检查RJ号是否正在被处理"""
@@ -181,15 +293,64 @@ class TaskEngine:
     
     async def _notify_progress(self, task: Task):
         """通知进度更新"""
+        self._on_task_changed(task)
+
+    def _on_task_changed(self, task: Task):
         for callback in self._progress_callbacks:
             try:
                 callback(task)
             except Exception as e:
                 logger.error(f"进度回调错误: {e}")
+
+    def _track(self, task: Task):
+        """让任务的检查点、状态和源路径变化通知到引擎"""
+        task._checkpoint_listener = self._request_persist
+        task._change_listener = self._on_task_changed
+        task._path_listener = self._index_path
+        self._index_path(task, None)
+
+    def _index_path(self, task: Task, old_path: Optional[str]):
+        """维护 源路径 -> 任务ID 索引"""
+        if old_path is not None:
+            ids = self._path_index.get(old_path)
+            if ids is not None:
+                ids.discard(task.id)
+                if not ids:
+                    del self._path_index[old_path]
+        if task.source_path:
+            self._path_index.setdefault(task.source_path, set()).add(task.id)
+
+    def _unindex(self, task: Task):
+        task._path_listener = None
+        ids = self._path_index.get(task.source_path)
+        if ids is not None:
+            ids.discard(task.id)
+            if not ids:
+                del self._path_index[task.source_path]
+
+    def register_task(self, task: Task):
+        """登记任务（不入队），用于由调用方直接执行的任务"""
+        self.tasks[task.id] = task
+        self._track(task)
+
+    def remove_task(self, task_id: str) -> Optional[Task]:
+        """从内存中移除任务"""
+        task = self.tasks.pop(task_id, None)
+        if task is not None:
+            self._unindex(task)
+        return task
+
+    def has_active_task(self, source_path: str) -> bool:
+        """源路径是否有待处理或处理中的任务"""
+        for task_id in self._path_index.get(source_path, ()):
+            task = self.tasks.get(task_id)
+            if task and task.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+                return True
+        return False
     
     async def submit(self, task: Task) -> str:
         """提交任务"""
-        self.tasks[task.id] = task
+        self.register_task(task)
         await self.queue.put(task)
         rjcode = self._extract_rjcode(task.source_path) or "未知"
         logger.info(f"[{rjcode}] 任务提交 - ID: {task.id[:8]}..., 源文件: {os.path.basename(task.source_path)}")
@@ -205,6 +366,7 @@ class TaskEngine:
         
         rjcode = self._extract_rjcode(task.source_path) or "未知"
         task.rjcode = rjcode
+        interrupted = False
         logger.info(f"[{rjcode}] ========== 开始处理任务 ==========")
         logger.info(f"[{rjcode}] 任务ID: {task.id}, 类型: {task.type.value}")
         logger.info(f"[{rjcode}] 源路径: {task.source_path}")
@@ -227,7 +389,13 @@ class TaskEngine:
                 task.update_progress(5, "预检中")
                 rjcode = self._extract_rjcode(task.source_path)
                 logger.debug(f"[{rjcode}] 提取到的RJ号: {rjcode}")
-                if config.auto_process.check_duplicate and rjcode and task.auto_classify:
+                if task.checkpoints:
+                    # 重启前已通过预检并完成部分阶段，直接从检查点继续
+                    logger.info(f"[{rjcode}] 从检查点恢复，已完成阶段: {list(task.checkpoints)}")
+                    if rjcode:
+                        self.mark_rjcode_processing(rjcode)
+                        task.rjcode = rjcode
+                elif config.auto_process.check_duplicate and rjcode and task.auto_classify:
                     is_duplicate = await classifier.check_duplicate_before_extract(rjcode, task, self)
                     logger.debug(f"[{rjcode}] 重复检查结果: {is_duplicate}")
                     if is_duplicate:
@@ -237,15 +405,28 @@ class TaskEngine:
                         task.completed_at = datetime.utcnow()
                         return
 
+                classify_checkpoint = task.get_checkpoint('classify')
+                if classify_checkpoint:
+                    # 已移动到库存，只剩归档
+                    task.output_path = classify_checkpoint['path']
+                    logger.info(f"[{rjcode}] 智能分类已完成，跳过: {task.output_path}")
+                    await self._finish_auto_process(task, config, rjcode)
+                    return
+
                 # 步骤1: 解压
                 logger.debug(f"[{rjcode}] 步骤1: 解压")
-                if config.auto_process.extract:
+                extract_checkpoint = task.get_checkpoint('extract')
+                if extract_checkpoint:
+                    extracted_path = extract_checkpoint['path']
+                    logger.info(f"[{rjcode}] 解压已完成并验证，跳过: {extracted_path}")
+                elif config.auto_process.extract:
                     task.update_progress(10, "解压中")
                     extracted_path = await extract_service.extract(task)
                     logger.debug(f"[{rjcode}] 解压结果路径: {extracted_path}")
                     if not extracted_path:
                         logger.error(f"[{rjcode}] 解压失败，任务终止")
                         return
+                    task.checkpoint('extract', path=extracted_path)
                 else:
                     logger.info(f"[{rjcode}] 步骤[解压]已禁用，跳过")
                     extracted_path = task.source_path
@@ -260,11 +441,15 @@ class TaskEngine:
 
                 # 步骤2: 获取元数据
                 logger.debug(f"[{rjcode}] 步骤2: 获取元数据")
-                if config.auto_process.fetch_metadata:
+                if task.get_checkpoint('metadata') is not None:
+                    metadata = task.task_metadata
+                    logger.info(f"[{rjcode}] 元数据已获取，跳过")
+                elif config.auto_process.fetch_metadata:
                     task.update_progress(40, "获取元数据")
                     metadata = await metadata_service.fetch(extracted_path, task)
                     logger.debug(f"[{rjcode}] 元数据: {metadata.get('work_name', '未知')}")
                     task.task_metadata = metadata
+                    task.checkpoint('metadata')
                 else:
                     logger.info(f"[{rjcode}] 步骤[获取元数据]已禁用，跳过")
                     metadata = {'rjcode': rjcode}
@@ -276,12 +461,17 @@ class TaskEngine:
 
                 # 步骤3: 重命名
                 logger.debug(f"[{rjcode}] 步骤3: 重命名")
-                if config.auto_process.rename:
+                rename_checkpoint = task.get_checkpoint('rename')
+                if rename_checkpoint:
+                    renamed_path = rename_checkpoint['path']
+                    logger.info(f"[{rjcode}] 重命名已完成，跳过: {renamed_path}")
+                elif config.auto_process.rename:
                     task.update_progress(60, "重命名文件夹")
                     from .rename_service import RenameService
                     rename_service = RenameService()
                     renamed_path = await rename_service.rename(extracted_path, task)
                     logger.debug(f"[{rjcode}] 重命名后路径: {renamed_path}")
+                    task.checkpoint('rename', path=renamed_path)
                 else:
                     logger.info(f"[{rjcode}] 步骤[重命名]已禁用，跳过")
                     renamed_path = extracted_path
@@ -310,6 +500,7 @@ class TaskEngine:
                     rename_service = RenameService()
                     renamed_path = rename_service._flatten_single_subfolder(renamed_path)
                     logger.debug(f"[{rjcode}] 扁平化后路径: {renamed_path}")
+                    task.checkpoint('rename', path=renamed_path)
 
                 if config.rename.remove_empty_folders:
                     task.update_progress(79, "清理空文件夹")
@@ -344,21 +535,9 @@ class TaskEngine:
                     if not config.auto_process.classify:
                         logger.info(f"[{rjcode}] 步骤[智能分类]已禁用，跳过")
                     task.output_path = renamed_path
+                task.checkpoint('classify', path=task.output_path)
 
-                # 步骤7: 归档压缩包
-                logger.debug(f"[{rjcode}] 步骤7: 归档压缩包")
-                if config.auto_process.archive and not task.skip_archive:
-                    task.update_progress(95, "归档压缩包")
-                    await self._archive_source_file(task)
-                else:
-                    if task.skip_archive:
-                        logger.info(f"[{rjcode}] 重新处理模式，跳过归档")
-                    else:
-                        logger.info(f"[{rjcode}] 步骤[归档压缩包]已禁用，跳过")
-
-                task.update_progress(100, "完成")
-                task.complete()
-                logger.info(f"[{rjcode}] ========== 任务完成 ==========")
+                await self._finish_auto_process(task, config, rjcode)
                 
             elif task.type == TaskType.PROCESS_EXISTING_FOLDER:
                 from ..config.settings import get_config
@@ -376,7 +555,21 @@ class TaskEngine:
                 task.update_progress(5, "预检中")
                 rjcode = self._extract_rjcode(existing_folder_path)
                 logger.debug(f"[{rjcode}] 提取到的RJ号: {rjcode}")
-                if config.process_existing.check_duplicate and rjcode and task.auto_classify:
+                if task.checkpoints:
+                    # 重启前已通过预检并完成部分阶段，直接从检查点继续
+                    logger.info(f"[{rjcode}] 从检查点恢复，已完成阶段: {list(task.checkpoints)}")
+                    if rjcode:
+                        self.mark_rjcode_processing(rjcode)
+                        task.rjcode = rjcode
+                    classify_checkpoint = task.get_checkpoint('classify')
+                    if classify_checkpoint:
+                        task.output_path = classify_checkpoint['path']
+                        logger.info(f"[{rjcode}] 智能分类已完成，跳过: {task.output_path}")
+                        task.update_progress(100, "完成")
+                        task.complete()
+                        logger.info(f"[{rjcode}] ========== 任务完成 ==========")
+                        return
+                elif config.process_existing.check_duplicate and rjcode and task.auto_classify:
                     from .duplicate_service import get_duplicate_service
                     duplicate_service = get_duplicate_service()
 
@@ -434,11 +627,15 @@ class TaskEngine:
 
                 # 步骤1: 获取元数据
                 logger.debug(f"[{rjcode}] 步骤1: 获取元数据")
-                if config.process_existing.fetch_metadata:
+                if task.get_checkpoint('metadata') is not None:
+                    metadata = task.task_metadata
+                    logger.info(f"[{rjcode}] 元数据已获取，跳过")
+                elif config.process_existing.fetch_metadata:
                     task.update_progress(30, "获取元数据")
                     metadata = await metadata_service.fetch(extracted_path, task)
                     logger.debug(f"[{rjcode}] 元数据: {metadata.get('work_name', '未知')}")
                     task.task_metadata = metadata
+                    task.checkpoint('metadata')
                 else:
                     logger.info(f"[{rjcode}] 步骤[获取元数据]已禁用，跳过")
                     metadata = {'rjcode': rjcode}
@@ -450,12 +647,17 @@ class TaskEngine:
 
                 # 步骤2: 重命名
                 logger.debug(f"[{rjcode}] 步骤2: 重命名")
-                if config.process_existing.rename:
+                rename_checkpoint = task.get_checkpoint('rename')
+                if rename_checkpoint:
+                    renamed_path = rename_checkpoint['path']
+                    logger.info(f"[{rjcode}] 重命名已完成，跳过: {renamed_path}")
+                elif config.process_existing.rename:
                     task.update_progress(50, "重命名文件夹")
                     from .rename_service import RenameService
                     rename_service = RenameService()
                     renamed_path = await rename_service.rename(extracted_path, task)
                     logger.debug(f"[{rjcode}] 重命名后路径: {renamed_path}")
+                    task.checkpoint('rename', path=renamed_path)
                 else:
                     logger.info(f"[{rjcode}] 步骤[重命名]已禁用，跳过")
                     renamed_path = extracted_path
@@ -483,6 +685,7 @@ class TaskEngine:
                     rename_service = RenameService()
                     renamed_path = rename_service._flatten_single_subfolder(renamed_path)
                     logger.debug(f"[{rjcode}] 扁平化后路径: {renamed_path}")
+                    task.checkpoint('rename', path=renamed_path)
 
                 if config.rename.remove_empty_folders:
                     task.update_progress(78, "清理空文件夹")
@@ -567,6 +770,7 @@ class TaskEngine:
                     if not config.process_existing.classify:
                         logger.info(f"[{rjcode}] 步骤[智能分类]已禁用，跳过")
                     task.output_path = renamed_path
+                task.checkpoint('classify', path=task.output_path)
 
                 task.update_progress(100, "完成")
                 task.complete()
@@ -594,43 +798,127 @@ class TaskEngine:
                     task.complete()
                     logger.info(f"[{rjcode}] ========== 任务完成 ==========")
                 
+        except asyncio.CancelledError:
+            # 关闭或取消时中断：保留临时文件，重启后从检查点继续
+            interrupted = True
+            raise
         except Exception as e:
             logger.error(f"[{rjcode}] 任务失败: {e}", exc_info=True)
             task.fail(str(e))
             logger.info(f"[{rjcode}] ========== 任务失败 ==========")
         finally:
-            # 清理任务产生的临时文件（无论成功还是失败）
-            await self._cleanup_failed_task(task)
+            # 清理任务产生的临时文件（无论成功还是失败）；中断、可恢复的任务不清理
+            if interrupted or self._shutdown or task.status.value in RESUMABLE_STATUSES:
+                logger.info(f"[{rjcode}] 任务未结束（{task.status.value}），保留临时文件")
+            else:
+                await self._cleanup_failed_task(task)
             self.processing.discard(task.id)
             # 清除RJ号处理标记
             if task.rjcode:
                 self.unmark_rjcode_processing(task.rjcode)
             await self._notify_progress(task)
     
-    async def _worker(self):
-        """工作线程"""
-        while not self._shutdown:
-            try:
-                # 控制并发数
-                while len(self.processing) >= self.max_concurrent:
-                    await asyncio.sleep(0.1)
-                
-                task = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+    async def _finish_auto_process(self, task: Task, config, rjcode: Optional[str]):
+        """自动处理的最后一步：归档压缩包并完成任务"""
+        # 步骤7: 归档压缩包
+        logger.debug(f"[{rjcode}] 步骤7: 归档压缩包")
+        if config.auto_process.archive and not task.skip_archive:
+            task.update_progress(95, "归档压缩包")
+            await self._archive_source_file(task)
+        else:
+            if task.skip_archive:
+                logger.info(f"[{rjcode}] 重新处理模式，跳过归档")
+            else:
+                logger.info(f"[{rjcode}] 步骤[归档压缩包]已禁用，跳过")
+
+        task.update_progress(100, "完成")
+        task.complete()
+        logger.info(f"[{rjcode}] ========== 任务完成 ==========")
+
+    async def _worker(self, worker_id: int):
+        """工作协程：阻塞等待队列，逐个处理任务"""
+        try:
+            while not self._shutdown:
+                task = await self.queue.get()
+                self._worker_current[worker_id] = task.id
                 self.processing.add(task.id)
-                
-                # 创建任务处理协程
-                asyncio.create_task(self._process_task(task))
-                
-            except asyncio.TimeoutError:
-                continue
-            except Exception as e:
-                logger.error(f"工作线程错误: {e}")
-    
+                try:
+                    await self._process_task(task)
+                except Exception as e:
+                    logger.error(f"工作协程 {worker_id} 处理任务异常: {e}", exc_info=True)
+                finally:
+                    self._worker_current[worker_id] = None
+                    self._finished_count += 1
+                    self.queue.task_done()
+
+                # 并发数缩小后，多余的工作协程在完成当前任务后退出
+                if worker_id in self._retiring_workers:
+                    logger.info(f"工作协程 {worker_id} 已退出（并发数调整）")
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._workers.pop(worker_id, None)
+            self._worker_current.pop(worker_id, None)
+            self._retiring_workers.discard(worker_id)
+
+    def _spawn_worker(self):
+        """创建一个工作协程"""
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        self._worker_current[worker_id] = None
+        self._workers[worker_id] = asyncio.create_task(self._worker(worker_id))
+
+    def _resize_workers(self):
+        """根据 max_concurrent 增减工作协程"""
+        active = [wid for wid in self._workers if wid not in self._retiring_workers]
+        diff = self.max_concurrent - len(active)
+        if diff > 0:
+            for _ in range(diff):
+                self._spawn_worker()
+        elif diff < 0:
+            # 优先退出空闲的工作协程（直接取消），忙碌的在完成当前任务后退出
+            surplus = sorted(active, key=lambda wid: self._worker_current.get(wid) is not None)[:-diff]
+            for wid in surplus:
+                if self._worker_current.get(wid) is None:
+                    self._worker_current.pop(wid, None)
+                    self._workers.pop(wid).cancel()
+                else:
+                    self._retiring_workers.add(wid)
+
+    def set_max_concurrent(self, max_concurrent: int):
+        """运行时调整最大并发数"""
+        max_concurrent = max(1, int(max_concurrent))
+        if max_concurrent == self.max_concurrent:
+            return
+        logger.info(f"任务引擎并发数调整: {self.max_concurrent} -> {max_concurrent}")
+        self.max_concurrent = max_concurrent
+        if self._started and not self._shutdown:
+            self._resize_workers()
+
+    def get_stats(self) -> dict:
+        """获取队列深度、工作协程利用率和各阶段资源占用"""
+        from .stage_pools import get_stage_pools
+
+        busy = sum(1 for task_id in self._worker_current.values() if task_id)
+        workers = len(self._workers)
+        return {
+            'max_concurrent': self.max_concurrent,
+            'workers': workers,
+            'busy_workers': busy,
+            'idle_workers': workers - busy,
+            'queue_size': self.queue.qsize(),
+            'utilization': round(busy / self.max_concurrent, 2),
+            'finished_count': self._finished_count,
+            'stages': get_stage_pools().get_stats()
+        }
+
     def start(self):
         """启动引擎"""
-        if not self._worker_task:
-            self._worker_task = asyncio.create_task(self._worker())
-            logger.info("任务引擎已启动")
+        if not self._started:
+            self._started = True
+            self._resize_workers()
+            logger.info(f"任务引擎已启动，工作协程数: {self.max_concurrent}")
 
         # 启动重试调度器
         if not self._retry_scheduler_task:
@@ -640,6 +928,223 @@ class TaskEngine:
         # 加载等待重试的任务
         self.load_waiting_retry_tasks()
 
+        # 恢复重启前未完成的任务，并启动任务持久化
+        if not self._persist_task:
+            self.restore_tasks()
+            self._persist_wakeup = asyncio.Event()
+            self._persist_task = asyncio.create_task(self._persist_loop())
+
+    def _request_persist(self):
+        """阶段检查点变化后尽快写库，缩短崩溃时丢失进度的窗口"""
+        if self._persist_wakeup is not None:
+            self._persist_wakeup.set()
+
+    @staticmethod
+    def _persist_signature(task: Task) -> tuple:
+        return (
+            task.status, task.progress, task.current_step, task.source_path, task.output_path,
+            task.error_message, task.started_at, task.completed_at, task.rjcode, task.change_count
+        )
+
+    def _collect_dirty_snapshots(self) -> list[dict]:
+        """收集上次写库后有变化的任务快照"""
+        snapshots = []
+        for task in list(self.tasks.values()):
+            signature = self._persist_signature(task)
+            if self._persisted.get(task.id) != signature:
+                snapshots.append(snapshot_task(task))
+                self._persisted[task.id] = signature
+        return snapshots
+
+    async def _persist_loop(self):
+        """定期把有变化的任务批量写入 tasks 表"""
+        store = get_task_store()
+        while not self._shutdown:
+            try:
+                await asyncio.wait_for(self._persist_wakeup.wait(), timeout=self.PERSIST_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._persist_wakeup.clear()
+
+            snapshots = self._collect_dirty_snapshots()
+            if not snapshots:
+                continue
+            try:
+                await asyncio.to_thread(store.save, snapshots)
+            except Exception:
+                # 下一轮重新写入这些任务
+                for snap in snapshots:
+                    self._persisted.pop(snap['id'], None)
+                await asyncio.sleep(self.PERSIST_INTERVAL)
+                continue
+            self._evict_finished()
+
+    def _evict_finished(self) -> int:
+        """把已结束且已写库的任务移出内存：超过保留时间的，以及超出数量上限的最旧任务"""
+        from ..config.settings import get_config
+
+        processing_config = get_config().processing
+        finished = sorted(
+            (t for t in self.tasks.values()
+             if t.status in (TaskStatus.COMPLETED, TaskStatus.FAILED) and t.completed_at
+             and self._persisted.get(t.id) == self._persist_signature(t)),
+            key=lambda t: t.completed_at
+        )
+        cutoff = datetime.utcnow() - timedelta(minutes=processing_config.task_retention_minutes)
+        overflow = len(finished) - processing_config.task_history_size
+        evicted = [t for i, t in enumerate(finished) if i < overflow or t.completed_at < cutoff]
+
+        for task in evicted:
+            self.remove_task(task.id)
+            self._persisted.pop(task.id, None)
+            self._revisions.pop(task.id, None)
+        if evicted:
+            self.revision += 1
+            logger.debug(f"[任务持久化] {len(evicted)} 个已结束任务移出内存")
+        return len(evicted)
+
+    def sync_revision(self) -> int:
+        """检查任务变化并更新版本号，返回当前版本号"""
+        for task in list(self.tasks.values()):
+            signature = self._persist_signature(task)
+            known = self._revisions.get(task.id)
+            if known is None or known[0] != signature:
+                self.revision += 1
+                self._revisions[task.id] = (signature, self.revision)
+        return self.revision
+
+    def get_changed_tasks(self, since: int) -> list[Task]:
+        """获取版本号 since 之后有变化的任务，按创建时间倒序排列"""
+        self.sync_revision()
+        changed = [self.tasks[task_id] for task_id, (_, revision) in self._revisions.items()
+                   if revision > since and task_id in self.tasks]
+        return sorted(changed, key=lambda t: t.created_at, reverse=True)
+
+    def query_tasks(self, statuses: Optional[list[str]] = None, rjcode: Optional[str] = None,
+                    cursor: Optional[tuple[datetime, str]] = None,
+                    limit: Optional[int] = 100) -> tuple[list[Task], bool]:
+        """分页查询任务（内存中的任务和已移出内存的历史任务），按创建时间倒序
+
+        cursor 为上一页最后一个任务的 (created_at, id)，limit 为 None 时返回全部匹配的任务。
+        返回 (任务列表, 是否还有下一页)。需在事件循环线程中调用，见 query_tasks_async。
+        """
+        live, live_ids = self._snapshot_live_tasks(statuses, rjcode, cursor)
+        return self._merge_archived_tasks(live, live_ids, statuses, rjcode, cursor, limit)
+
+    async def query_tasks_async(self, statuses: Optional[list[str]] = None, rjcode: Optional[str] = None,
+                                cursor: Optional[tuple[datetime, str]] = None,
+                                limit: Optional[int] = 100) -> tuple[list[Task], bool]:
+        """同 query_tasks：在事件循环中取内存任务的快照，只在线程池中查询数据库"""
+        live, live_ids = self._snapshot_live_tasks(statuses, rjcode, cursor)
+        return await asyncio.to_thread(
+            self._merge_archived_tasks, live, live_ids, statuses, rjcode, cursor, limit
+        )
+
+    def _snapshot_live_tasks(self, statuses: Optional[list[str]], rjcode: Optional[str],
+                             cursor: Optional[tuple[datetime, str]]) -> tuple[list[Task], set[str]]:
+        """筛选内存中的任务（self.tasks 只在事件循环中修改，不能在线程池中遍历）"""
+        rjcode = rjcode.upper() if rjcode else None
+
+        def matches(task: Task) -> bool:
+            if statuses and task.status.value not in statuses:
+                return False
+            if rjcode and (task.rjcode or '').upper() != rjcode:
+                return False
+            if cursor and (task.created_at, task.id) >= cursor:
+                return False
+            return True
+
+        return [t for t in self.tasks.values() if matches(t)], set(self.tasks)
+
+    def _merge_archived_tasks(self, live: list[Task], live_ids: set[str], statuses: Optional[list[str]],
+                              rjcode: Optional[str], cursor: Optional[tuple[datetime, str]],
+                              limit: Optional[int]) -> tuple[list[Task], bool]:
+        """查询数据库中的历史任务，与内存任务的快照合并排序"""
+        rjcode = rjcode.upper() if rjcode else None
+        # 数据库中也有内存任务的快照，多取这部分数量后再去重
+        try:
+            rows = get_task_store().query(
+                statuses, rjcode, cursor, None if limit is None else limit + 1 + len(live_ids)
+            )
+        except Exception as e:
+            logger.error(f"[任务持久化] 查询历史任务失败: {e}")
+            rows = []
+        archived = [self._task_from_row(row) for row in rows if row.id not in live_ids]
+
+        merged = sorted(live + [t for t in archived if t is not None],
+                        key=lambda t: (t.created_at, t.id), reverse=True)
+        if limit is None:
+            return merged, False
+        return merged[:limit], len(merged) > limit
+
+    def load_task(self, task_id: str) -> Optional[Task]:
+        """获取任务，不在内存中时从历史任务中读取（只读）"""
+        task = self.tasks.get(task_id)
+        if task is not None:
+            return task
+        try:
+            row = get_task_store().get(task_id)
+        except Exception as e:
+            logger.error(f"[任务持久化] 读取任务失败: {task_id}, {e}")
+            return None
+        return self._task_from_row(row) if row is not None else None
+
+    @staticmethod
+    def _task_from_row(row) -> Optional[Task]:
+        """从 tasks 表的一行重建任务对象"""
+        try:
+            task_type = TaskType(row.type)
+            status = TaskStatus(row.status)
+        except ValueError:
+            logger.warning(f"[任务持久化] 未知任务类型或状态 {row.type}/{row.status}，跳过: {row.id}")
+            return None
+        metadata, engine_fields = split_metadata(row)
+        task = Task(
+            task_type=task_type,
+            source_path=row.source_path,
+            output_path=row.output_path,
+            auto_classify=engine_fields.get('auto_classify', False),
+            metadata=metadata,
+            skip_archive=engine_fields.get('skip_archive', False),
+            task_id=row.id,
+            rjcode=engine_fields.get('rjcode')
+        )
+        task.status = status
+        task.progress = row.progress or 0
+        task.current_step = row.current_step or ""
+        task.error_message = row.error_message
+        task.checkpoints = engine_fields.get('checkpoints') or {}
+        task.created_at = row.created_at or task.created_at
+        task.started_at = row.started_at
+        task.completed_at = row.completed_at
+        return task
+
+    def restore_tasks(self) -> int:
+        """从 tasks 表恢复重启前未完成的任务，按原提交顺序重新入队"""
+        try:
+            rows = get_task_store().load_resumable()
+        except Exception as e:
+            logger.error(f"[任务持久化] 读取未完成任务失败: {e}", exc_info=True)
+            return 0
+
+        restored = 0
+        for row in rows:
+            if row.id in self.tasks:
+                continue
+            task = self._task_from_row(row)
+            if task is None:
+                continue
+            task.status = TaskStatus.PENDING
+            task.started_at = None
+            task.current_step = "重启后恢复" if task.checkpoints else "等待中"
+            self.register_task(task)
+            self.queue.put_nowait(task)
+            restored += 1
+
+        if restored:
+            logger.info(f"[任务持久化] 已恢复 {restored} 个未完成任务")
+        return restored
+
     async def _retry_scheduler(self):
         """定时重试调度器，使用cron表达式"""
         from croniter import croniter
@@ -696,10 +1201,20 @@ class TaskEngine:
     def stop(self):
         """停止引擎"""
         self._shutdown = True
-        if self._worker_task:
-            self._worker_task.cancel()
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        self._workers.clear()
+        self._worker_current.clear()
         if self._retry_scheduler_task:
             self._retry_scheduler_task.cancel()
+        if self._persist_task:
+            self._persist_task.cancel()
+            self._persist_task = None
+        # 写入最后的状态，未完成的任务下次启动时恢复
+        try:
+            get_task_store().save(self._collect_dirty_snapshots())
+        except Exception as e:
+            logger.error(f"[任务持久化] 关闭时写入任务失败: {e}")
 
     def retry_task(self, task_id: str):
         """手动重试等待中的任务"""
@@ -712,7 +1227,7 @@ class TaskEngine:
             if task.status == TaskStatus.WAITING_RETRY:
                 task.status = TaskStatus.PENDING
                 task.current_step = "等待重试"
-                asyncio.create_task(self.queue.put(task))
+                self.queue.put_nowait(task)
                 logger.info(f"[重试] 任务 {task_id} ({task.rjcode}) 已加入重试队列")
                 return True
             else:
@@ -738,8 +1253,8 @@ class TaskEngine:
                     task.task_metadata['subtitle_folder'] = wt.subtitle_folder
                     task.task_metadata['work_title'] = wt.work_title
                     task.current_step = "手动重试"
-                    self.tasks[task.id] = task
-                    asyncio.create_task(self.queue.put(task))
+                    self.register_task(task)
+                    self.queue.put_nowait(task)
                     # 从等待重试表删除
                     db.delete(wt)
                     db.commit()
@@ -916,7 +1431,7 @@ class TaskEngine:
                 task.task_metadata['retry_after'] = wt.retry_after.isoformat() if wt.retry_after else None
                 task.current_step = f"等待重试: {wt.retry_reason}"
 
-                self.tasks[task.id] = task
+                self.register_task(task)
                 loaded_count += 1
                 logger.info(f"[等待重试] 加载任务 {wt.rjcode}, 重试次数: {wt.retry_count}")
 
@@ -980,6 +1495,15 @@ class TaskEngine:
         
         config = get_config()
         cleaned_paths = []
+        # 检查点记录的路径（及其上级目录）不删除，恢复任务时要用到
+        protected = [
+            os.path.normpath(data['path']) for data in task.checkpoints.values()
+            if isinstance(data, dict) and data.get('path')
+        ]
+        
+        def removable(path: str) -> bool:
+            path = os.path.normpath(path)
+            return not any(p == path or p.startswith(path.rstrip(os.sep) + os.sep) for p in protected)
         
         # 对于 PROCESS_EXISTING_FOLDER 类型，成功完成的任务不需要清理
         # 因为文件夹是直接从已有目录处理的，不是临时文件
@@ -994,7 +1518,7 @@ class TaskEngine:
             return
         
         # 1. 清理 output_path（如果已设置）- 只针对失败的任务
-        if task.status == TaskStatus.FAILED and task.output_path and os.path.exists(task.output_path):
+        if task.status == TaskStatus.FAILED and task.output_path and os.path.exists(task.output_path) and removable(task.output_path):
             try:
                 shutil.rmtree(task.output_path)
                 cleaned_paths.append(task.output_path)
@@ -1018,7 +1542,7 @@ class TaskEngine:
             
             for name in possible_names:
                 path = os.path.join(temp_path, name)
-                if os.path.exists(path) and path not in cleaned_paths:
+                if os.path.exists(path) and path not in cleaned_paths and removable(path):
                     try:
                         shutil.rmtree(path)
                         cleaned_paths.append(path)
@@ -1034,7 +1558,7 @@ class TaskEngine:
                 temp_path = config.storage.temp_path
                 potential_path = os.path.join(temp_path, source_name)
                 
-                if os.path.exists(potential_path) and potential_path not in cleaned_paths:
+                if os.path.exists(potential_path) and potential_path not in cleaned_paths and removable(potential_path):
                     try:
                         shutil.rmtree(potential_path)
                         logger.info(f"清理解压失败残留: {potential_path}")
@@ -1050,6 +1574,7 @@ class TaskEngine:
         from datetime import datetime
         from ..config.settings import get_config
         from ..models.database import ProcessedArchive, get_db
+        from .stage_pools import get_stage_pools, get_volume_key, is_cross_device
 
         config = get_config()
         source_path = task.source_path
@@ -1205,8 +1730,12 @@ class TaskEngine:
                     dest_path = os.path.join(processed_dir, f"{name}({counter}){ext}")
                     counter += 1
 
-                # 移动文件
-                shutil.move(file_path, dest_path)
+                # 移动文件（跨设备时需要复制数据，按目标卷限制并发并放到线程中执行）
+                if is_cross_device(file_path, processed_dir):
+                    async with get_stage_pools().slot('move', get_volume_key(processed_dir)):
+                        await asyncio.to_thread(shutil.move, file_path, dest_path)
+                else:
+                    shutil.move(file_path, dest_path)
                 logger.info(f"压缩包已归档: {file_path} -> {dest_path}")
                 archived_files.append((filename, dest_path, file_path))
 
@@ -1336,6 +1865,7 @@ class TaskEngine:
                         'status': 'downloading'
                     })
                 task.task_metadata['download_files'] = files
+                task.touch()
 
             def check_pause():
                 """检查任务是否被暂停"""
@@ -1347,12 +1877,27 @@ class TaskEngine:
                 filter_rules=filter_rules,
                 progress_callback=progress_callback,
                 file_progress_callback=file_progress_callback,
-                check_pause=check_pause
+                check_pause=check_pause,
+                subtitle_folder=subtitle_folder
             )
 
+            # 与上次同步相比没有变化（上次交付的文件夹仍在，字幕文件夹已处理过），不需要后续步骤
+            if download_result.get('up_to_date'):
+                logger.info(f"[{rjcode}] 与上次同步相比没有变化，跳过 {download_result.get('skipped_files', 0)} 个文件")
+                manifest = download_result['manifest']
+                asmr_service.save_manifest(manifest, manifest.output_path, manifest.subtitle_folder)
+                task.output_path = manifest.output_path
+                task.task_metadata['up_to_date'] = True
+                if os.path.isdir(download_dir) and not os.listdir(download_dir):
+                    os.rmdir(download_dir)
+                task.update_progress(100, "已是最新")
+                task.complete()
+                return
+
             # 保存失败文件列表
             if download_result.get('failed_files'):
                 task.task_metadata['failed_files'] = download_result['failed_files']
+                task.touch()
 
             # 处理暂停情况
             if download_result.get('paused'):
@@ -1573,6 +2118,9 @@ class TaskEngine:
             else:
                 logger.info(f"[{rjcode}] 步骤[移动字幕文件夹]已禁用，跳过")
 
+            # 整个流程成功后才记录同步清单，失败重试或新的字幕文件夹不会被误判为已是最新
+            asmr_service.save_manifest(download_result.get('manifest'), task.output_path, subtitle_folder)
+
             task.update_progress(100, "完成")
             task.complete()
             logger.info(f"[{rjcode}] ASMR 同步下载任务完成")
@@ -1596,5 +2144,7 @@ def get_task_engine() -> TaskEngine:
     """获取任务引擎实例"""
     global _task_engine
     if _task_engine is None:
-        _task_engine = TaskEngine()
+        from ..config.settings import get_config
+        from .stage_pools import get_pipeline_depth
+        _task_engine = TaskEngine(max_concurrent=get_pipeline_depth(get_config().processing))
     return _task_engine
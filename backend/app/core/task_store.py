@@ -0,0 +1,155 @@
+"""任务持久化
+
+把任务引擎中的任务写入 tasks 表，重启后恢复未完成的任务。
+
+任务状态、进度和阶段检查点在内存中变化，引擎定期把有变化的任务快照批量写入数据库，
+不在每次状态变化时单独写库。tasks 表没有的字段（是否自动分类、是否跳过归档、RJ号、
+阶段检查点）保存在 task_metadata JSON 的保留键中，读出时再拆开。
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import and_, func, or_
+
+from ..models.database import Task as TaskModel, get_db
+
+logger = logging.getLogger(__name__)
+
+# task_metadata 中保存引擎字段的保留键
+ENGINE_KEY = '_engine'
+
+# 重启后需要恢复执行的状态
+RESUMABLE_STATUSES = ('pending', 'processing', 'paused')
+
+
+def _value(status) -> str:
+    return getattr(status, 'value', status)
+
+
+def _jsonable(data):
+    """元数据中可能混有 datetime 等对象，统一转换成可写入 JSON 列的值"""
+    return json.loads(json.dumps(data, default=str, ensure_ascii=False))
+
+
+def snapshot_task(task) -> Dict:
+    """把内存中的任务转换成 tasks 表的一行"""
+    metadata = dict(task.task_metadata or {})
+    metadata[ENGINE_KEY] = {
+        'auto_classify': task.auto_classify,
+        'skip_archive': task.skip_archive,
+        'rjcode': task.rjcode,
+        'checkpoints': task.checkpoints,
+    }
+    return {
+        'id': task.id,
+        'type': _value(task.type),
+        'status': _value(task.status),
+        'source_path': task.source_path,
+        'output_path': task.output_path,
+        'progress': task.progress,
+        'current_step': task.current_step,
+        'error_message': task.error_message,
+        'created_at': task.created_at,
+        'started_at': task.started_at,
+        'completed_at': task.completed_at,
+        'task_metadata': _jsonable(metadata),
+    }
+
+
+def split_metadata(row: TaskModel) -> Tuple[Dict, Dict]:
+    """把持久化的 task_metadata 拆成 (任务元数据, 引擎字段)"""
+    metadata = dict(row.task_metadata or {})
+    engine_fields = metadata.pop(ENGINE_KEY, None) or {}
+    return metadata, engine_fields
+
+
+class TaskStore:
+    """tasks 表读写"""
+
+    def save(self, snapshots: List[Dict]):
+        """批量写入任务快照（按 ID 插入或更新）"""
+        if not snapshots:
+            return
+        db = next(get_db())
+        try:
+            existing = {
+                row.id: row for row in
+                db.query(TaskModel).filter(TaskModel.id.in_([s['id'] for s in snapshots])).all()
+            }
+            for snap in snapshots:
+                row = existing.get(snap['id'])
+                if row is None:
+                    db.add(TaskModel(**snap))
+                else:
+                    for key, value in snap.items():
+                        setattr(row, key, value)
+            db.commit()
+        except Exception as e:
+            logger.error(f"[任务持久化] 写入 {len(snapshots)} 个任务失败: {e}")
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def load_resumable(self) -> List[TaskModel]:
+        """读取重启前未完成的任务，按创建时间排序"""
+        db = next(get_db())
+        try:
+            rows = db.query(TaskModel).filter(
+                TaskModel.status.in_(RESUMABLE_STATUSES)
+            ).order_by(TaskModel.created_at).all()
+            db.expunge_all()
+            return rows
+        finally:
+            db.close()
+
+    def get(self, task_id: str) -> Optional[TaskModel]:
+        db = next(get_db())
+        try:
+            row = db.query(TaskModel).filter(TaskModel.id == task_id).first()
+            db.expunge_all()
+            return row
+        finally:
+            db.close()
+
+    def query(self, statuses: Optional[List[str]] = None, rjcode: Optional[str] = None,
+              cursor: Optional[Tuple[datetime, str]] = None, limit: Optional[int] = 100) -> List[TaskModel]:
+        """按状态、RJ号过滤，按 (created_at, id) 倒序分页读取任务，limit 为 None 时不限数量"""
+        db = next(get_db())
+        try:
+            query = db.query(TaskModel)
+            if statuses:
+                query = query.filter(TaskModel.status.in_(statuses))
+            if rjcode:
+                query = query.filter(
+                    func.upper(TaskModel.task_metadata[ENGINE_KEY]['rjcode'].as_string()) == rjcode.upper()
+                )
+            if cursor:
+                created_at, task_id = cursor
+                query = query.filter(or_(
+                    TaskModel.created_at < created_at,
+                    and_(TaskModel.created_at == created_at, TaskModel.id < task_id)
+                ))
+            query = query.order_by(TaskModel.created_at.desc(), TaskModel.id.desc())
+            if limit is not None:
+                query = query.limit(limit)
+            rows = query.all()
+            db.expunge_all()
+            return rows
+        finally:
+            db.close()
+
+
+# 全局存储实例
+_task_store: Optional[TaskStore] = None
+
+
+def get_task_store() -> TaskStore:
+    """获取任务存储实例（单例）"""
+    global _task_store
+    if _task_store is None:
+        _task_store = TaskStore()
+    return _task_store
@@ -0,0 +1,167 @@
+"""目录统计服务
+
+计算文件夹的总大小和文件数。一次 os.scandir 遍历同时得到两者（文件大小来自 DirEntry.stat()），
+每个目录的结果按 (inode, mtime) 缓存。再次统计时只需 stat 各级目录：
+mtime 未变的目录直接复用缓存的文件统计，只有发生变化的目录才重新列出。
+
+目录的 mtime 只在其中的条目增删或重命名时改变，原地修改文件内容不会使缓存失效；
+库存中的作品文件夹只会整体移入、删除或替换文件，这种情况可以接受。
+
+以下目录不缓存，每次重新列出：
+- mtime 距统计时不足 MTIME_GRANULARITY（FAT/exFAT 的 mtime 精度为 2 秒，SMB 更粗），
+  之后紧接着加入的条目可能不改变 mtime
+- 包含刚修改过的文件（复制中、仍在增长）
+- inode 为 0（部分网络共享不提供 inode，无法区分目录）
+"""
+
+import os
+import stat
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# mtime 距统计时不足该时间（纳秒）的目录不缓存
+MTIME_GRANULARITY = 2_000_000_000
+
+
+@dataclass
+class TreeStats:
+    """文件夹统计结果"""
+    size: int = 0
+    file_count: int = 0
+    # 所有目录都已稳定（可缓存）；为 False 时结果可能很快变化，调用方不应持久化
+    settled: bool = True
+
+
+@dataclass
+class _DirNode:
+    """单个目录的缓存：直接包含的文件统计和子目录列表"""
+    key: Tuple[int, int]
+    files_size: int
+    files_count: int
+    subdirs: List[str] = field(default_factory=list)
+    # 最近修改的文件的 mtime
+    newest_mtime: int = 0
+
+
+class TreeStatsService:
+    """带缓存的目录大小 / 文件数统计"""
+
+    # 缓存目录数上限，超出后清空重建
+    MAX_CACHED_DIRS = 500_000
+
+    def __init__(self):
+        self._nodes: Dict[str, _DirNode] = {}
+        self._lock = threading.Lock()
+
+    def get_stats(self, folder_path: str) -> TreeStats:
+        """统计文件夹的总大小和文件数，路径不存在或不是文件夹时返回 0"""
+        try:
+            st = os.stat(folder_path)
+        except OSError:
+            return TreeStats()
+        if not stat.S_ISDIR(st.st_mode):
+            return TreeStats()
+
+        if len(self._nodes) > self.MAX_CACHED_DIRS:
+            with self._lock:
+                self._nodes.clear()
+
+        stats = TreeStats()
+        stack: List[Tuple[str, Optional[os.stat_result]]] = [(os.path.abspath(folder_path), st)]
+        while stack:
+            path, st = stack.pop()
+            node = self._get_node(path, st)
+            if node is None:
+                continue
+            stats.size += node.files_size
+            stats.file_count += node.files_count
+            if not self._cacheable(node):
+                stats.settled = False
+            stack.extend((os.path.join(path, name), None) for name in node.subdirs)
+        return stats
+
+    def get_folder_size(self, folder_path: str) -> int:
+        return self.get_stats(folder_path).size
+
+    def get_file_count(self, folder_path: str) -> int:
+        return self.get_stats(folder_path).file_count
+
+    def invalidate(self, folder_path: str):
+        """丢弃某个文件夹及其子目录的缓存"""
+        prefix = os.path.abspath(folder_path).rstrip(os.sep) + os.sep
+        with self._lock:
+            for path in [p for p in self._nodes if p == prefix[:-1] or p.startswith(prefix)]:
+                del self._nodes[path]
+
+    def _get_node(self, path: str, st: Optional[os.stat_result]) -> Optional[_DirNode]:
+        """获取目录的缓存统计，目录的 (inode, mtime) 变化时重新列出"""
+        if st is None:
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                return None
+        key = (st.st_ino, st.st_mtime_ns)
+
+        cached = self._nodes.get(path)
+        if cached is not None and cached.key == key:
+            return cached
+
+        node = self._scan_dir(path, key)
+        with self._lock:
+            if node is not None and self._cacheable(node):
+                self._nodes[path] = node
+            else:
+                self._nodes.pop(path, None)
+        if cached is not None:
+            # 已删除或改名的子目录不会再被访问，丢弃其缓存
+            for name in set(cached.subdirs) - set(node.subdirs if node else []):
+                self.invalidate(os.path.join(path, name))
+        return node
+
+    @staticmethod
+    def _cacheable(node: _DirNode) -> bool:
+        """目录统计是否可以缓存（见模块说明）"""
+        ino, mtime = node.key
+        if ino == 0:
+            return False
+        threshold = time.time_ns() - MTIME_GRANULARITY
+        return mtime < threshold and node.newest_mtime < threshold
+
+    def _scan_dir(self, path: str, key: Tuple[int, int]) -> Optional[_DirNode]:
+        """列出一个目录：累计直接包含的文件大小，记录子目录"""
+        node = _DirNode(key, 0, 0)
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            node.subdirs.append(entry.name)
+                            continue
+                        node.files_count += 1
+                        st = entry.stat()
+                        node.files_size += st.st_size
+                        node.newest_mtime = max(node.newest_mtime, st.st_mtime_ns)
+                    except OSError:
+                        # 失效的符号链接等，计数但不计大小
+                        continue
+        except OSError as e:
+            logger.warning(f"[目录统计] 无法读取目录: {path}, {e}")
+            return None
+        return node
+
+
+# 全局服务实例
+_tree_stats_service: Optional[TreeStatsService] = None
+
+
+def get_tree_stats_service() -> TreeStatsService:
+    """获取目录统计服务实例（单例）"""
+    global _tree_stats_service
+    if _tree_stats_service is None:
+        _tree_stats_service = TreeStatsService()
+    return _tree_stats_service
@@ -8,14 +8,16 @@ import os
 import asyncio
 import re
 from pathlib import Path
-from typing import Callable, Optional, Set
+from typing import Callable, Optional
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileModifiedEvent
 import logging
 
 from ..config.settings import get_config
-from ..core.task_engine import Task, TaskType, get_task_engine
+from ..core.task_engine import Task, TaskType, SETTLED_STATUSES, get_task_engine
 from .file_processor import get_file_processor
+from .event_bus import get_event_bus
+from .file_stability import get_stability_monitor, MODIFIED, CLOSED
 
 logger = logging.getLogger(__name__)
 
@@ -29,23 +31,35 @@ class ArchiveHandler(FileSystemEventHandler):
     def __init__(
         self,
         on_archive_detected: Callable[[str], None],
-        get_excluded_paths: Callable[[], Set[str]],
+        is_excluded: Callable[[str], bool],
         is_paused: Callable[[], bool],
         mark_processed: Callable[[str], None]
     ):
         self.on_archive_detected = on_archive_detected
-        self.get_excluded_paths = get_excluded_paths
+        self.is_excluded = is_excluded
         self.is_paused = is_paused
         self.mark_processed = mark_processed
         self._file_processor = get_file_processor()
+        self._stability = get_stability_monitor()
+
+    def on_closed(self, event):
+        # 写入后关闭（inotify IN_CLOSE_WRITE），用于判断复制完成
+        if not event.is_directory:
+            self._stability.notify(str(event.src_path), CLOSED)
+
+    def on_moved(self, event):
+        # 移动/重命名到监视目录（如下载工具完成后去掉临时扩展名），文件已完整
+        if not event.is_directory:
+            self._stability.notify(str(event.dest_path), CLOSED)
 
     def on_created(self, event):
         if event.is_directory:
             return
+        self._stability.notify(str(event.src_path), MODIFIED)
         if self.is_paused():
             return
         file_path = str(event.src_path)
-        if file_path in self.get_excluded_paths():
+        if self.is_excluded(file_path):
             logger.debug(f"文件在排除列表中，跳过: {file_path}")
             return
         if not os.path.exists(file_path):
@@ -60,10 +74,11 @@ class ArchiveHandler(FileSystemEventHandler):
     def on_modified(self, event):
         if event.is_directory:
             return
+        self._stability.notify(str(event.src_path), MODIFIED)
         if self.is_paused():
             return
         file_path = str(event.src_path)
-        if file_path in self.get_excluded_paths():
+        if self.is_excluded(file_path):
             return
         if not os.path.exists(file_path):
             return
@@ -107,14 +122,24 @@ class FolderWatcher:
         self.is_running = False
         self.pending_files = set()
         self._processed_files = set()
+        # 定期扫描时已确认无需处理的文件：路径 -> [大小, 修改时间, 最后一次出现的扫描轮次]，文件不变时直接跳过
+        self._seen_files: dict = {}
+        self._scan_generation = 0
         self._scan_task = None
         self._loop = None
         self._paused = False  # 暂停监听标志
         self._file_processor = get_file_processor()
 
-    def _get_excluded_paths(self):
-        """获取所有应该排除的路径（pending + processed）"""
-        return self.pending_files | self._processed_files
+    def get_status(self) -> dict:
+        """监视器状态"""
+        return {
+            "is_running": self.is_running,
+            "watch_path": self.config.storage.input_path,
+            "pending_files": list(self.pending_files)
+        }
+
+    def _publish_status(self):
+        get_event_bus().publish('watcher', self.get_status(), key='watcher')
 
     def _mark_file_processed(self, file_path: str):
         """将文件标记为已处理"""
@@ -130,6 +155,8 @@ class FolderWatcher:
         if self.observer:
             try:
                 self.observer.unschedule_all()
+                # 暂停期间收不到文件事件，写入完成检测回退为轮询
+                get_stability_monitor().detach()
                 logger.debug("已暂停文件监听")
             except Exception as e:
                 logger.warning(f"暂停监听失败: {e}")
@@ -143,6 +170,7 @@ class FolderWatcher:
             try:
                 watch_path = self.config.storage.input_path
                 self.observer.schedule(self.handler, watch_path, recursive=True)
+                get_stability_monitor().attach(self._loop, watch_path)
                 logger.debug("已恢复文件监听")
             except Exception as e:
                 logger.warning(f"恢复监听失败: {e}")
@@ -160,7 +188,7 @@ class FolderWatcher:
 
         self.handler = ArchiveHandler(
             self._on_archive_detected,
-            self._get_excluded_paths,
+            self._is_file_processed,
             lambda: self._paused,
             self._mark_file_processed
         )
@@ -168,11 +196,13 @@ class FolderWatcher:
         observer.schedule(self.handler, watch_path, recursive=True)
         observer.start()
         self.observer = observer
+        get_stability_monitor().attach(self._loop, watch_path)
 
         self._scan_task = asyncio.create_task(self._periodic_scan())
 
         self.is_running = True
         logger.info(f"文件夹监视器已启动: {watch_path}")
+        self._publish_status()
 
     def stop(self):
         """停止监视器"""
@@ -182,12 +212,14 @@ class FolderWatcher:
         if self.observer:
             self.observer.stop()
             self.observer.join()
+        get_stability_monitor().detach()
 
         if self._scan_task:
             self._scan_task.cancel()
 
         self.is_running = False
         logger.info("文件夹监视器已停止")
+        self._publish_status()
 
     def _on_archive_detected(self, file_path: str):
         """检测到压缩包"""
@@ -202,6 +234,7 @@ class FolderWatcher:
 
         self.pending_files.add(file_path)
         logger.info(f"检测到新文件: {file_path}")
+        self._publish_status()
         logger.info(f"auto_start配置: {self.config.watcher.auto_start}")
 
         # 创建自动处理任务
@@ -236,9 +269,8 @@ class FolderWatcher:
             )
 
             if task:
-                # 等待任务完成
-                while task.status.value in ["pending", "processing"]:
-                    await asyncio.sleep(1)
+                # 等待任务完成（或暂停、等待重试、等待人工处理）
+                await task.wait_done(until=SETTLED_STATUSES)
 
                 # 任务完成后添加到已处理列表
                 self._processed_files.add(task.source_path)
@@ -264,6 +296,7 @@ class FolderWatcher:
             self._processed_files.add(file_path)
         finally:
             self.pending_files.discard(original_path)
+            self._publish_status()
 
     async def _periodic_scan(self):
         """定期扫描文件夹"""
@@ -277,28 +310,50 @@ class FolderWatcher:
                 logger.error(f"定期扫描失败: {e}")
 
     async def _scan_folder(self):
-        """扫描文件夹中的现有文件"""
+        """扫描文件夹中的现有文件（单次 scandir 遍历，未变化的文件直接跳过）"""
         watch_path = self.config.storage.input_path
 
         if not self.handler:
             return
 
-        for root, dirs, files in os.walk(watch_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-
-                if file_path in self._get_excluded_paths():
-                    continue
-
-                if self.handler._is_archive(file_path):
-                    engine = get_task_engine()
-                    existing = any(
-                        t.source_path == file_path and t.status.value in ["pending", "processing"]
-                        for t in engine.get_all_tasks()
-                    )
-
-                    if not existing and file_path not in self.pending_files and file_path not in self._processed_files:
-                        self._on_archive_detected(file_path)
+        engine = get_task_engine()
+        seen = self._seen_files
+        self._scan_generation += 1
+        generation = self._scan_generation
+        stack = [watch_path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        file_path = entry.path
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        known = seen.get(file_path)
+                        if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+                            known[2] = generation
+                            continue
+
+                        if self._is_file_processed(file_path) or engine.has_active_task(file_path):
+                            # 处理中的文件不记录，处理结束后仍需重新检查
+                            if file_path in self._processed_files:
+                                seen[file_path] = [st.st_size, st.st_mtime_ns, generation]
+                            continue
+
+                        if self.handler._is_archive(file_path):
+                            self._on_archive_detected(file_path)
+                        else:
+                            seen[file_path] = [st.st_size, st.st_mtime_ns, generation]
+            except OSError as e:
+                logger.debug(f"扫描目录失败: {e}")
+
+        # 清理本轮没有出现的文件
+        for file_path in [p for p, known in seen.items() if known[2] != generation]:
+            del seen[file_path]
 
 
 # 全局监视器实例
@@ -0,0 +1,191 @@
+"""内置 ZIP 解压后端
+
+DLsite 下载的大多是普通 ZIP。这里用标准库 zipfile 在进程内列出内容、测试密码（ZipCrypto）和解压，
+省去每次启动 7z 子进程的开销。AES 加密、分卷以及 zipfile 不支持的压缩方式仍交给 7z。
+
+所有函数都是同步阻塞的，调用方应通过 asyncio.to_thread 在线程池中执行。
+"""
+
+import lzma
+import os
+import sys
+import shutil
+import time
+import zipfile
+import zlib
+from typing import Optional, List, Dict, Iterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+# zipfile 能解压的压缩方式（AES 加密的条目压缩方式为 99，不在其中）
+SUPPORTED_COMPRESSION = {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA}
+
+FLAG_ENCRYPTED = 0x1
+FLAG_STRONG_ENCRYPTION = 0x40
+FLAG_UTF8 = 0x800
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 读取失败的异常：密码错误（RuntimeError）、CRC 错误或损坏（BadZipFile）、不支持的格式等。
+# ZipCrypto 只用 1 字节校验密码，约 1/256 的错误密码能通过校验，解密出的乱码在解压时
+# 抛出 zlib.error / lzma.LZMAError（bz2 抛出 OSError，由调用方的 OSError 分支处理）
+READ_ERRORS = (RuntimeError, zipfile.BadZipFile, NotImplementedError, EOFError, ValueError,
+               zlib.error, lzma.LZMAError)
+
+
+def raw_names(archive_path: str) -> Optional[bytes]:
+    """检查压缩包能否由内置后端处理，能处理时返回未标记 UTF-8 的文件名原始字节（用于编码检测）
+
+    不是 ZIP、分卷 ZIP、含 AES 加密或不支持的压缩方式时返回 None，由 7z 处理
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            names = []
+            for info in zf.infolist():
+                if info.compress_type not in SUPPORTED_COMPRESSION or info.flag_bits & FLAG_STRONG_ENCRYPTION:
+                    logger.debug(f"[ZIP] 含不支持的条目，使用 7z: {info.filename} (compress_type={info.compress_type})")
+                    return None
+                if not info.flag_bits & FLAG_UTF8:
+                    names.append(info.filename.encode('cp437'))
+            return b'\n'.join(names)
+    except (zipfile.BadZipFile, OSError, ValueError, EOFError) as e:
+        logger.debug(f"[ZIP] 无法使用内置后端: {archive_path}, {e}")
+        return None
+
+
+def decode_name(info: zipfile.ZipInfo, encoding: str) -> str:
+    """用检测到的编码还原文件名（zipfile 对未标记 UTF-8 的文件名按 cp437 解码）"""
+    if info.flag_bits & FLAG_UTF8:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode(encoding)
+    except UnicodeError:
+        return info.filename
+
+
+def list_contents(archive_path: str, encoding: str) -> Optional[List[Dict]]:
+    """列出压缩包内容，格式与 7z -slt 解析结果相同"""
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            return [
+                {
+                    'name': decode_name(info, encoding).rstrip('/'),
+                    'size': info.file_size,
+                    'crc': f'{info.CRC:08X}',
+                    'is_dir': info.is_dir(),
+                    'encrypted': bool(info.flag_bits & FLAG_ENCRYPTED)
+                }
+                for info in zf.infolist()
+            ]
+    except (zipfile.BadZipFile, OSError, ValueError, EOFError) as e:
+        logger.warning(f"[ZIP] 列出压缩包内容失败: {archive_path}, {e}")
+        return None
+
+
+def _password_variants(password: str, encoding: str) -> Iterator[Optional[bytes]]:
+    """密码的字节形式：UTF-8 优先，非 ASCII 密码再尝试文件名编码"""
+    if not password:
+        yield None
+        return
+    utf8 = password.encode('utf-8')
+    yield utf8
+    try:
+        local = password.encode(encoding)
+    except UnicodeError:
+        return
+    if local != utf8:
+        yield local
+
+
+def _read_entries(zf: zipfile.ZipFile, infos: List[zipfile.ZipInfo], pwd: Optional[bytes]) -> bool:
+    """完整读取条目（读到末尾时 zipfile 会校验 CRC），不写入磁盘"""
+    try:
+        for info in infos:
+            with zf.open(info, pwd=pwd) as f:
+                while f.read(COPY_BUFFER_SIZE):
+                    pass
+        return True
+    except READ_ERRORS + (OSError,):
+        return False
+
+
+def test_password(archive_path: str, password: str, entry: Optional[str], encoding: str) -> bool:
+    """测试密码（指定 entry 时只测试该文件，否则测试整个压缩包）"""
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            infos = [info for info in zf.infolist() if not info.is_dir()]
+            if entry:
+                infos = [info for info in infos if decode_name(info, encoding) == entry]
+                if not infos:
+                    logger.debug(f"[ZIP] 测试文件未匹配: {entry}")
+                    return False
+            return any(_read_entries(zf, infos, pwd) for pwd in _password_variants(password, encoding))
+    except (zipfile.BadZipFile, OSError, ValueError, EOFError) as e:
+        logger.warning(f"[ZIP] 测试密码失败: {archive_path}, {e}")
+        return False
+
+
+def _pick_password_bytes(zf: zipfile.ZipFile, password: str, encoding: str) -> Optional[bytes]:
+    """从密码的几种字节形式中选出能打开第一个加密条目的一种"""
+    variants = list(_password_variants(password, encoding))
+    encrypted = next((info for info in zf.infolist() if info.flag_bits & FLAG_ENCRYPTED), None)
+    if encrypted is None or len(variants) == 1:
+        return variants[0]
+    for pwd in variants:
+        try:
+            with zf.open(encrypted, pwd=pwd):
+                return pwd
+        except RuntimeError:
+            continue
+    return variants[0]
+
+
+def _safe_relative_path(name: str) -> Optional[str]:
+    """把压缩包内路径转换为安全的相对路径（去掉绝对路径、盘符和 ..）"""
+    parts = []
+    for part in name.replace('\\', '/').split('/'):
+        if part in ('', '.', '..'):
+            continue
+        if sys.platform == 'win32':
+            part = ''.join('_' if c in '<>:"|?*' else c for c in part).rstrip(' .')
+            if not part:
+                continue
+        parts.append(part)
+    return os.path.join(*parts) if parts else None
+
+
+def _restore_mtime(path: str, date_time: tuple):
+    """恢复压缩包中记录的修改时间"""
+    try:
+        mtime = time.mktime(date_time + (0, 0, -1))
+        os.utime(path, (mtime, mtime))
+    except (OverflowError, ValueError, OSError):
+        pass
+
+
+def extract(archive_path: str, output_path: str, password: str, encoding: str) -> bool:
+    """使用指定密码解压到输出目录，已存在的文件直接覆盖"""
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            pwd = _pick_password_bytes(zf, password, encoding)
+            for info in zf.infolist():
+                relative = _safe_relative_path(decode_name(info, encoding))
+                if not relative:
+                    continue
+                target = os.path.join(output_path, relative)
+                if info.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with zf.open(info, pwd=pwd) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                _restore_mtime(target, info.date_time)
+        return True
+    except READ_ERRORS as e:
+        logger.warning(f"[ZIP] 解压失败: {archive_path}, {e}")
+        return False
+    except OSError as e:
+        logger.error(f"[ZIP] 写入解压文件失败: {archive_path}, {e}")
+        return False
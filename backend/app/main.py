@@ -2,6 +2,7 @@ import os
 import logging
 import uvicorn
 from .api.routes import app
+from .core.log_reader import create_file_handler
 
 def setup_logging():
     """设置日志"""
@@ -17,8 +18,8 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
-    # 文件处理器
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    # 文件处理器（按大小轮转）
+    file_handler = create_file_handler(log_file)
     file_handler.setFormatter(formatter)
     
     # 控制台处理器
@@ -22,6 +22,11 @@ class Task(Base):
     started_at = Column(DateTime)
     completed_at = Column(DateTime)
     task_metadata = Column(JSON)  # renamed from metadata to avoid SQLAlchemy reserved word
+
+    __table_args__ = (
+        Index('idx_task_created', 'created_at', 'id'),  # 任务列表分页
+        Index('idx_task_status', 'status'),
+    )
     
 class WorkMetadata(Base):
     """作品元数据表"""
@@ -139,6 +144,19 @@ class WorkLinkage(Base):
         Index('idx_original_linked', 'original_rjcode', 'linked_rjcode'),
     )
 
+class AsmrSyncManifest(Base):
+    """ASMR 同步清单表 - 记录每个作品上次同步的文件列表，用于增量同步"""
+    __tablename__ = 'asmr_sync_manifests'
+
+    rjcode = Column(String(20), primary_key=True)  # 请求同步的 RJ 号
+    actual_rjcode = Column(String(20))  # 实际下载的版本
+    title = Column(Text)
+    rules_hash = Column(String(40))  # 筛选规则指纹，规则变化时重新判断
+    files = Column(JSON, default=list)  # [{path, hash, size, included, done}]
+    output_path = Column(Text)  # 上次同步后作品所在的文件夹
+    subtitle_folder = Column(Text)  # 上次同步处理过的字幕文件夹
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class KikoeruSearchConfig(Base):
     """Kikoeru 搜索配置表"""
     __tablename__ = 'kikoeru_search_configs'
@@ -233,6 +251,25 @@ class PasswordEntry(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class PasswordStat(Base):
+    """密码命中统计表 - 按压缩包记录候选密码的命中/未命中次数，用于密码排序"""
+    __tablename__ = 'password_stats'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    password_key = Column(String(255), nullable=False)  # 密码，RJ号派生密码记为模板（如 {RJ}、{RJ+1}）
+    rjcode = Column(String(20))  # 压缩包的RJ号（用于按社团统计）
+    pattern = Column(String(255))  # 压缩包文件名模式（开头的【】/[] 标签）
+    hit_count = Column(Integer, default=0)
+    miss_count = Column(Integer, default=0)
+    last_hit_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_password_stat_key', 'password_key'),
+        Index('idx_password_stat_rjcode', 'rjcode'),
+        Index('idx_password_stat_pattern', 'pattern'),
+    )
+
 class WatcherConfig(Base):
     """监视器配置表"""
     __tablename__ = 'watcher_config'
@@ -349,6 +386,10 @@ def init_db():
     """初始化数据库"""
     _db_logger.info(f"[数据库] 初始化数据库，路径: {_db_path}")
     Base.metadata.create_all(bind=engine)
+    # create_all 不会给已存在的表补建索引，逐个检查创建
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     _db_logger.info(f"[数据库] 表创建完成")
 
 def get_db():
@@ -51,7 +51,8 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    from app.core.log_reader import create_file_handler
+    file_handler = create_file_handler(log_file)
     file_handler.setFormatter(formatter)
     
     root_logger = logging.getLogger()
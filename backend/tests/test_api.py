@@ -16,6 +16,15 @@ def test_get_tasks_empty(client: TestClient):
     assert response.status_code == 200
     assert response.json() == []
 
+def test_get_tasks_not_modified(client: TestClient):
+    """任务没有变化时返回 304"""
+    response = client.get("/api/tasks")
+    etag = response.headers["ETag"]
+    assert response.headers["X-Task-Revision"]
+
+    response = client.get("/api/tasks", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
 def test_create_task(client: TestClient):
     """测试创建任务"""
     task_data = {
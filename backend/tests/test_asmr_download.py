@@ -0,0 +1,524 @@
+"""
+ASMR 下载服务测试
+"""
+import asyncio
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+from app.core.asmr_download_service import ASMRDownloadService
+
+
+def _service(per_work=2, total=8):
+    config = SimpleNamespace(asmr_sync=SimpleNamespace(
+        max_concurrent_downloads=per_work, max_total_downloads=total, connections_per_host=6,
+        segment_threshold_mb=64, segment_connections=4
+    ))
+    return ASMRDownloadService(config=config)
+
+
+def _files(sizes):
+    return [
+        {'title': f"{i:02d}.mp3", 'path': f"{i:02d}.mp3", 'size': size, 'media_download_url': f"https://example/{i}"}
+        for i, size in enumerate(sizes)
+    ]
+
+
+def _result():
+    return {'downloaded_files': [], 'paused': False}
+
+
+@pytest.mark.asyncio
+async def test_download_files_concurrently_small_first(tmp_path):
+    """小文件先下载，每个作品的并发数和全局并发数都受限制，进度按字节汇总"""
+    service = _service(per_work=3, total=2)
+    started = []
+    active = 0
+    peak = 0
+
+    async def fake_download(url, dest_path, progress_callback=None, size_hint=0):
+        nonlocal active, peak
+        started.append(url)
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        progress_callback(1, 1)
+        active -= 1
+        return not url.endswith('/2')
+
+    service.download_file = fake_download
+    progress = []
+    result = _result()
+    failed = await service._download_files(
+        _files([300, 100, 200, 50]), str(tmp_path), 'RJ123456', result,
+        progress_callback=lambda rj, current, total, step: progress.append((current, total))
+    )
+
+    assert started == ['https://example/3', 'https://example/1', 'https://example/2', 'https://example/0']
+    assert peak == 2
+    assert [f['title'] for f in failed] == ['02.mp3']
+    assert len(result['downloaded_files']) == 3
+    assert progress[-1][1] == 650
+    assert not result['paused']
+
+
+@pytest.mark.asyncio
+async def test_pause_stops_new_files(tmp_path):
+    """暂停后不再开始新文件"""
+    service = _service(per_work=1)
+    calls = []
+
+    async def fake_download(url, dest_path, progress_callback=None, size_hint=0):
+        calls.append(url)
+        return True
+
+    service.download_file = fake_download
+    result = _result()
+    await service._download_files(
+        _files([1, 2, 3]), str(tmp_path), 'RJ123456', result,
+        check_pause=lambda: len(calls) >= 2
+    )
+
+    assert len(calls) == 2
+    assert result['paused']
+
+
+def test_transfer_slots_capped_by_host_connections():
+    """全局传输名额不超过单主机连接数，配置变化后更新"""
+    service = _service(total=8)
+    assert service._get_transfer_limiter().limit == 6
+    service.sync_config.connections_per_host = 10
+    assert service._get_transfer_limiter().limit == 8
+
+
+@pytest.mark.asyncio
+async def test_download_error_recorded_as_failed(tmp_path):
+    """单个文件下载出错时记为失败，其余文件继续下载"""
+    service = _service(per_work=2)
+
+    async def fake_download(url, dest_path, progress_callback=None, size_hint=0):
+        if url.endswith('/1'):
+            raise OSError(28, 'No space left on device')
+        return True
+
+    service.download_file = fake_download
+    result = _result()
+    failed = await service._download_files(_files([1, 2, 3]), str(tmp_path), 'RJ123456', result)
+
+    assert [f['title'] for f in failed] == ['01.mp3']
+    assert len(result['downloaded_files']) == 2
+    assert service._get_transfer_limiter().active == 0
+
+
+@pytest_asyncio.fixture
+async def range_server():
+    """本地文件服务器，记录收到的 Range 请求；support_range=False 时忽略 Range"""
+    from aiohttp import web
+
+    payload = bytes(range(256)) * 20  # 5120 bytes
+    state = {'ranges': [], 'support_range': True, 'active': 0, 'peak': 0}
+
+    async def handle(request):
+        header = request.headers.get('Range')
+        if header and state['support_range']:
+            start, end = (int(v) for v in header[len('bytes='):].split('-'))
+            state['ranges'].append((start, end))
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            await asyncio.sleep(0.01)
+            state['active'] -= 1
+            return web.Response(status=206, body=payload[start:end + 1], headers={
+                'Content-Range': f"bytes {start}-{end}/{len(payload)}"
+            })
+        return web.Response(body=payload)
+
+    app = web.Application()
+    app.router.add_get('/file', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/file", payload, state
+    await runner.cleanup()
+
+
+def _segment_service(monkeypatch):
+    from app.core import asmr_download_service
+    monkeypatch.setattr(asmr_download_service, 'SEGMENT_SIZE', 1024)
+    service = _service()
+    service.sync_config.segment_threshold_mb = 0
+    service.sync_config.segment_connections = 3
+    return service
+
+
+@pytest.mark.asyncio
+async def test_segmented_download_resumes_per_segment(tmp_path, monkeypatch, range_server):
+    """大文件分段下载，续传时只请求未完成的段，完成后直接重命名"""
+    url, payload, state = range_server
+    service = _segment_service(monkeypatch)
+    dest = str(tmp_path / "track.wav")
+
+    # 上次已完成第 0、2 段
+    with open(dest + '.downloading', 'wb') as f:
+        f.truncate(len(payload))
+        f.seek(0)
+        f.write(payload[:1024])
+        f.seek(2048)
+        f.write(payload[2048:3072])
+    service._save_segment_manifest(dest + '.downloading.json', len(payload), {0, 2})
+
+    progress = []
+    try:
+        assert await service.download_file(url, dest, progress_callback=lambda d, t: progress.append((d, t)),
+                                           size_hint=len(payload))
+    finally:
+        await service.close()
+
+    assert sorted(state['ranges']) == [(1024, 2047), (3072, 4095), (4096, 5119)]
+    with open(dest, 'rb') as f:
+        assert f.read() == payload
+    assert not (tmp_path / "track.wav.downloading").exists()
+    assert not (tmp_path / "track.wav.downloading.json").exists()
+    assert progress[-1] == (len(payload), len(payload))
+
+
+@pytest.mark.asyncio
+async def test_segment_connections_use_transfer_slots(tmp_path, monkeypatch, range_server):
+    """分段下载的其余连接各占一个传输名额，名额不足时只用调用方的一个连接"""
+    url, payload, state = range_server
+    service = _segment_service(monkeypatch)
+    service.sync_config.max_total_downloads = 1
+    limiter = service._get_transfer_limiter()
+    dest = str(tmp_path / "track.wav")
+
+    # 调用方（_download_files）已占用唯一的名额
+    await limiter.acquire()
+    try:
+        assert await asyncio.wait_for(service.download_file(url, dest, size_hint=len(payload)), 5)
+    finally:
+        await service.close()
+
+    assert state['peak'] == 1 and len(state['ranges']) == 5
+    assert limiter.active == 1 and limiter.waiting == 0
+    with open(dest, 'rb') as f:
+        assert f.read() == payload
+
+
+@pytest.mark.asyncio
+async def test_segmented_download_falls_back_without_range(tmp_path, monkeypatch, range_server):
+    """服务器不支持 Range 时改为单连接下载"""
+    url, payload, state = range_server
+    state['support_range'] = False
+    service = _segment_service(monkeypatch)
+    dest = str(tmp_path / "track.wav")
+
+    try:
+        assert await service.download_file(url, dest, size_hint=len(payload))
+    finally:
+        await service.close()
+
+    with open(dest, 'rb') as f:
+        assert f.read() == payload
+    assert not (tmp_path / "track.wav.downloading.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_segmented_download_falls_back_on_size_mismatch(tmp_path, monkeypatch, range_server):
+    """文件列表中的大小与服务器不一致时（Content-Range 的总大小不同）改为单连接下载"""
+    url, payload, state = range_server
+    service = _segment_service(monkeypatch)
+    dest = str(tmp_path / "track.wav")
+
+    try:
+        assert await service.download_file(url, dest, size_hint=len(payload) + 1024)
+    finally:
+        await service.close()
+
+    with open(dest, 'rb') as f:
+        assert f.read() == payload
+    assert not (tmp_path / "track.wav.downloading.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_segmented_download_disk_error_fails(tmp_path, monkeypatch, range_server):
+    """写入磁盘出错时不重试，停止其余连接并返回失败，不抛出异常"""
+    from app.core.download_sink import BufferedFileSink
+
+    url, payload, state = range_server
+    service = _segment_service(monkeypatch)
+    dest = str(tmp_path / "track.wav")
+
+    def disk_full(self):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(BufferedFileSink, '_open_file', disk_full)
+    try:
+        assert await asyncio.wait_for(service.download_file(url, dest, size_hint=len(payload)), 5) is False
+    finally:
+        await service.close()
+
+    # 每个连接最多请求一次，出错后不再开始新的段
+    assert len(state['ranges']) <= 3
+    assert (tmp_path / "track.wav.downloading.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_buffered_sink_coalesces_writes(tmp_path, monkeypatch):
+    """小数据块合并后在写入线程中写入，可定位写入文件中间，写入出错时关闭抛出异常"""
+    import threading
+    from app.core.download_sink import BufferedFileSink
+
+    path = tmp_path / "data.bin"
+    path.write_bytes(b'\0' * 16)
+    writes = []
+
+    class RecordingFile:
+        def __init__(self, f):
+            self.f = f
+
+        def write(self, data):
+            writes.append((len(data), threading.current_thread().name))
+            return self.f.write(data)
+
+        def close(self):
+            self.f.close()
+
+    original_open = BufferedFileSink._open_file
+    monkeypatch.setattr(BufferedFileSink, '_open_file', lambda self: RecordingFile(original_open(self)))
+
+    async with BufferedFileSink(str(path), 'r+b', offset=4, buffer_size=4, max_pending=1) as sink:
+        for byte in b'abcdef':
+            await sink.write(bytes([byte]))
+
+    assert path.read_bytes() == b'\0' * 4 + b'abcdef' + b'\0' * 6
+    assert writes == [(4, 'download-writer'), (2, 'download-writer')]
+
+    def broken_open(self):
+        file = original_open(self)
+        file.close()
+        return file
+
+    monkeypatch.setattr(BufferedFileSink, '_open_file', broken_open)
+    sink = BufferedFileSink(str(path), 'r+b', buffer_size=1)
+    await sink.open()
+    await sink.write(b'x')
+    with pytest.raises(ValueError):
+        await sink.close()
+
+
+def test_progress_throttle_reports_last_value(monkeypatch):
+    from app.core import download_sink
+
+    now = [0.0]
+    monkeypatch.setattr(download_sink.time, 'monotonic', lambda: now[0])
+    calls = []
+    throttle = download_sink.ProgressThrottle(lambda *args: calls.append(args), interval=1)
+    for i in range(1, 7):
+        now[0] = 1 + i * 0.3
+        throttle(i, 6)
+    assert calls == [(1, 6), (5, 6)]
+
+    throttle.flush()
+    assert calls[-1] == (6, 6)
+
+
+@pytest.mark.asyncio
+async def test_find_best_work_probes_concurrently():
+    """候选版本同时探测，按优先级选中后取消其余探测，文件列表只获取一次并留给下载使用"""
+    from app.core.asmr_download_service import LinkedWorkInfo
+
+    service = _service()
+    candidates = [LinkedWorkInfo('RJ200000', 'CHI_HANS', 'parent'), LinkedWorkInfo('RJ100000', 'JPN', 'original'),
+                  LinkedWorkInfo('RJ300000', 'ENG', 'parent')]
+    delays = {'RJ200000': 0.05, 'RJ100000': 0.01, 'RJ300000': 10}
+    started, cancelled, track_calls = [], [], []
+
+    async def linked_works(rjcode):
+        return candidates
+
+    async def work_info(rjcode):
+        started.append(rjcode)
+        try:
+            await asyncio.sleep(delays[rjcode])
+        except asyncio.CancelledError:
+            cancelled.append(rjcode)
+            raise
+        return None if rjcode == 'RJ200000' else {'title': rjcode}
+
+    async def track_list(rjcode):
+        track_calls.append(rjcode)
+        return [{'type': 'audio', 'title': '01.mp3'}]
+
+    service.get_linked_works_from_dlsite = linked_works
+    service.fetch_work_info = work_info
+    service.fetch_track_list = track_list
+
+    assert await asyncio.wait_for(service.find_best_available_work('RJ100000'), 1) == ('RJ100000', {'title': 'RJ100000'})
+    await asyncio.sleep(0)
+    assert sorted(started) == ['RJ100000', 'RJ200000', 'RJ300000']
+    assert cancelled == ['RJ300000']
+
+    assert await service.get_track_list('RJ100000') == [{'type': 'audio', 'title': '01.mp3'}]
+    await service.get_track_list('RJ100000')
+    assert track_calls == ['RJ100000', 'RJ100000']
+
+
+@pytest.mark.asyncio
+async def test_concurrent_failures_switch_api_once():
+    """使用同一服务器的并发请求都失败时只切换一次"""
+    service = _service()
+    failed_index = service._current_api_index
+    await asyncio.gather(*(service._switch_api(failed_index) for _ in range(3)))
+    assert service._current_api_index == (failed_index + 1) % len(service.API_BASE_URLS)
+
+
+def _tracks(hashes):
+    return [{'type': 'folder', 'title': 'MP3', 'children': [
+        {'type': 'audio', 'title': name, 'hash': hashes[name], 'size': 10, 'mediaDownloadUrl': f"https://example/{name}"}
+        for name in hashes
+    ]}]
+
+
+@pytest.mark.asyncio
+async def test_download_work_syncs_incrementally(tmp_path):
+    """再次同步时沿用上次的版本和清单，只下载变化或缺失的文件，没有变化时不下载"""
+    service = _service()
+    saved = {}
+    service.manifest_store = SimpleNamespace(get=lambda rjcode: saved.get(rjcode), save=lambda m: saved.__setitem__(m.rjcode, m))
+    remote = {'a.mp3': 'h1', 'b.mp3': 'h2', 'skip.wav': 'h3'}
+    searches, track_calls, downloads = [], [], []
+
+    async def find_best(rjcode, better_than=None):
+        searches.append((rjcode, better_than))
+        # RJ200000 已是最高优先级的版本
+        return (None, None) if better_than else ('RJ200000', {'title': 'work'})
+
+    async def track_list(rjcode):
+        track_calls.append(rjcode)
+        return _tracks(remote)
+
+    async def fake_download(url, dest_path, progress_callback=None, size_hint=0):
+        downloads.append(os.path.basename(dest_path))
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        with open(dest_path, 'wb') as f:
+            f.write(b'x' * 10)
+        return True
+
+    service.find_best_available_work = find_best
+    service.fetch_track_list = track_list
+    service.download_file = fake_download
+    rules = [{'name': 'wav', 'pattern': r'\.wav$', 'target': 'file', 'enabled': True}]
+    dest = str(tmp_path / "work")
+
+    subs = str(tmp_path / "subs" / "RJ100000")
+    result = await service.download_work('RJ100000', dest, filter_rules=rules, subtitle_folder=subs)
+    assert result['success'] and sorted(downloads) == ['a.mp3', 'b.mp3']
+    assert [f['title'] for f in result['filtered_files']] == ['skip.wav']
+    # 下载阶段不保存清单，后续步骤都成功（移动到库存）后才保存
+    assert saved == {}
+    library = str(tmp_path / "library" / "RJ100000")
+    shutil.move(dest, library)
+    service.save_manifest(result['manifest'], library, subs)
+    assert saved['RJ100000'].complete
+
+    # 没有变化：只请求一次文件列表，不下载
+    downloads.clear()
+    result = await service.download_work('RJ100000', str(tmp_path / "moved"), filter_rules=rules, subtitle_folder=subs)
+    assert result['up_to_date'] and result['success'] and downloads == []
+    assert result['manifest'].output_path == library
+    assert searches == [('RJ100000', None), ('RJ100000', 'RJ200000')]
+    assert track_calls == ['RJ200000', 'RJ200000']
+
+    # 新的字幕文件夹没有处理过：文件没有变化也重新下载，交给后续步骤处理
+    result = await service.download_work('RJ100000', str(tmp_path / "new_subs"), filter_rules=rules,
+                                         subtitle_folder=str(tmp_path / "subs" / "other"))
+    assert not result['up_to_date'] and sorted(downloads) == ['a.mp3', 'b.mp3']
+
+    # 上次交付的文件夹已不存在：同样重新下载
+    downloads.clear()
+    shutil.rmtree(library)
+    retry = str(tmp_path / "retry")
+    result = await service.download_work('RJ100000', retry, filter_rules=rules, subtitle_folder=subs)
+    assert not result['up_to_date'] and sorted(downloads) == ['a.mp3', 'b.mp3']
+
+    # b.mp3 变化：a.mp3 已在目标目录中，只下载 b.mp3
+    downloads.clear()
+    remote['b.mp3'] = 'h2-new'
+    result = await service.download_work('RJ100000', retry, filter_rules=rules, subtitle_folder=subs)
+    assert downloads == ['b.mp3'] and result['skipped_files'] == 1
+    assert len(result['downloaded_files']) == 2
+    assert result['manifest'].entries['MP3/b.mp3'].hash == 'h2-new'
+
+
+@pytest.mark.asyncio
+async def test_resync_switches_to_higher_priority_edition(tmp_path):
+    """上次同步的是日文原版，之后上线了中文版：再次同步时改为下载中文版；已是最高优先级时不再探测"""
+    from app.core.asmr_download_service import LinkedWorkInfo
+
+    service = _service()
+    saved = {}
+    service.manifest_store = SimpleNamespace(get=lambda rjcode: saved.get(rjcode), save=lambda m: saved.__setitem__(m.rjcode, m))
+    available = {'RJ100000': _tracks({'a.mp3': 'h1'})}
+    probed = []
+
+    async def linked_works(rjcode):
+        return [LinkedWorkInfo('RJ200000', 'CHI_HANS', 'parent'), LinkedWorkInfo('RJ100000', 'JPN', 'original')]
+
+    async def work_info(rjcode):
+        probed.append(rjcode)
+        return {'title': rjcode} if rjcode in available else None
+
+    async def track_list(rjcode):
+        return available.get(rjcode)
+
+    async def fake_download(url, dest_path, progress_callback=None, size_hint=0):
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        with open(dest_path, 'wb') as f:
+            f.write(b'x' * 10)
+        return True
+
+    service.get_linked_works_from_dlsite = linked_works
+    service.fetch_work_info = work_info
+    service.fetch_track_list = track_list
+    service.download_file = fake_download
+
+    result = await service.download_work('RJ100000', str(tmp_path / "first"))
+    assert result['actual_rjcode'] == 'RJ100000'
+    service.save_manifest(result['manifest'], str(tmp_path / "first"), None)
+
+    # 中文版上线后再次同步
+    available['RJ200000'] = _tracks({'a.mp3': 'h9'})
+    probed.clear()
+    result = await service.download_work('RJ100000', str(tmp_path / "second"))
+    assert result['success'] and result['actual_rjcode'] == 'RJ200000'
+    assert not result['up_to_date'] and len(result['downloaded_files']) == 1
+    assert probed == ['RJ200000']
+    service.save_manifest(result['manifest'], str(tmp_path / "second"), None)
+
+    # 已同步最高优先级的版本：不再探测其他版本，没有变化时已是最新
+    probed.clear()
+    result = await service.download_work('RJ100000', str(tmp_path / "third"))
+    assert result['up_to_date'] and probed == []
+
+
+def test_manifest_store_roundtrip(db_engine):
+    from unittest.mock import patch
+    from app.core.asmr_manifest import ASMRManifestStore, ManifestEntry, SyncManifest
+    from conftest import override_get_db
+
+    with patch('app.core.asmr_manifest.get_db', override_get_db):
+        store = ASMRManifestStore()
+        assert store.get('RJ100000') is None
+        manifest = SyncManifest('RJ100000', 'RJ200000', 'work', 'rules',
+                                output_path='/library/RJ100000', subtitle_folder='/subs/RJ100000')
+        manifest.entries['a.mp3'] = ManifestEntry('a.mp3', 'h1', 10, included=True, done=True)
+        manifest.entries['b.wav'] = ManifestEntry('b.wav', 'h2', 20, included=False)
+        store.save(manifest)
+        store.save(manifest)
+
+        loaded = store.get('rj100000')
+    assert loaded == manifest and loaded.complete
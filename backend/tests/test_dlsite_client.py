@@ -0,0 +1,113 @@
+"""
+DLsite 客户端测试
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.core.dlsite_client import DLsiteClient, TokenBucket
+
+
+@pytest.fixture
+def client():
+    config = SimpleNamespace(metadata=SimpleNamespace(
+        sleep_interval=0, rate_limit_burst=4, batch_window=0.01, batch_size=20,
+        connect_timeout=10, read_timeout=10, http_proxy=None
+    ))
+    with patch('app.core.dlsite_client.get_config', return_value=config):
+        yield DLsiteClient()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_allows_burst_then_throttles():
+    """容量内的请求立即放行，超出后按间隔等待"""
+    bucket = TokenBucket(interval=0.05, capacity=2)
+    start = time.monotonic()
+    await bucket.acquire()
+    await bucket.acquire()
+    assert time.monotonic() - start < 0.04
+
+    await bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_merged(client):
+    """同一作品同一语言的并发请求只发出一次"""
+    calls = []
+
+    async def fake_request(rjcode, locale):
+        calls.append((rjcode, locale))
+        await asyncio.sleep(0.01)
+        return {'workno': rjcode, 'locale': locale}
+
+    with patch.object(client, '_request_product', side_effect=fake_request):
+        results = await asyncio.gather(
+            client.get_product('RJ123456', 'zh_cn'),
+            client.get_product('rj123456', 'zh_cn'),
+            client.get_product('RJ123456', 'ja-JP'),
+        )
+
+    assert calls == [('RJ123456', 'zh_cn'), ('RJ123456', 'ja-JP')]
+    assert results[0] == results[1]
+    assert client.merged_count == 1
+    assert client.get_stats()['inflight'] == 0
+
+
+@pytest.mark.asyncio
+async def test_pending_requests_are_batched(client):
+    """窗口内的请求合并为一次多作品请求，缺失的作品再单独请求"""
+    calls = []
+
+    async def fake_request(workno, locale):
+        calls.append(workno)
+        if ',' in workno:
+            return [{'workno': code} for code in workno.split(',') if code != 'RJ333333']
+        return []
+
+    with patch.object(client, '_request', side_effect=fake_request):
+        products = await client.get_products(['RJ111111', 'rj222222', 'RJ333333'])
+
+    assert calls == ['RJ111111,RJ222222,RJ333333', 'RJ333333']
+    assert products == {'RJ111111': {'workno': 'RJ111111'}, 'RJ222222': {'workno': 'RJ222222'}, 'RJ333333': None}
+    assert client.get_stats()['batch_supported'] is True
+
+
+@pytest.mark.asyncio
+async def test_batching_disabled_when_unsupported(client):
+    """批量请求只返回一个作品而单独请求都能找到时，停止批量请求"""
+    calls = []
+
+    async def fake_request(workno, locale):
+        calls.append(workno)
+        return [{'workno': workno.split(',')[0]}]
+
+    with patch.object(client, '_request', side_effect=fake_request):
+        await client.get_products(['RJ111111', 'RJ222222', 'RJ333333'])
+        assert client.get_stats()['batch_supported'] is False
+
+        calls.clear()
+        await client.get_products(['RJ444444', 'RJ555555'])
+
+    assert sorted(calls) == ['RJ444444', 'RJ555555']
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_backs_off_after_rate_limit():
+    """被限流后暂停发放令牌并降低速率，请求成功后逐步恢复"""
+    bucket = TokenBucket(interval=0.01, capacity=4)
+    bucket.backoff(retry_after=0.05)
+    assert bucket.slowdown == 2
+    assert bucket.effective_interval == TokenBucket.MIN_BACKOFF_INTERVAL * 2
+
+    start = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+    for _ in range(10):
+        bucket.recover()
+    assert bucket.slowdown == 1
+    assert bucket.effective_interval == 0.01
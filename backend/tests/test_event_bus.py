@@ -0,0 +1,80 @@
+"""
+事件推送测试
+"""
+import asyncio
+import threading
+from contextlib import aclosing
+
+import pytest
+
+from app.core.event_bus import EventBus
+
+
+async def _collect(bus, since, count):
+    events = []
+    async with aclosing(bus.subscribe(since, heartbeat=1)) as stream:
+        async for event in stream:
+            events.append(event)
+            if len(events) == count:
+                break
+    return events
+
+
+@pytest.mark.asyncio
+async def test_same_key_events_are_throttled_and_coalesced():
+    """同一 key 在间隔内只发出第一个和最后一个事件"""
+    bus = EventBus(min_interval=0.05)
+    bus.bind_loop(asyncio.get_running_loop())
+
+    for progress in range(10):
+        bus.publish('task', {'progress': progress}, key='task:1')
+    bus.publish('task', {'progress': 0}, key='task:2')
+    assert [e['data'] for e in bus._events_after(0)] == [{'progress': 0}, {'progress': 0}]
+
+    await asyncio.sleep(0.1)
+    events = bus._events_after(0)
+    assert [e['data']['progress'] for e in events] == [0, 0, 9]
+    assert bus.coalesced == 8
+
+
+@pytest.mark.asyncio
+async def test_subscriber_resumes_from_sequence():
+    """从序号继续接收，缓冲区不够时收到 reset"""
+    bus = EventBus(buffer_size=3)
+    bus.bind_loop(asyncio.get_running_loop())
+    for i in range(3):
+        bus.publish('conflict', {'n': i})
+
+    events = await _collect(bus, 1, 2)
+    assert [e['seq'] for e in events] == [2, 3]
+
+    waiter = asyncio.create_task(_collect(bus, 3, 1))
+    await asyncio.sleep(0)
+    threading.Thread(target=bus.publish, args=('watcher', {'is_running': True})).start()
+    events = await asyncio.wait_for(waiter, timeout=1)
+    assert events[0]['type'] == 'watcher' and events[0]['seq'] == 4
+
+    bus.publish('conflict', {'n': 4})
+    events = await _collect(bus, 0, 1)
+    assert events[0]['type'] == 'reset'
+    assert bus.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_reset_after_restart():
+    """后端重启后序号从 0 开始：旧进程的事件 id 或超过当前序号的 since 都先收到 reset，之后的事件正常接收"""
+    bus = EventBus()
+    bus.bind_loop(asyncio.get_running_loop())
+    old_id = EventBus().event_id(300)
+    assert bus.parse_event_id(old_id) == -1
+    assert bus.parse_event_id('300') == -1
+    assert bus.parse_event_id(bus.event_id(2)) == 2
+
+    for since in (300, bus.parse_event_id(old_id)):
+        waiter = asyncio.create_task(_collect(bus, since, 2))
+        await asyncio.sleep(0)
+        for i in range(5):
+            bus.publish('conflict', {'n': i})
+        events = await asyncio.wait_for(waiter, timeout=1)
+        assert events[0]['type'] == 'reset'
+        assert events[1]['type'] == 'conflict' and events[1]['seq'] == events[0]['seq'] + 1
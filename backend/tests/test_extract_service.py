@@ -4,6 +4,7 @@
 import pytest
 import os
 import tempfile
+import shutil
 import zipfile
 from unittest.mock import Mock, patch
 
@@ -102,6 +103,103 @@ class TestExtractService:
         result = await extract_service._verify_extraction(archive_info, output_path)
         assert result is True
 
+    @pytest.mark.asyncio
+    async def test_verify_extraction_with_slt_manifest(self, extract_service, temp_dir):
+        """测试解析 7z -slt 清单并用一次目录遍历验证解压结果"""
+        from app.core.extract_service import ArchiveInfo
+
+        output = (
+            "Path = test.zip\nType = zip\nPhysical Size = 300\n\n----------\n"
+            "Path = test.txt\nFolder = -\nSize = 12\nCRC = 57F4675D\nEncrypted = +\n\n"
+            "Path = test_dir\nFolder = +\nSize = 0\nEncrypted = -\n\n"
+            "Path = test_dir/nested.txt\nFolder = -\nSize = 14\nCRC = 1A2B3C4D\nEncrypted = -\n"
+        )
+        file_list = extract_service._parse_7z_list_output(output)
+        assert [f['name'] for f in file_list] == ['test.txt', 'test_dir', 'test_dir/nested.txt']
+        assert file_list[0]['crc'] == '57F4675D' and file_list[0]['encrypted']
+        assert file_list[1]['is_dir']
+        assert extract_service._pick_probe_entry(file_list) == 'test.txt'
+
+        output_path = os.path.join(temp_dir, 'output')
+        os.makedirs(os.path.join(output_path, 'test_dir'))
+        with open(os.path.join(output_path, 'test.txt'), 'w') as f:
+            f.write('test content')
+        with open(os.path.join(output_path, 'test_dir', 'nested.txt'), 'w') as f:
+            f.write('nested content')
+
+        archive_info = ArchiveInfo('test.zip', file_list)
+        assert await extract_service._verify_extraction(archive_info, output_path) is True
+
+        with open(os.path.join(output_path, 'test.txt'), 'w') as f:
+            f.write('truncated')
+        assert await extract_service._verify_extraction(archive_info, output_path) is False
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(shutil.which('zip') is None, reason="需要 zip 命令生成 ZipCrypto 压缩包")
+    async def test_builtin_zip_backend(self, extract_service, temp_dir):
+        """测试内置 ZIP 后端：进程内列出内容、测试 ZipCrypto 密码并解压"""
+        import subprocess
+        source_dir = os.path.join(temp_dir, 'src')
+        os.makedirs(os.path.join(source_dir, 'sub'))
+        with open(os.path.join(source_dir, 'a.txt'), 'w') as f:
+            f.write('hello world')
+        with open(os.path.join(source_dir, 'sub', 'b.txt'), 'w') as f:
+            f.write('nested content' * 100)
+        zip_path = os.path.join(temp_dir, 'RJ123456.zip')
+        subprocess.run(['zip', '-q', '-r', '-P', 'secret', zip_path, 'a.txt', 'sub'], cwd=source_dir, check=True)
+
+        with patch.object(extract_service, '_run_7z_command', side_effect=AssertionError("不应启动 7z")):
+            assert await extract_service._zip_encoding(zip_path) is not None
+            file_list = await extract_service._list_archive_contents(zip_path)
+            files = {f['name']: f for f in file_list if not f['is_dir']}
+            assert set(files) == {'a.txt', 'sub/b.txt'}
+            assert all(f['encrypted'] for f in files.values())
+
+            assert await extract_service._test_password(zip_path, 'secret', 'a.txt') is True
+            assert await extract_service._test_password(zip_path, 'wrong', 'a.txt') is False
+            assert await extract_service._test_password(zip_path, 'wrong') is False
+
+            output_path = os.path.join(temp_dir, 'output')
+            assert await extract_service._extract_with_password(zip_path, output_path, 'secret') is True
+            with open(os.path.join(output_path, 'sub', 'b.txt')) as f:
+                assert f.read() == 'nested content' * 100
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(shutil.which('zip') is None, reason="需要 zip 命令生成 ZipCrypto 压缩包")
+    async def test_builtin_zip_backend_header_collision(self, extract_service, temp_dir):
+        """错误密码碰巧通过 ZipCrypto 的 1 字节校验时，解压乱码抛出的 zlib.error 视为密码错误"""
+        import random
+        import subprocess
+        import zlib
+        source_dir = os.path.join(temp_dir, 'src')
+        os.makedirs(source_dir)
+        rng = random.Random(0)
+        with open(os.path.join(source_dir, 'a.txt'), 'w') as f:
+            f.write(' '.join(rng.choice(['alpha', 'beta', 'gamma', 'delta']) for _ in range(2000)))
+        zip_path = os.path.join(temp_dir, 'RJ123456.zip')
+        subprocess.run(['zip', '-q', '-P', 'secret', zip_path, 'a.txt'], cwd=source_dir, check=True)
+
+        # 找一个通过头部校验、解压时抛出 zlib.error 的错误密码
+        collision = None
+        with zipfile.ZipFile(zip_path) as zf:
+            for i in range(20000):
+                candidate = f'wrong{i}'
+                try:
+                    with zf.open('a.txt', pwd=candidate.encode()) as f:
+                        f.read()
+                except zlib.error:
+                    collision = candidate
+                    break
+                except (RuntimeError, zipfile.BadZipFile):
+                    continue
+        assert collision is not None
+
+        with patch.object(extract_service, '_run_7z_command', side_effect=AssertionError("不应启动 7z")):
+            assert await extract_service._test_password(zip_path, collision, 'a.txt') is False
+            assert await extract_service._test_password(zip_path, collision) is False
+            output_path = os.path.join(temp_dir, 'output')
+            assert await extract_service._extract_with_password(zip_path, output_path, collision) is False
+
     @pytest.mark.asyncio
     async def test_extract_task(self, extract_service, temp_dir):
         """测试完整的解压任务"""
@@ -121,3 +219,59 @@ class TestExtractService:
         assert output_path is not None
         assert os.path.exists(output_path)
         assert task.update_progress.called
+
+    @pytest.mark.asyncio
+    async def test_probe_passwords(self, extract_service):
+        """测试并行探测密码，成功后取消其余探测"""
+        import asyncio
+        started = []
+
+        async def probe(password):
+            started.append(password)
+            if password == 'right':
+                return True
+            if password != 'a':
+                # 排名第一的候选单独探测，之后的探测并行进行
+                await asyncio.sleep(10)
+            return False
+
+        password = await asyncio.wait_for(
+            extract_service._probe_passwords(['a', 'b', 'right', 'c'], probe),
+            timeout=1.0
+        )
+        assert password == 'right'
+        assert started[0] == 'a'
+        assert await extract_service._probe_passwords([], probe) is None
+
+    def test_password_ranking(self, db_engine):
+        """测试按历史命中率排序候选密码"""
+        from app.core.password_ranking import PasswordRanker
+        from conftest import override_get_db
+
+        ranker = PasswordRanker()
+        with patch('app.core.password_ranking.get_db', override_get_db):
+            archive = '/input/[circle] RJ01000000 work.zip'
+            rj_passwords = ['RJ1000000', 'RJ1000001', 'RJ999999']
+            candidates = rj_passwords + ['', 'common', 'circle-pass']
+
+            # 同一模式的其他作品使用 circle-pass，RJ号+1 从未命中
+            for rj in ('RJ01000010', 'RJ01000020'):
+                ranker.record(f'/input/[circle] {rj} other.zip', 'circle-pass', ['RJ1000011'],
+                              [f'RJ{int(rj[2:]) + d}' for d in (0, 1, -1)])
+
+            ranked = ranker.rank(archive, candidates, rj_passwords)
+            assert ranked[0] == 'circle-pass'
+            assert ranked[-1] == 'RJ1000001'
+
+    def test_candidates_skip_empty_password_for_encrypted(self, extract_service):
+        """清单显示有加密文件时候选密码中不含无密码"""
+        ranker = Mock()
+        ranker.rank.side_effect = lambda path, learned, rj: learned
+        with patch.object(extract_service, '_get_vault_passwords', return_value=([], ['common'])), \
+                patch.object(extract_service, '_get_rj_passwords', return_value=[]), \
+                patch('app.core.password_ranking.get_password_ranker', return_value=ranker):
+            plain, _ = extract_service._get_candidate_passwords('/input/a.zip')
+            encrypted, _ = extract_service._get_candidate_passwords('/input/a.zip', encrypted=True)
+
+        assert '' in plain
+        assert '' not in encrypted and 'common' in encrypted
@@ -0,0 +1,79 @@
+"""
+文件写入完成检测测试
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.core.file_stability import FileStabilityMonitor, MODIFIED, CLOSED
+
+
+@pytest.mark.asyncio
+async def test_closed_event_finishes_wait(tmp_path):
+    """收到写入后关闭事件时不必等满检查次数"""
+    path = tmp_path / "RJ123456.zip"
+    path.write_bytes(b"x" * 2048)
+
+    monitor = FileStabilityMonitor()
+    monitor.attach(asyncio.get_running_loop(), str(tmp_path))
+
+    async def finish_copy():
+        await asyncio.sleep(0.1)
+        monitor.notify(str(path), MODIFIED)
+        await asyncio.sleep(0.1)
+        monitor.notify(str(path), CLOSED)
+
+    start = time.monotonic()
+    copier = asyncio.create_task(finish_copy())
+    assert await monitor.wait_stable(str(path), checks=3, interval=5, max_wait=30)
+    await copier
+    assert time.monotonic() - start < 3
+
+
+@pytest.mark.asyncio
+async def test_polling_fallback_and_timeout(tmp_path):
+    """不在监视目录内的文件按大小轮询；一直不完整时超时"""
+    done = tmp_path / "done.zip"
+    done.write_bytes(b"x" * 2048)
+    small = tmp_path / "small.zip"
+    small.write_bytes(b"x")
+
+    monitor = FileStabilityMonitor()
+    assert await monitor.wait_stable(str(done), checks=2, interval=0.05, max_wait=5)
+    with pytest.raises(TimeoutError):
+        await monitor.wait_stable(str(small), checks=2, interval=0.05, max_wait=0.3)
+
+
+@pytest.mark.asyncio
+async def test_volumes_checked_concurrently(tmp_path):
+    """分卷并发检查，总耗时约为单个文件的检查时间"""
+    volumes = []
+    for i in range(1, 6):
+        volume = tmp_path / f"RJ123456.part{i}.rar"
+        volume.write_bytes(b"x" * 2048)
+        volumes.append(str(volume))
+
+    monitor = FileStabilityMonitor()
+    start = time.monotonic()
+    assert await monitor.all_quiet(volumes, window=0.2)
+    assert time.monotonic() - start < 0.8
+
+
+@pytest.mark.asyncio
+async def test_detach_while_waiting_falls_back_to_polling(tmp_path):
+    """等待事件期间监视器停止（记录被清空）时不出错，改为按大小轮询"""
+    path = tmp_path / "RJ123456.zip"
+    path.write_bytes(b"x" * 2048)
+
+    monitor = FileStabilityMonitor()
+    monitor.attach(asyncio.get_running_loop(), str(tmp_path))
+
+    async def stop_watching():
+        await asyncio.sleep(0.1)
+        monitor._record(str(path), MODIFIED)
+        monitor.detach()
+
+    stopper = asyncio.create_task(stop_watching())
+    assert await monitor.wait_stable(str(path), checks=2, interval=0.2, max_wait=5)
+    await stopper
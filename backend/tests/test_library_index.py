@@ -0,0 +1,98 @@
+"""
+库存索引测试
+"""
+import asyncio
+import os
+import time
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.core.library_index import LibraryIndex, extract_rjcode
+from conftest import override_get_db
+
+
+@pytest.fixture
+def library_dir():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield tmpdir
+
+
+@pytest.fixture
+def index(db_engine, library_dir):
+    config = SimpleNamespace(storage=SimpleNamespace(library_path=library_dir, library_index_depth=3))
+    with patch('app.core.library_index.get_db', override_get_db), \
+            patch('app.core.library_index.get_config', return_value=config):
+        yield LibraryIndex()
+
+
+def test_extract_rjcode():
+    assert extract_rjcode('[circle] rj01234567 作品名') == 'RJ01234567'
+    assert extract_rjcode('RJ1234567') is None
+    assert extract_rjcode('no code') is None
+
+
+def test_crawl_and_lookup(index, library_dir):
+    """一次扫描建立索引，之后查找不再遍历库存目录"""
+    work = os.path.join(library_dir, 'maker', 'RJ123456 作品')
+    os.makedirs(os.path.join(work, 'RJ654321 特典'))
+    os.makedirs(os.path.join(library_dir, '_conflicts', 'RJ111111'))
+    with open(os.path.join(work, 'track.wav'), 'wb') as f:
+        f.write(b'x' * 10)
+
+    result = index.rebuild()
+    assert result['total'] == 1
+
+    with patch.object(index, '_crawl', side_effect=AssertionError("不应再次扫描")):
+        existing = index.lookup('rj123456')
+        assert existing == {'path': work, 'size': 10, 'file_count': 1}
+        # 作品文件夹内部和冲突目录不计入索引
+        assert index.lookup('RJ654321') is None
+        assert index.lookup('RJ111111') is None
+
+    # 重新加载时从 LibrarySnapshot 恢复
+    reloaded = LibraryIndex()
+    reloaded._crawled = True
+    assert reloaded.lookup('RJ123456')['path'] == work
+
+
+def test_incremental_updates(index, library_dir):
+    """文件系统事件增量维护索引"""
+    index.rebuild()
+    maker = os.path.join(library_dir, 'maker')
+    work = os.path.join(maker, 'RJ222222')
+    os.makedirs(work)
+    index.on_folder_added(work)
+    assert index.lookup('RJ222222')['path'] == work
+
+    renamed = os.path.join(library_dir, 'other')
+    os.rename(maker, renamed)
+    index.on_folder_moved(maker, renamed)
+    assert index.lookup('RJ222222')['path'] == os.path.join(renamed, 'RJ222222')
+
+    index.on_folder_removed(renamed)
+    assert index.lookup('RJ222222') is None
+    assert index.verify()['unindexed'] == ['RJ222222']
+
+
+@pytest.mark.asyncio
+async def test_lookup_async_waits_for_startup_crawl(index, library_dir, monkeypatch):
+    """首次扫描进行中时异步查找等待扫描完成，不在事件循环中再扫描一次"""
+    work = os.path.join(library_dir, 'RJ333333 作品')
+    os.makedirs(work)
+    crawls = []
+    original_crawl = index._crawl
+
+    def slow_crawl(*args):
+        crawls.append(args)
+        time.sleep(0.1)
+        return original_crawl(*args)
+
+    monkeypatch.setattr(index, '_crawl', slow_crawl)
+    index._crawl_task = asyncio.create_task(asyncio.to_thread(index.rebuild))
+
+    existing = await index.lookup_async('RJ333333')
+    assert existing['path'] == work
+    assert len(crawls) == 1
@@ -0,0 +1,123 @@
+"""
+作品关联图存储测试
+"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.dlsite_service import DLsiteApiService
+from app.core.duplicate_service import BatchDuplicateCheck
+from app.core.linkage_store import LinkageStore
+from app.models.database import WorkLinkage
+from conftest import override_get_db
+
+COMPONENT = {
+    'RJ100000': ('original', 'JPN'),
+    'RJ200000': ('parent', 'CHI_HANS'),
+    'RJ200001': ('child', 'CHI_HANS'),
+    'RJ300000': ('parent', 'ENG'),
+    'RJ300001': ('child', 'ENG'),
+}
+
+
+@pytest.fixture
+def store(db_engine):
+    config = SimpleNamespace(metadata=SimpleNamespace(linkage_ttl_hours=72))
+    with patch('app.core.linkage_store.get_db', override_get_db), \
+            patch('app.core.linkage_store.get_config', return_value=config):
+        yield LinkageStore()
+
+
+def test_component_lookup_from_any_member(store):
+    """任意成员都能取回整个分量"""
+    store.save_component('RJ100000', COMPONENT)
+
+    component = store.get_component('rj300001')
+    assert component.original_rjcode == 'RJ100000'
+    assert component.works == COMPONENT
+    assert not component.stale
+    assert store.get_component('RJ999999') is None
+
+
+def test_expired_edge_marks_component_stale(store):
+    store.save_component('RJ100000', COMPONENT)
+    db = next(override_get_db())
+    db.query(WorkLinkage).filter(WorkLinkage.linked_rjcode == 'RJ200001').update(
+        {'expires_at': datetime.utcnow() - timedelta(minutes=1)}
+    )
+    db.commit()
+    db.close()
+
+    assert store.get_component('RJ100000').stale
+
+
+@pytest.mark.asyncio
+async def test_linkage_served_from_store_without_crawling(store):
+    """已持久化的关联分量直接返回，不再请求 DLsite"""
+    store.save_component('RJ100000', COMPONENT)
+    service = DLsiteApiService()
+    service.linkage_store = store
+
+    with patch.object(service, '_crawl_component', AsyncMock(side_effect=AssertionError("不应请求 DLsite"))):
+        full = await service.get_full_linkage('RJ200001', ['CHI_HANS'])
+        assert set(full) == {'RJ100000', 'RJ200000', 'RJ200001', 'RJ300000'}
+
+        direct = await service.get_linked_works('RJ200000')
+        assert set(direct) == {'RJ100000', 'RJ200000', 'RJ200001'}
+
+        direct = await service.get_linked_works('RJ100000')
+        assert set(direct) == {'RJ100000', 'RJ200000', 'RJ300000'}
+
+
+@pytest.mark.asyncio
+async def test_batch_check_resolves_component_once():
+    """批量查重时同一 RJ 号只检查一次，同一关联分量只解析一次"""
+    works = DLsiteApiService._component_works(SimpleNamespace(works=COMPONENT))
+    service = SimpleNamespace(
+        dlsite_service=SimpleNamespace(get_component=AsyncMock(return_value=works)),
+        check_duplicate_enhanced=AsyncMock(side_effect=lambda code, **kwargs: (code, kwargs['component']))
+    )
+    batch = BatchDuplicateCheck(service, concurrency=2)
+
+    with patch('app.core.duplicate_service.get_library_index') as library_index:
+        library_index.return_value.lookup_async = AsyncMock(return_value=None)
+        results = await asyncio.gather(
+            batch.check('RJ200001'), batch.check('rj200001'), batch.check('RJ300001')
+        )
+
+    assert [code for code, _ in results] == ['RJ200001', 'RJ200001', 'RJ300001']
+    assert all(component is works for _, component in results)
+    service.dlsite_service.get_component.assert_awaited_once_with('RJ200001')
+    assert service.check_duplicate_enhanced.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_members_crawl_component_once(store):
+    """同一分量的两个成员并发查重时，关联图只爬取一次"""
+    store.invalidate('RJ100000')
+    service = DLsiteApiService()
+    service.linkage_store = store
+    works = DLsiteApiService._component_works(SimpleNamespace(works=COMPONENT))
+
+    async def crawl(original_rjcode):
+        await asyncio.sleep(0.05)
+        return works
+
+    duplicate_service = SimpleNamespace(
+        dlsite_service=service,
+        check_duplicate_enhanced=AsyncMock(side_effect=lambda code, **kwargs: (code, kwargs['component']))
+    )
+    batch = BatchDuplicateCheck(duplicate_service, concurrency=8)
+    translation = AsyncMock(return_value=SimpleNamespace(is_original=False, original_workno='RJ100000'))
+
+    with patch.object(service, 'get_translation_info', translation), \
+            patch.object(service, '_crawl_component', AsyncMock(side_effect=crawl)) as crawl_component, \
+            patch('app.core.duplicate_service.get_library_index') as library_index:
+        library_index.return_value.lookup_async = AsyncMock(return_value=None)
+        results = await asyncio.gather(batch.check('RJ200001'), batch.check('RJ300001'))
+
+    crawl_component.assert_awaited_once_with('RJ100000')
+    assert all(set(component) == set(COMPONENT) for _, component in results)
@@ -0,0 +1,56 @@
+"""
+日志读取测试
+"""
+import os
+
+from app.core import log_reader
+from app.core.log_reader import LogFilter, LogFollower
+
+
+def _line(i, level='INFO', message=None):
+    return f"2024-01-01 12:00:{i % 60:02d} [{level}] app.test - {message or f'line {i}'}\n"
+
+
+def test_tail_reads_backwards_across_rotated_files(tmp_path, monkeypatch):
+    """最后 N 行跨越多个块和轮转文件，过滤后续行跟随所属日志行"""
+    monkeypatch.setattr(log_reader, 'BLOCK_SIZE', 64)
+    log_file = str(tmp_path / "app.log")
+    with open(log_file + ".1", 'w', encoding='utf-8') as f:
+        f.write(_line(0, 'ERROR', '处理 RJ123456 失败'))
+        f.write("Traceback (most recent call last):\n")
+        f.write(_line(1))
+    with open(log_file, 'w', encoding='utf-8') as f:
+        for i in range(2, 12):
+            f.write(_line(i))
+
+    logs, offset = log_reader.tail(log_file, 5)
+    assert offset == os.path.getsize(log_file)
+    assert [line.split(' - ')[1] for line in logs] == [f"line {i}" for i in range(7, 12)]
+
+    logs, _ = log_reader.tail(log_file, 100)
+    assert len(logs) == 13
+
+    logs, _ = log_reader.tail(log_file, 100, LogFilter(['error'], 'rj123456'))
+    assert logs == [_line(0, 'ERROR', '处理 RJ123456 失败').rstrip('\n'), "Traceback (most recent call last):"]
+
+
+def test_follower_reads_new_lines_and_rotation(tmp_path):
+    """跟踪模式只读取新写入的完整行，轮转后先读完旧文件剩余部分"""
+    log_file = str(tmp_path / "app.log")
+    with open(log_file, 'w', encoding='utf-8') as f:
+        f.write(_line(0))
+    follower = LogFollower(log_file, os.path.getsize(log_file), LogFilter(['WARNING']))
+    assert follower.read_new() == []
+
+    with open(log_file, 'a', encoding='utf-8') as f:
+        f.write(_line(1, 'WARNING'))
+        f.write(_line(2))
+        f.write("2024-01-01 12:00:03 [WARNING] app.test - 未写完")
+    assert [line.split(' - ')[1] for line in follower.read_new()] == ["line 1"]
+
+    with open(log_file, 'a', encoding='utf-8') as f:
+        f.write("的行\n")
+    os.rename(log_file, log_file + ".1")
+    with open(log_file, 'w', encoding='utf-8') as f:
+        f.write(_line(4, 'WARNING'))
+    assert [line.split(' - ')[1] for line in follower.read_new()] == ["未写完的行", "line 4"]
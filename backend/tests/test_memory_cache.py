@@ -0,0 +1,58 @@
+"""
+进程内缓存测试
+"""
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.memory_cache import MISSING, MemoryCache
+
+
+def test_lru_eviction():
+    cache = MemoryCache('test', max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # a 变为最近使用
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['size'] == 2
+
+
+def test_ttl_and_negative_caching():
+    cache = MemoryCache('test', max_size=10, ttl=60, negative_ttl=0.01)
+    cache.set('found', {'workno': 'RJ123456'})
+    cache.set('missing', None)
+
+    assert cache.get('missing') is None
+    time.sleep(0.02)
+    assert cache.get('missing') is MISSING
+    assert cache.get('found') == {'workno': 'RJ123456'}
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['expirations'] == 1
+
+
+@pytest.mark.asyncio
+async def test_japanese_metadata_errors_not_cached():
+    """请求失败不缓存，作品不存在才缓存 None"""
+    from app.core.metadata_service import MetadataService
+    from app.core.rename_service import RenameService
+
+    service = RenameService()
+    service._japanese_metadata_cache = MemoryCache('test_japanese', max_size=10, ttl=60, negative_ttl=60)
+    fetch = AsyncMock(side_effect=[TimeoutError(), {'maker_name': 'サークル'}, None])
+
+    with patch.object(MetadataService, 'fetch_japanese_metadata', fetch):
+        assert await service._get_japanese_metadata('RJ100000') is None
+        assert await service._get_japanese_metadata('RJ100000') == {'maker_name': 'サークル'}
+        assert await service._get_japanese_metadata('RJ200000') is None
+        assert await service._get_japanese_metadata('RJ200000') is None
+
+    assert fetch.await_count == 3
@@ -6,14 +6,22 @@ import asyncio
 from unittest.mock import Mock, patch
 
 from app.core.task_engine import TaskEngine, Task, TaskType, TaskStatus
+from app.core.task_store import TaskStore, snapshot_task
+from app.models.database import Task as TaskModel
+from conftest import override_get_db
 
 class TestTaskEngine:
     """测试任务引擎"""
     
     @pytest.fixture
-    def engine(self):
-        """创建任务引擎实例"""
-        return TaskEngine(max_concurrent=2)
+    def engine(self, db_engine):
+        """创建任务引擎实例（任务持久化写入测试数据库）"""
+        with patch('app.core.task_store.get_db', override_get_db):
+            yield TaskEngine(max_concurrent=2)
+        db = next(override_get_db())
+        db.query(TaskModel).delete()
+        db.commit()
+        db.close()
     
     @pytest.fixture
     def sample_task(self):
@@ -140,3 +148,260 @@ class TestTaskEngine:
         engine.add_progress_callback(callback)
         
         assert callback in engine._progress_callbacks
+
+    @pytest.mark.asyncio
+    async def test_worker_pool_processes_queue(self, engine):
+        """测试工作协程池处理队列中的任务"""
+        processed = []
+
+        async def fake_process(task):
+            processed.append(task.id)
+            engine.processing.discard(task.id)
+
+        with patch.object(engine, '_process_task', side_effect=fake_process), \
+             patch.object(engine, 'load_waiting_retry_tasks'):
+            engine.start()
+            for i in range(5):
+                await engine.submit(Task(task_type=TaskType.AUTO_PROCESS, source_path=f"/test/file{i}.zip"))
+            await asyncio.wait_for(engine.queue.join(), timeout=1.0)
+            engine.stop()
+            await asyncio.sleep(0)
+
+        assert len(processed) == 5
+        assert engine.get_stats()['finished_count'] == 5
+
+    @pytest.mark.asyncio
+    async def test_set_max_concurrent(self, engine):
+        """测试运行时调整并发数"""
+        with patch.object(engine, 'load_waiting_retry_tasks'):
+            engine.start()
+            assert engine.get_stats()['workers'] == 2
+
+            engine.set_max_concurrent(4)
+            assert engine.get_stats()['workers'] == 4
+
+            engine.set_max_concurrent(1)
+            stats = engine.get_stats()
+            assert stats['workers'] == 1
+            assert stats['max_concurrent'] == 1
+            assert stats['queue_size'] == 0
+            engine.stop()
+            await asyncio.sleep(0)
+
+    @pytest.mark.asyncio
+    async def test_unfinished_tasks_restored_after_restart(self, engine):
+        """重启后未完成的任务按顺序重新入队，并带回阶段检查点"""
+        finished = Task(task_type=TaskType.AUTO_PROCESS, source_path="/test/done.zip")
+        finished.complete()
+        resumable = Task(task_type=TaskType.AUTO_PROCESS, source_path="/test/resume.zip",
+                         auto_classify=True, metadata={'title': 'テスト'}, rjcode='RJ123456')
+        resumable.start()
+        resumable.checkpoint('extract', path="/tmp/extracted")
+        TaskStore().save([snapshot_task(finished), snapshot_task(resumable)])
+
+        assert engine.restore_tasks() == 1
+        restored = engine.get_task(resumable.id)
+        assert restored.status == TaskStatus.PENDING
+        assert restored.auto_classify is True
+        assert restored.rjcode == 'RJ123456'
+        assert restored.task_metadata == {'title': 'テスト'}
+        assert restored.checkpoints == {'extract': {'path': "/tmp/extracted"}}
+        assert engine.queue.get_nowait() is restored
+
+        # 已在内存中的任务不会重复恢复
+        assert engine.restore_tasks() == 0
+
+        restored.complete()
+        engine.stop()
+        assert engine.restore_tasks() == 0
+
+    def test_finished_tasks_evicted_and_paginated(self, engine):
+        """已结束的任务写库后移出内存，分页查询仍能合并内存和数据库中的任务"""
+        from datetime import datetime, timedelta
+        from types import SimpleNamespace
+
+        base = datetime.utcnow() - timedelta(hours=1)
+        tasks = []
+        for i in range(5):
+            task = Task(task_type=TaskType.AUTO_PROCESS, source_path=f"/test/file{i}.zip", rjcode=f"RJ00000{i}")
+            task.created_at = base + timedelta(minutes=i)
+            engine.tasks[task.id] = task
+            tasks.append(task)
+        for task in tasks[:3]:
+            task.complete()
+        tasks[0].completed_at = base
+
+        TaskStore().save(engine._collect_dirty_snapshots())
+        config = SimpleNamespace(processing=SimpleNamespace(task_retention_minutes=30, task_history_size=1))
+        with patch('app.config.settings.get_config', return_value=config):
+            assert engine._evict_finished() == 2
+        assert set(engine.tasks) == {t.id for t in tasks[2:]}
+
+        page, has_more = engine.query_tasks(limit=3)
+        assert [t.id for t in page] == [t.id for t in reversed(tasks[2:])]
+        assert has_more
+        last = page[-1]
+        page, has_more = engine.query_tasks(cursor=(last.created_at, last.id), limit=3)
+        assert [t.id for t in page] == [tasks[1].id, tasks[0].id]
+        assert not has_more
+
+        assert [t.id for t in engine.query_tasks(statuses=['completed'])[0]] == [t.id for t in reversed(tasks[:3])]
+        assert [t.id for t in engine.query_tasks(rjcode='rj000000')[0]] == [tasks[0].id]
+        page, has_more = engine.query_tasks(limit=None)
+        assert [t.id for t in page] == [t.id for t in reversed(tasks)]
+        assert not has_more
+        page, _ = asyncio.run(engine.query_tasks_async(statuses=['pending'], limit=None))
+        assert [t.id for t in page] == [t.id for t in reversed(tasks[3:])]
+        assert engine.load_task(tasks[0].id).status == TaskStatus.COMPLETED
+
+    def test_in_place_changes_are_persisted(self, engine):
+        """原地修改 task_metadata 后 touch()、同一阶段重新记录检查点，都会被写库"""
+        task = Task(task_type=TaskType.AUTO_PROCESS, source_path="/test/a.zip")
+        engine.tasks[task.id] = task
+        assert len(engine._collect_dirty_snapshots()) == 1
+        assert engine._collect_dirty_snapshots() == []
+
+        task.task_metadata['failed_files'] = [{'path': 'a.mp3'}]
+        task.touch()
+        assert engine._collect_dirty_snapshots()[0]['task_metadata']['failed_files'] == [{'path': 'a.mp3'}]
+
+        task.checkpoint('rename', path="/tmp/renamed")
+        engine._collect_dirty_snapshots()
+        task.checkpoint('rename', path="/tmp/flattened")
+        snapshots = engine._collect_dirty_snapshots()
+        assert len(snapshots) == 1 and engine._collect_dirty_snapshots() == []
+
+    def test_changed_tasks_since_revision(self, engine):
+        """只返回版本号之后有变化的任务"""
+        first = Task(task_type=TaskType.AUTO_PROCESS, source_path="/test/a.zip")
+        second = Task(task_type=TaskType.AUTO_PROCESS, source_path="/test/b.zip")
+        engine.tasks[first.id] = first
+        engine.tasks[second.id] = second
+        revision = engine.sync_revision()
+        assert engine.sync_revision() == revision
+
+        second.update_progress(50, "解压中")
+        assert [t.id for t in engine.get_changed_tasks(revision)] == [second.id]
+        assert engine.revision > revision
+
+    @pytest.mark.asyncio
+    async def test_active_task_path_index(self, engine, sample_task):
+        """按源路径判断是否已有进行中的任务，源路径变化后索引同步更新"""
+        await engine.submit(sample_task)
+        assert engine.has_active_task("/test/file.zip")
+
+        sample_task.source_path = "/test/renamed.zip"
+        assert not engine.has_active_task("/test/file.zip")
+        assert engine.has_active_task("/test/renamed.zip")
+
+        sample_task.complete()
+        assert not engine.has_active_task("/test/renamed.zip")
+
+        engine.remove_task(sample_task.id)
+        assert engine._path_index == {}
+
+    @pytest.mark.asyncio
+    async def test_wait_done(self, sample_task):
+        """等待任务结束，支持超时和自定义等待的状态"""
+        from app.core.task_engine import SETTLED_STATUSES
+
+        assert await sample_task.wait_done(timeout=0.01) is False
+
+        waiter = asyncio.create_task(sample_task.wait_done())
+        settled = asyncio.create_task(sample_task.wait_done(until=SETTLED_STATUSES))
+        sample_task.start()
+        await asyncio.sleep(0)
+        assert not waiter.done() and not settled.done()
+
+        sample_task.status = TaskStatus.WAITING_MANUAL
+        assert await asyncio.wait_for(settled, timeout=1) is True
+        assert not waiter.done()
+
+        sample_task.complete()
+        assert await asyncio.wait_for(waiter, timeout=1) is True
+        assert await sample_task.wait_done(timeout=0) is True
+
+    @pytest.mark.asyncio
+    async def test_stage_limiter(self):
+        """测试阶段并发限制器"""
+        from app.core.stage_pools import StageLimiter
+
+        limiter = StageLimiter(1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        assert limiter.waiting == 1
+
+        # 提高上限后等待者立即获得名额
+        limiter.set_limit(2)
+        await asyncio.wait_for(waiter, timeout=1.0)
+        assert limiter.active == 2
+
+        limiter.release()
+        limiter.release()
+        assert limiter.active == 0
+
+    @pytest.mark.asyncio
+    async def test_extract_runs_while_metadata_stage_is_full(self, engine):
+        """工作协程数不少于各阶段并发数之和：元数据阶段占满时其他任务仍能解压"""
+        from types import SimpleNamespace
+        from app.core.stage_pools import StagePools, get_pipeline_depth
+
+        processing = SimpleNamespace(max_workers=1, extract_concurrency=1, metadata_concurrency=2,
+                                     move_concurrency_per_volume=1)
+        assert get_pipeline_depth(processing) == 4
+
+        pools = StagePools()
+        release = asyncio.Event()
+        extracted = asyncio.Event()
+
+        async def fake_process(task):
+            if task.source_path.startswith('/test/meta'):
+                async with pools.slot('metadata'):
+                    await release.wait()
+            else:
+                async with pools.slot('extract'):
+                    extracted.set()
+            engine.processing.discard(task.id)
+
+        engine.set_max_concurrent(get_pipeline_depth(processing))
+        with patch('app.core.stage_pools.get_config', return_value=SimpleNamespace(processing=processing)), \
+             patch.object(engine, '_process_task', side_effect=fake_process), \
+             patch.object(engine, 'load_waiting_retry_tasks'):
+            engine.start()
+            for i in range(3):
+                await engine.submit(Task(task_type=TaskType.AUTO_PROCESS, source_path=f"/test/meta{i}.zip"))
+            await engine.submit(Task(task_type=TaskType.AUTO_PROCESS, source_path="/test/extract.zip"))
+            await asyncio.wait_for(extracted.wait(), timeout=1.0)
+            assert pools.get_stats()['metadata']['active'] == 2
+            release.set()
+            await asyncio.wait_for(engine.queue.join(), timeout=1.0)
+            engine.stop()
+            await asyncio.sleep(0)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_task_keeps_checkpointed_output(self, engine, tmp_path):
+        """关闭时被中断的任务不清理临时文件，失败清理也不删除检查点记录的路径"""
+        temp = tmp_path / "temp"
+        extracted = temp / "work"
+        extracted.mkdir(parents=True)
+        config = Mock()
+        config.storage.temp_path = str(temp)
+
+        task = Task(task_type=TaskType.AUTO_PROCESS, source_path=str(tmp_path / "work.zip"))
+        task.checkpoint('extract', path=str(extracted))
+
+        async def interrupted(*args, **kwargs):
+            raise asyncio.CancelledError()
+
+        with patch('app.config.settings.get_config', return_value=config), \
+                patch.object(engine, '_notify_progress', side_effect=interrupted):
+            with pytest.raises(asyncio.CancelledError):
+                await engine._process_task(task)
+        assert extracted.exists()
+
+        task.fail("分类失败")
+        with patch('app.config.settings.get_config', return_value=config):
+            await engine._cleanup_failed_task(task)
+        assert extracted.exists()
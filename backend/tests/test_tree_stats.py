@@ -0,0 +1,78 @@
+"""
+目录统计服务测试
+"""
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from app.core.tree_stats import TreeStatsService
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def _age(root, seconds=60):
+    """把目录树中所有条目的 mtime 改到 seconds 秒前"""
+    past = time.time() - seconds
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (past, past))
+    for dirpath, _, _ in os.walk(root, topdown=False):
+        os.utime(dirpath, (past, past))
+
+
+def test_tree_stats_reuses_unchanged_subtrees():
+    """一次遍历统计大小和文件数，再次统计时只重新列出发生变化的目录"""
+    service = TreeStatsService()
+    with tempfile.TemporaryDirectory() as root:
+        _write(os.path.join(root, 'a.wav'), 100)
+        _write(os.path.join(root, 'disc1', 'b.wav'), 20)
+        _write(os.path.join(root, 'disc2', 'c.wav'), 3)
+        _age(root)
+
+        stats = service.get_stats(root)
+        assert (stats.size, stats.file_count) == (123, 3)
+
+        with patch.object(service, '_scan_dir', side_effect=AssertionError("不应重新列出目录")):
+            assert service.get_stats(root).size == 123
+
+        _write(os.path.join(root, 'disc2', 'd.wav'), 4)
+        _age(os.path.join(root, 'disc2'))
+        scanned = []
+        original = service._scan_dir
+
+        def record(path, key):
+            scanned.append(os.path.basename(path))
+            return original(path, key)
+
+        with patch.object(service, '_scan_dir', side_effect=record):
+            stats = service.get_stats(root)
+        assert (stats.size, stats.file_count) == (127, 4)
+        assert scanned == ['disc2']
+
+        assert service.get_stats(os.path.join(root, 'missing')).file_count == 0
+
+
+def test_tree_stats_skips_recently_changed_dirs():
+    """刚变化的目录和正在写入的文件不缓存，结果标记为未稳定"""
+    service = TreeStatsService()
+    with tempfile.TemporaryDirectory() as root:
+        _write(os.path.join(root, 'done', 'a.wav'), 10)
+        _age(root)
+        _write(os.path.join(root, 'copying', 'b.wav'), 5)
+
+        stats = service.get_stats(root)
+        assert (stats.size, stats.file_count, stats.settled) == (15, 2, False)
+        assert os.path.join(root, 'done') in service._nodes
+        assert os.path.join(root, 'copying') not in service._nodes
+
+        # 复制中的文件继续增长
+        _write(os.path.join(root, 'copying', 'b.wav'), 50)
+        assert service.get_stats(root).size == 60
+
+        _age(root)
+        assert service.get_stats(root).settled
@@ -0,0 +1,44 @@
+"""
+文件夹监视器测试
+"""
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.watcher import FolderWatcher
+
+
+@pytest.mark.asyncio
+async def test_periodic_scan_skips_unchanged_files(tmp_path):
+    """定期扫描时未变化的非压缩包文件只检查一次，文件变化后重新检查"""
+    (tmp_path / "sub").mkdir()
+    readme = tmp_path / "sub" / "readme.txt"
+    readme.write_text("a")
+    archive = tmp_path / "RJ123456.zip"
+    archive.write_bytes(b"PK")
+
+    watcher = FolderWatcher()
+    watcher.config = Mock()
+    watcher.config.storage.input_path = str(tmp_path)
+    watcher.handler = Mock()
+    watcher.handler._is_archive.side_effect = lambda path: path.endswith(".zip")
+
+    with patch.object(watcher, '_on_archive_detected') as detected:
+        await watcher._scan_folder()
+        detected.assert_called_once_with(str(archive))
+        assert watcher.handler._is_archive.call_count == 2
+
+        # 压缩包正在处理中，readme 未变化：都不再检查
+        watcher.pending_files.add(str(archive))
+        await watcher._scan_folder()
+        assert watcher.handler._is_archive.call_count == 2
+
+        readme.write_text("changed")
+        os.utime(readme, ns=(0, 0))
+        await watcher._scan_folder()
+        assert watcher.handler._is_archive.call_count == 3
+
+    readme.unlink()
+    await watcher._scan_folder()
+    assert str(readme) not in watcher._seen_files
@@ -0,0 +1,87 @@
+// 服务端事件推送（SSE，/api/events）
+// 所有页面共用一个连接；断线时 EventSource 自动重连并通过 Last-Event-ID 从断点继续，
+// 连接断开期间订阅方可以提供 fallback 回退为低频轮询
+
+const EVENTS_URL = '/api/events'
+
+const subscribers = new Set()
+let source = null
+let connected = false
+
+function dispatch(event) {
+  subscribers.forEach(sub => {
+    if (event.type === 'reset' || sub.types.includes(event.type)) {
+      try {
+        sub.handler(event)
+      } catch (error) {
+        console.error('[Events] 处理事件失败:', error)
+      }
+    }
+  })
+}
+
+function connect() {
+  if (source) return
+  source = new EventSource(EVENTS_URL)
+  source.addEventListener('hello', () => {
+    connected = true
+  })
+  source.onmessage = (message) => {
+    connected = true
+    try {
+      dispatch(JSON.parse(message.data))
+    } catch (error) {
+      console.error('[Events] 解析事件失败:', error)
+    }
+  }
+  source.onerror = () => {
+    // EventSource 会自动重连
+    connected = false
+  }
+}
+
+function disconnect() {
+  if (source) {
+    source.close()
+    source = null
+  }
+  connected = false
+}
+
+export function isEventStreamConnected() {
+  return connected
+}
+
+/**
+ * 订阅服务端事件
+ * @param {string[]} types 事件类型：task / conflict / watcher（reset 总会收到）
+ * @param {Function} handler 事件处理函数，参数为 { seq, type, data }
+ * @param {Object} options fallback: 连接断开期间定期调用的函数；fallbackInterval: 调用间隔（毫秒）
+ * @returns {Function} 取消订阅
+ */
+export function onServerEvents(types, handler, { fallback = null, fallbackInterval = 10000 } = {}) {
+  const sub = { types, handler }
+  subscribers.add(sub)
+  connect()
+
+  const timer = fallback
+    ? setInterval(() => {
+        if (!connected) fallback()
+      }, fallbackInterval)
+    : null
+
+  return () => {
+    subscribers.delete(sub)
+    if (timer) clearInterval(timer)
+    if (subscribers.size === 0) disconnect()
+  }
+}
+
+// 合并短时间内的多次调用（事件密集时只刷新一次）
+export function debounce(fn, wait = 300) {
+  let timeout = null
+  return (...args) => {
+    clearTimeout(timeout)
+    timeout = setTimeout(() => fn(...args), wait)
+  }
+}
@@ -138,9 +138,17 @@ export const passwordApi = {
 }
 
 export const logApi = {
-  get: async (lines = 100) => {
-    const response = await apiClient.get('/logs', { params: { lines } })
+  // level: 逗号分隔的日志级别；rjcode: 只返回包含该 RJ 号的日志
+  get: async (lines = 100, { level, rjcode } = {}) => {
+    const response = await apiClient.get('/logs', { params: { lines, level, rjcode } })
     return response.data
+  },
+  // 跟踪日志（SSE），从 offset 处继续推送新写入的行
+  stream: (offset, { level, rjcode } = {}) => {
+    const params = new URLSearchParams({ offset })
+    if (level) params.set('level', level)
+    if (rjcode) params.set('rjcode', rjcode)
+    return new EventSource(`${API_BASE}/logs/stream?${params}`)
   }
 }
 
@@ -32,6 +32,16 @@ export const useTaskStore = defineStore('tasks', {
       }
     },
 
+    // 用推送的任务数据更新列表中的任务；任务不在列表中或状态筛选结果变化时返回 false（需要重新拉取）
+    applyTaskEvent(data, status = null) {
+      const task = this.tasks.find(t => t.id === data.id)
+      if (!task) return false
+      const matches = (s) => !status || s === status || (status === 'completed' && s === 'failed')
+      if (!matches(data.status)) return false
+      Object.assign(task, data)
+      return true
+    },
+
     async createTask(sourcePath, taskType = 'auto_process', autoClassify = true) {
       try {
         return await taskApi.create(sourcePath, taskType, autoClassify)